@@ -0,0 +1,447 @@
+import base64
+import functools
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    '''Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога'''
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    '''Учёт прочитанных или записанных строк для структурного лога'''
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    '''Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile'''
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    '''Конец вызова: заголовки Server-Timing и одна JSON-строка лога'''
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    '''Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+_pool = None
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}
+
+def _is_alive(conn) -> bool:
+    '''Проверка, что соединение из пула не разорвано сервером'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    '''Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются'''
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection():
+    '''Соединение из пула, который переживает тёплые вызовы функции; при занятом пуле вызов ждёт до DB_POOL_TIMEOUT'''
+    global _pool
+    with phase('connect'):
+        if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            if _pool is None or _pool.closed:
+                _pool = ThreadedConnectionPool(0, DB_POOL_MAX, os.environ['DATABASE_URL'])
+            conn = _pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                _pool.putconn(conn, close=True)
+                conn = _pool.getconn()
+        except Exception:
+            _slots.release()
+            raise
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    '''Возврат соединения в пул; закрытые и сломанные соединения выбрасываются'''
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    _pool.putconn(conn, close=broken)
+    _slots.release()
+
+ROLLUP_REFRESH_INTERVAL = float(os.environ.get('ROLLUP_REFRESH_INTERVAL', '60'))
+# Изменения моложе этого порога ещё могут дописываться незакоммиченными транзакциями
+ROLLUP_SAFETY_LAG = int(os.environ.get('ROLLUP_SAFETY_LAG', '5'))
+BUCKETS = ('day', 'week', 'month')
+DEFAULT_STATUSES = ['pending', 'confirmed', 'processing', 'shipped', 'delivered']
+TOP_PRODUCTS_LIMIT = 10
+ADMIN_CACHE_CONTROL = 'private, no-cache'
+
+_last_refresh_check = 0.0
+
+def refresh_rollups(conn) -> int:
+    '''Пересчёт агрегатов только за дни, в которые создавались или менялись заказы с прошлого обновления'''
+    cur = conn.cursor()
+    try:
+        # FOR UPDATE не даёт двум экземплярам пересчитывать одно и то же одновременно
+        cur.execute("SELECT refreshed_until FROM rollup_state WHERE name = 'sales' FOR UPDATE")
+        refreshed_until = cur.fetchone()[0]
+        cur.execute("SELECT LOCALTIMESTAMP - %s * INTERVAL '1 second'", (ROLLUP_SAFETY_LAG,))
+        new_mark = cur.fetchone()[0]
+        
+        cur.execute(
+            '''
+            SELECT DISTINCT created_at::date
+            FROM orders
+            WHERE updated_at >= %s AND updated_at < %s
+            ''',
+            (refreshed_until, new_mark)
+        )
+        days = [row[0] for row in cur.fetchall()]
+        record_rows(len(days))
+        
+        if days:
+            cur.execute('DELETE FROM sales_daily WHERE day = ANY(%s)', (days,))
+            cur.execute(
+                '''
+                INSERT INTO sales_daily (day, status, orders_count, revenue)
+                SELECT created_at::date, COALESCE(status, 'pending'), COUNT(*), SUM(total)
+                FROM orders
+                WHERE created_at >= %s AND created_at < %s::date + 1 AND created_at::date = ANY(%s)
+                GROUP BY 1, 2
+                ''',
+                (min(days), max(days), days)
+            )
+            
+            cur.execute('DELETE FROM product_sales_daily WHERE day = ANY(%s)', (days,))
+            cur.execute(
+                '''
+                INSERT INTO product_sales_daily (day, status, product_id, product_name, quantity, revenue)
+                SELECT
+                    o.created_at::date,
+                    COALESCE(o.status, 'pending'),
+                    (item->>'id')::integer,
+                    MAX(item->>'name'),
+                    SUM((item->>'quantity')::integer),
+                    SUM((item->>'price')::numeric * (item->>'quantity')::integer)
+                FROM orders o, jsonb_array_elements(o.items) AS item
+                WHERE o.created_at >= %s AND o.created_at < %s::date + 1 AND o.created_at::date = ANY(%s)
+                    AND jsonb_typeof(item->'id') = 'number'
+                GROUP BY 1, 2, 3
+                ''',
+                (min(days), max(days), days)
+            )
+        
+        cur.execute("UPDATE rollup_state SET refreshed_until = %s WHERE name = 'sales'", (new_mark,))
+        conn.commit()
+        return len(days)
+    finally:
+        cur.close()
+
+def maybe_refresh_rollups(conn):
+    '''Ленивое обновление агрегатов перед чтением, не чаще раза в ROLLUP_REFRESH_INTERVAL на экземпляр'''
+    global _last_refresh_check
+    if time.monotonic() - _last_refresh_check < ROLLUP_REFRESH_INTERVAL:
+        return
+    refresh_rollups(conn)
+    _last_refresh_check = time.monotonic()
+
+def parse_params(params: dict) -> dict:
+    '''Период, шаг и статусы отчёта из параметров запроса'''
+    bucket = params.get('bucket') or 'day'
+    if bucket not in BUCKETS:
+        raise ValueError(f'Invalid bucket. Allowed: {", ".join(BUCKETS)}')
+    try:
+        date_from = date.fromisoformat(params['dateFrom']) if params.get('dateFrom') else date.min
+        date_to = date.fromisoformat(params['dateTo']) if params.get('dateTo') else date.max
+    except ValueError:
+        raise ValueError('Invalid dateFrom or dateTo, expected YYYY-MM-DD')
+    statuses = params['status'].split(',') if params.get('status') else DEFAULT_STATUSES
+    return {'bucket': bucket, 'date_from': date_from, 'date_to': date_to, 'statuses': statuses}
+
+def build_report(cur, report: dict) -> dict:
+    '''Выручка и число заказов по периодам, разбивка по статусам и топ товаров из агрегатов'''
+    period = (report['date_from'], report['date_to'])
+    
+    cur.execute(
+        '''
+        SELECT date_trunc(%s, day)::date AS bucket, SUM(orders_count) AS orders, SUM(revenue) AS revenue
+        FROM sales_daily
+        WHERE day >= %s AND day <= %s AND status = ANY(%s)
+        GROUP BY 1
+        ORDER BY 1
+        ''',
+        (report['bucket'], *period, report['statuses'])
+    )
+    revenue = [
+        {'bucket': row['bucket'].isoformat(), 'orders': int(row['orders']), 'revenue': float(row['revenue'])}
+        for row in cur.fetchall()
+    ]
+    
+    cur.execute(
+        '''
+        SELECT status, SUM(orders_count) AS orders, SUM(revenue) AS revenue
+        FROM sales_daily
+        WHERE day >= %s AND day <= %s
+        GROUP BY status
+        ORDER BY status
+        ''',
+        period
+    )
+    by_status = [
+        {'status': row['status'], 'orders': int(row['orders']), 'revenue': float(row['revenue'])}
+        for row in cur.fetchall()
+    ]
+    
+    cur.execute(
+        '''
+        SELECT product_id, MAX(product_name) AS name, SUM(quantity) AS quantity, SUM(revenue) AS revenue
+        FROM product_sales_daily
+        WHERE day >= %s AND day <= %s AND status = ANY(%s)
+        GROUP BY product_id
+        ORDER BY revenue DESC
+        LIMIT %s
+        ''',
+        (*period, report['statuses'], TOP_PRODUCTS_LIMIT)
+    )
+    top_products = [
+        {'productId': row['product_id'], 'name': row['name'], 'quantity': int(row['quantity']), 'revenue': float(row['revenue'])}
+        for row in cur.fetchall()
+    ]
+    
+    return {
+        'bucket': report['bucket'],
+        'revenue': revenue,
+        'byStatus': by_status,
+        'topProducts': top_products
+    }
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+COMPRESS_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+def get_header(event: dict, name: str):
+    '''Заголовок запроса без учёта регистра имени'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def choose_encoding(event: dict):
+    '''Лучшее сжатие из Accept-Encoding клиента: brotli, если модуль установлен, иначе gzip'''
+    accepted = {}
+    for part in (get_header(event, 'Accept-Encoding') or '').lower().split(','):
+        token, _, weight = part.strip().partition(';')
+        try:
+            accepted[token.strip()] = float(weight.strip()[2:]) if weight.strip().startswith('q=') else 1.0
+        except ValueError:
+            accepted[token.strip()] = 0.0
+    for encoding in COMPRESS_ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress_response(event: dict, response: dict, memo: dict = None) -> dict:
+    '''Сжатие тела ответа gzip/brotli в base64; маленькие тела отдаются как есть'''
+    headers = {**response['headers'], 'Vary': 'Accept-Encoding'}
+    body = response['body']
+    encoding = choose_encoding(event) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding is None:
+        return {**response, 'headers': headers}
+    
+    if memo is not None and encoding in memo:
+        encoded = memo[encoding]
+    else:
+        with phase('compress'):
+            data = body.encode()
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+            encoded = base64.b64encode(compressed).decode()
+        if memo is not None:
+            memo[encoding] = encoded
+    
+    headers['Content-Encoding'] = encoding
+    if 'ETag' in headers:
+        # У сжатого представления свой ETag; etag_matches снимает суффикс при сравнении
+        headers['ETag'] = headers['ETag'][:-1] + f'-{encoding}"'
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+@instrumented('analytics')
+def handler(event: dict, context) -> dict:
+    '''API аналитики продаж: выручка по периодам, разбивка по статусам и топ товаров (POST пересчитывает агрегаты)'''
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    params = event.get('queryStringParameters') or {}
+    
+    try:
+        report = parse_params(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        
+        if method == 'POST':
+            # Вызов по расписанию: принудительный пересчёт агрегатов
+            with phase('refresh'):
+                result = {'refreshedDays': refresh_rollups(conn)}
+        else:
+            with phase('refresh'):
+                maybe_refresh_rollups(conn)
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                with phase('query'):
+                    result = build_report(cur, report)
+            finally:
+                cur.close()
+        
+        with phase('json'):
+            response_body = json.dumps(result)
+        return compress_response(event, {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Cache-Control': ADMIN_CACHE_CONTROL,
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': response_body,
+            'isBase64Encoded': False
+        })
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            release_db_connection(conn)
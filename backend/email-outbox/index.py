@@ -0,0 +1,324 @@
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    '''Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога'''
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    '''Учёт прочитанных или записанных строк для структурного лога'''
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    '''Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile'''
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    '''Конец вызова: заголовки Server-Timing и одна JSON-строка лога'''
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    '''Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+_pool = None
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}
+
+def _is_alive(conn) -> bool:
+    '''Проверка, что соединение из пула не разорвано сервером'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    '''Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются'''
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection():
+    '''Соединение из пула, который переживает тёплые вызовы функции; при занятом пуле вызов ждёт до DB_POOL_TIMEOUT'''
+    global _pool
+    with phase('connect'):
+        if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            if _pool is None or _pool.closed:
+                _pool = ThreadedConnectionPool(0, DB_POOL_MAX, os.environ['DATABASE_URL'])
+            conn = _pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                _pool.putconn(conn, close=True)
+                conn = _pool.getconn()
+        except Exception:
+            _slots.release()
+            raise
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    '''Возврат соединения в пул; закрытые и сломанные соединения выбрасываются'''
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    _pool.putconn(conn, close=broken)
+    _slots.release()
+
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '50'))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+RETRY_BASE_DELAY = int(os.environ.get('OUTBOX_RETRY_BASE_DELAY', '30'))
+RETRY_MAX_DELAY = int(os.environ.get('OUTBOX_RETRY_MAX_DELAY', '3600'))
+DRAIN_TIME_LIMIT = float(os.environ.get('OUTBOX_DRAIN_TIME_LIMIT', '20'))
+
+def open_smtp():
+    '''Одно SMTP-соединение на всю пачку писем'''
+    import smtplib
+    
+    smtp_host = os.environ.get('SMTP_HOST')
+    smtp_port = int(os.environ.get('SMTP_PORT', '587'))
+    smtp_user = os.environ.get('SMTP_USER')
+    smtp_password = os.environ.get('SMTP_PASSWORD')
+    
+    server = smtplib.SMTP(smtp_host, smtp_port, timeout=30)
+    # Локальные заглушки вроде aiosmtpd работают без TLS и авторизации
+    if os.environ.get('SMTP_STARTTLS', 'true') != 'false':
+        server.starttls()
+    if smtp_user:
+        server.login(smtp_user, smtp_password)
+    return server
+
+def build_message(email: dict):
+    '''Письмо из строки email_outbox'''
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    
+    msg = MIMEMultipart()
+    msg['From'] = os.environ.get('SMTP_USER') or 'noreply@localhost'
+    msg['To'] = email['recipient']
+    msg['Subject'] = email['subject']
+    msg.attach(MIMEText(email['body'], 'plain', 'utf-8'))
+    return msg
+
+def retry_delay(attempts: int) -> int:
+    '''Экспоненциальная задержка перед следующей попыткой, в секундах'''
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+def mark_failed(cur, email: dict, error: str) -> str:
+    '''Перенос письма на следующую попытку или окончательная пометка failed'''
+    attempts = email['attempts'] + 1
+    status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+    cur.execute(
+        '''
+        UPDATE email_outbox SET
+            status = %s,
+            attempts = %s,
+            last_error = %s,
+            next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+        WHERE id = %s
+        ''',
+        (status, attempts, error[:1000], retry_delay(attempts), email['id'])
+    )
+    return status
+
+def drain_batch(conn) -> dict:
+    '''Отправка одной пачки писем; строки заблокированы до коммита, параллельные запуски их пропускают'''
+    stats = {'sent': 0, 'retried': 0, 'failed': 0}
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        with phase('query'):
+            cur.execute(
+                '''
+                SELECT id, recipient, subject, body, attempts
+                FROM email_outbox
+                WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                ''',
+                (BATCH_SIZE,)
+            )
+            emails = cur.fetchall()
+        record_rows(len(emails))
+        if not emails:
+            return stats
+        
+        # smtplib и email.mime грузятся только при непустой очереди: большинство запусков по расписанию её не застают
+        import smtplib
+        
+        server = None
+        try:
+            for index, email in enumerate(emails):
+                if server is None:
+                    try:
+                        with phase('smtp'):
+                            server = open_smtp()
+                    except (smtplib.SMTPException, OSError) as e:
+                        # Сервер недоступен: переносим весь остаток пачки, не переподключаясь на каждое письмо
+                        for pending in emails[index:]:
+                            stats['failed' if mark_failed(cur, pending, str(e)) == 'failed' else 'retried'] += 1
+                        break
+                try:
+                    with phase('smtp'):
+                        server.send_message(build_message(email))
+                except (smtplib.SMTPException, OSError) as e:
+                    if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                        server = None
+                    stats['failed' if mark_failed(cur, email, str(e)) == 'failed' else 'retried'] += 1
+                    continue
+                cur.execute(
+                    "UPDATE email_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, attempts = attempts + 1 WHERE id = %s",
+                    (email['id'],)
+                )
+                stats['sent'] += 1
+        finally:
+            if server is not None:
+                try:
+                    server.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+        
+        with phase('query'):
+            conn.commit()
+        stats['batch'] = len(emails)
+        return stats
+    finally:
+        cur.close()
+
+@instrumented('email-outbox')
+def handler(event: dict, context) -> dict:
+    '''Фоновая отправка писем из email_outbox пачками (запускается по расписанию)'''
+    method = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+        started = time.monotonic()
+        
+        while time.monotonic() - started < DRAIN_TIME_LIMIT:
+            stats = drain_batch(conn)
+            for key in totals:
+                totals[key] += stats[key]
+            if stats.get('batch', 0) < BATCH_SIZE or stats['sent'] == 0:
+                break
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(totals),
+            'isBase64Encoded': False
+        }
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            release_db_connection(conn)
@@ -1,23 +1,511 @@
+import base64
+import functools
+import gzip
+import hashlib
+import io
 import json
 import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    '''Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога'''
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    '''Учёт прочитанных или записанных строк для структурного лога'''
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    '''Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile'''
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    '''Конец вызова: заголовки Server-Timing и одна JSON-строка лога'''
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    '''Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '5'))
+LSN_PATTERN = re.compile(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$')
+# Реплика, догнавшая приёмник WAL, не отстаёт, даже если последняя транзакция была давно
+REPLICA_STATUS_SQL = '''
+    SELECT
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+             ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END,
+        pg_last_wal_replay_lsn() >= %s::pg_lsn
+'''
+
+_pools = {}
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = {target: threading.BoundedSemaphore(DB_POOL_MAX) for target in ('primary', 'replica')}
+_owners = {}
+_last_used = {}
+_replica = {'checked_at': 0.0, 'healthy': True}
+
+def _is_alive(conn) -> bool:
+    '''Проверка, что соединение из пула не разорвано сервером'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    '''Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются'''
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection(target: str = 'primary'):
+    '''Соединение из пула, который переживает тёплые вызовы функции; target='replica' — пул DATABASE_REPLICA_URL.
+    При занятом пуле вызов ждёт свободное соединение до DB_POOL_TIMEOUT'''
+    with phase('connect'):
+        slots = _slots[target]
+        if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free {target} database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            pool = _pools.get(target)
+            if pool is None or pool.closed:
+                url = DATABASE_REPLICA_URL if target == 'replica' else os.environ['DATABASE_URL']
+                pool = _pools[target] = ThreadedConnectionPool(0, DB_POOL_MAX, url)
+            conn = pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            slots.release()
+            raise
+        _owners[id(conn)] = (pool, slots)
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    '''Возврат соединения в его пул; закрытые и сломанные соединения выбрасываются'''
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    pool, slots = _owners.pop(id(conn))
+    pool.putconn(conn, close=broken)
+    slots.release()
+
+def get_read_connection(event: dict):
+    '''Соединение для чтения: реплика, если она доступна, отстаёт не больше REPLICA_MAX_LAG секунд
+    и уже применила запись клиента из X-Min-Lsn; иначе основная база'''
+    if not DATABASE_REPLICA_URL:
+        return get_db_connection()
+    min_lsn = get_header(event, 'X-Min-Lsn')
+    if min_lsn and not LSN_PATTERN.match(min_lsn):
+        min_lsn = None
+    now = time.monotonic()
+    stale = now - _replica['checked_at'] > REPLICA_CHECK_INTERVAL
+    if not _replica['healthy'] and not stale:
+        return get_db_connection()
+    
+    try:
+        conn = get_db_connection('replica')
+    except psycopg2.OperationalError:
+        _replica.update(checked_at=now, healthy=False)
+        return get_db_connection()
+    except PoolError:
+        # Все соединения реплики заняты: реплика исправна, чтение уходит на основную базу
+        return get_db_connection()
+    
+    if stale or min_lsn:
+        try:
+            with phase('replica'), conn.cursor() as cur:
+                cur.execute(REPLICA_STATUS_SQL, (min_lsn or '0/0',))
+                lag, caught_up = cur.fetchone()
+            conn.rollback()
+        except psycopg2.Error:
+            release_db_connection(conn, broken=True)
+            _replica.update(checked_at=now, healthy=False)
+            return get_db_connection()
+        if stale:
+            _replica.update(checked_at=now, healthy=lag <= REPLICA_MAX_LAG)
+        if not _replica['healthy'] or (min_lsn and not caught_up):
+            release_db_connection(conn)
+            return get_db_connection()
+    return conn
+
+CUSTOMERS_SELECT = '''
+    SELECT 
+        id,
+        last_name,
+        first_name,
+        middle_name,
+        phone,
+        city,
+        address,
+        total_orders,
+        total_spent,
+        created_at,
+        updated_at
+    FROM customers
+'''
+
+# python — строки собираются в словари и сериализуются json.dumps;
+# postgres — полный список и NDJSON-выгрузку собирает сама база, handler отдаёт готовый текст
+JSON_SERIALIZATION = os.environ.get('JSON_SERIALIZATION', 'postgres')
+# Те же поля, что в serialize_customer; время в JSON Postgres пишет в ISO 8601, как isoformat()
+CUSTOMERS_JSON_SELECT = '''
+    SELECT
+        id AS "id",
+        last_name AS "lastName",
+        first_name AS "firstName",
+        middle_name AS "middleName",
+        phone AS "phone",
+        city AS "city",
+        address AS "address",
+        total_orders AS "totalOrders",
+        total_spent::float8 AS "totalSpent",
+        created_at AS "createdAt",
+        updated_at AS "updatedAt"
+    FROM customers
+'''
+CUSTOMERS_JSON_ARRAY = f'''
+    SELECT COALESCE(json_agg(c ORDER BY "updatedAt" DESC), '[]')::text AS body, count(*) AS rows_count
+    FROM ({CUSTOMERS_JSON_SELECT}) c
+'''
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
+EXPORT_CSV_FIELDS = (
+    'id', 'lastName', 'firstName', 'middleName', 'phone', 'city', 'address',
+    'totalOrders', 'totalSpent', 'createdAt', 'updatedAt'
+)
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+# Строк в одном ответе выгрузки: тело и память функции ограничены при любом объёме, дальше — по X-Next-Cursor
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '10000'))
+
+PAGINATION_PARAMS = ('q', 'city', 'limit', 'cursor')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+def encode_cursor(customer: dict) -> str:
+    '''Курсор на позицию клиента в выдаче (updated_at, id)'''
+    raw = json.dumps([customer['updated_at'].isoformat(), customer['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    '''Разбор курсора из nextCursor предыдущей страницы'''
+    try:
+        updated_at, customer_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(customer_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def like_pattern(value: str) -> str:
+    '''Шаблон ILIKE для поиска подстроки с экранированием спецсимволов'''
+    return '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def build_customers_filters(params: dict) -> tuple:
+    '''Условия WHERE по поиску q (ФИО, телефон, город) и фильтру city'''
+    conditions = []
+    sql_params = []
+    
+    query = (params.get('q') or '').strip()
+    if query:
+        pattern = like_pattern(query)
+        search = ['last_name ILIKE %s', 'first_name ILIKE %s', 'city ILIKE %s']
+        search_params = [pattern, pattern, pattern]
+        digits = re.sub(r'\D', '', query)
+        if digits:
+            # Совпадает с выражением индекса idx_customers_phone_digits_trgm
+            search.append("regexp_replace(phone, '\\D', '', 'g') LIKE %s")
+            search_params.append('%' + digits + '%')
+        conditions.append('(' + ' OR '.join(search) + ')')
+        sql_params.extend(search_params)
+    
+    if params.get('city'):
+        conditions.append('city = %s')
+        sql_params.append(params['city'])
+    
+    return conditions, sql_params
+
+def build_customers_query(params: dict) -> tuple:
+    '''SQL для страницы клиентов с поиском и keyset-пагинацией по (updated_at, id)'''
+    try:
+        limit = int(params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    
+    conditions, sql_params = build_customers_filters(params)
+    
+    if params.get('cursor'):
+        updated_at, customer_id = decode_cursor(params['cursor'])
+        conditions.append('(updated_at, id) < (%s, %s)')
+        sql_params.extend([updated_at, customer_id])
+    
+    sql = CUSTOMERS_SELECT
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY updated_at DESC, id DESC LIMIT %s'
+    sql_params.append(limit + 1)
+    
+    return sql, sql_params, limit
+
+def decode_export_cursor(cursor: str) -> int:
+    '''Разбор курсора выгрузки из X-Next-Cursor: id последнего выгруженного клиента'''
+    try:
+        return int(cursor)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+def build_export_query(params: dict) -> tuple:
+    '''SQL для куска выгрузки клиентов под фильтрами списка: EXPORT_CHUNK_ROWS строк после курсора.
+    Выгрузка идёт по id, а не по updated_at: новый заказ клиента не переставит его между кусками'''
+    if params['export'] not in EXPORT_FORMATS:
+        raise ValueError(f'Invalid export format. Allowed: {", ".join(EXPORT_FORMATS)}')
+    conditions, sql_params = build_customers_filters(params)
+    if params.get('cursor'):
+        conditions.append('id > %s')
+        sql_params.append(decode_export_cursor(params['cursor']))
+    
+    as_json = params['export'] == 'ndjson' and JSON_SERIALIZATION == 'postgres'
+    sql = CUSTOMERS_JSON_SELECT if as_json else CUSTOMERS_SELECT
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY id LIMIT %s'
+    sql_params.append(EXPORT_CHUNK_ROWS + 1)
+    if as_json:
+        # Каждая строка выгрузки — готовый JSON-объект из базы; id — для курсора следующего куска
+        sql = f'SELECT row_to_json(c)::text AS line, c.id FROM ({sql}) c'
+    return sql, sql_params, EXPORT_CHUNK_ROWS
+
+def serialize_customer(customer: dict) -> dict:
+    '''Клиент в формате ответа API'''
+    return {
+        'id': customer['id'],
+        'lastName': customer['last_name'],
+        'firstName': customer['first_name'],
+        'middleName': customer['middle_name'],
+        'phone': customer['phone'],
+        'city': customer['city'],
+        'address': customer['address'],
+        'totalOrders': customer['total_orders'],
+        'totalSpent': float(customer['total_spent']),
+        'createdAt': customer['created_at'].isoformat(),
+        'updatedAt': customer['updated_at'].isoformat()
+    }
+
+def export_chunk(conn, sql: str, sql_params: list, export_format: str, limit: int, header: bool = True) -> tuple:
+    '''Кусок выгрузки не больше limit строк через серверный курсор и курсор следующего куска (None — выгрузка закончена).
+    В памяти Python — тело куска и не больше EXPORT_ITERSIZE прочитанных строк, сколько бы клиентов ни подходило'''
+    import csv
+    
+    cur = conn.cursor(name='customers_export', cursor_factory=RealDictCursor)
+    cur.itersize = EXPORT_ITERSIZE
+    try:
+        cur.execute(sql, sql_params)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv' and header:
+            writer.writerow(EXPORT_CSV_FIELDS)
+        
+        last_id = None
+        next_cursor = None
+        for rows, customer in enumerate(cur, start=1):
+            if rows > limit:
+                next_cursor = str(last_id)
+                break
+            if 'line' in customer:
+                buffer.write(customer['line'])
+                buffer.write('\n')
+            elif export_format == 'csv':
+                item = serialize_customer(customer)
+                writer.writerow([item[field] for field in EXPORT_CSV_FIELDS])
+            else:
+                buffer.write(json.dumps(serialize_customer(customer), ensure_ascii=False))
+                buffer.write('\n')
+            last_id = customer['id']
+        
+        record_rows(min(cur.rownumber, limit))
+        return buffer.getvalue(), next_cursor
+    finally:
+        cur.close()
+
+# Админские списки: кэшировать только в браузере и всегда перепроверять по ETag
+ADMIN_CACHE_CONTROL = 'private, no-cache'
+
+def get_header(event: dict, name: str):
+    '''Заголовок запроса без учёта регистра имени'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def etag_matches(event: dict, etag: str) -> bool:
+    '''Проверка If-None-Match против текущего ETag (слабое сравнение)'''
+    if_none_match = get_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Сжатые представления отличаются от исходного только суффиксом -br/-gzip
+    tags = [re.sub(r'-(br|gzip)"$', '"', tag.strip().removeprefix('W/')) for tag in if_none_match.split(',')]
+    return etag.removeprefix('W/') in tags
+
+def body_etag(body: str) -> str:
+    '''ETag по хэшу сериализованного ответа'''
+    return '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+COMPRESS_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+def choose_encoding(event: dict):
+    '''Лучшее сжатие из Accept-Encoding клиента: brotli, если модуль установлен, иначе gzip'''
+    accepted = {}
+    for part in (get_header(event, 'Accept-Encoding') or '').lower().split(','):
+        token, _, weight = part.strip().partition(';')
+        try:
+            accepted[token.strip()] = float(weight.strip()[2:]) if weight.strip().startswith('q=') else 1.0
+        except ValueError:
+            accepted[token.strip()] = 0.0
+    for encoding in COMPRESS_ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress_response(event: dict, response: dict, memo: dict = None) -> dict:
+    '''Сжатие тела ответа gzip/brotli в base64; маленькие тела отдаются как есть'''
+    headers = {**response['headers'], 'Vary': 'Accept-Encoding'}
+    body = response['body']
+    encoding = choose_encoding(event) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding is None:
+        return {**response, 'headers': headers}
+    
+    if memo is not None and encoding in memo:
+        encoded = memo[encoding]
+    else:
+        with phase('compress'):
+            data = body.encode()
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+            encoded = base64.b64encode(compressed).decode()
+        if memo is not None:
+            memo[encoding] = encoded
+    
+    headers['Content-Encoding'] = encoding
+    if 'ETag' in headers:
+        # У сжатого представления свой ETag; etag_matches снимает суффикс при сравнении
+        headers['ETag'] = headers['ETag'][:-1] + f'-{encoding}"'
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+@instrumented('get-customers')
 def handler(event: dict, context) -> dict:
-    '''API для получения списка всех клиентов из базы данных'''
+    '''API для получения списка клиентов: целиком, постранично с поиском (q, city, limit, cursor) или выгрузкой кусками (export=ndjson|csv, продолжение — cursor из X-Next-Cursor)'''
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
+        return compress_response(event, {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Min-Lsn'
             },
             'body': '',
             'isBase64Encoded': False
-        }
+        })
     
     if method != 'GET':
         return {
@@ -30,58 +518,113 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
     
+    params = event.get('queryStringParameters') or {}
+    export_format = params.get('export')
+    paginated = any(params.get(key) for key in PAGINATION_PARAMS)
+    
+    try:
+        if export_format:
+            query = build_export_query(params)
+        else:
+            query = build_customers_query(params) if paginated else None
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
     conn = None
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_read_connection(event)
         cur = conn.cursor(cursor_factory=RealDictCursor)
+        response_body = None
         
-        cur.execute(
-            '''
-            SELECT 
-                id,
-                last_name,
-                first_name,
-                middle_name,
-                phone,
-                city,
-                address,
-                total_orders,
-                total_spent,
-                created_at,
-                updated_at
-            FROM customers
-            ORDER BY updated_at DESC
-            '''
-        )
+        if export_format:
+            # Выгрузка отдаётся кусками: следующий кусок — тот же запрос с cursor из X-Next-Cursor
+            sql, sql_params, limit = query
+            with phase('export'):
+                export_body, next_cursor = export_chunk(conn, sql, sql_params, export_format, limit, header=not params.get('cursor'))
+            headers = {
+                'Content-Type': EXPORT_FORMATS[export_format],
+                'Content-Disposition': f'attachment; filename="customers.{export_format}"',
+                'Cache-Control': ADMIN_CACHE_CONTROL,
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'X-Next-Cursor'
+            }
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+            return compress_response(event, {
+                'statusCode': 200,
+                'headers': headers,
+                'body': export_body,
+                'isBase64Encoded': False
+            })
         
-        customers = cur.fetchall()
+        if not paginated and JSON_SERIALIZATION == 'postgres':
+            # Массив JSON собирает база: строки клиентов не превращаются в объекты Python
+            with phase('query'):
+                cur.execute(CUSTOMERS_JSON_ARRAY)
+                row = cur.fetchone()
+            record_rows(row['rows_count'])
+            response_body = row['body']
+        elif not paginated:
+            with phase('query'):
+                cur.execute(CUSTOMERS_SELECT + ' ORDER BY updated_at DESC')
+                customers = cur.fetchall()
+            record_rows(len(customers))
+            with phase('serialize'):
+                result = [serialize_customer(customer) for customer in customers]
+        else:
+            sql, sql_params, limit = query
+            with phase('query'):
+                cur.execute(sql, sql_params)
+                customers = cur.fetchall()
+            record_rows(len(customers))
+            
+            next_cursor = None
+            if len(customers) > limit:
+                customers = customers[:limit]
+                next_cursor = encode_cursor(customers[-1])
+            with phase('serialize'):
+                serialized = [serialize_customer(customer) for customer in customers]
+            
+            result = {
+                'customers': serialized,
+                'nextCursor': next_cursor
+            }
         
-        result = []
-        for customer in customers:
-            result.append({
-                'id': customer['id'],
-                'lastName': customer['last_name'],
-                'firstName': customer['first_name'],
-                'middleName': customer['middle_name'],
-                'phone': customer['phone'],
-                'city': customer['city'],
-                'address': customer['address'],
-                'totalOrders': customer['total_orders'],
-                'totalSpent': float(customer['total_spent']),
-                'createdAt': customer['created_at'].isoformat(),
-                'updatedAt': customer['updated_at'].isoformat()
-            })
+        if response_body is None:
+            with phase('json'):
+                response_body = json.dumps(result)
+        etag = body_etag(response_body)
+        if etag_matches(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': {
+                    'ETag': etag,
+                    'Cache-Control': ADMIN_CACHE_CONTROL,
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': '',
+                'isBase64Encoded': False
+            }
         
-        return {
+        return compress_response(event, {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
+                'ETag': etag,
+                'Cache-Control': ADMIN_CACHE_CONTROL,
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps(result),
+            'body': response_body,
             'isBase64Encoded': False
-        }
+        })
         
     except Exception as e:
         return {
@@ -96,4 +639,4 @@ def handler(event: dict, context) -> dict:
     finally:
         if conn:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
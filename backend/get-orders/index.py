@@ -1,23 +1,776 @@
+import base64
+import functools
+import gzip
+import hashlib
+import io
 import json
 import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    '''Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога'''
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    '''Учёт прочитанных или записанных строк для структурного лога'''
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    '''Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile'''
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    '''Конец вызова: заголовки Server-Timing и одна JSON-строка лога'''
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    '''Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+def instrumented_async(name: str):
+    '''То же для async handler; без cProfile: профилировщик один на поток, а вызовы в цикле событий идут вперемешку'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=False)
+            response = None
+            try:
+                response = await handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '5'))
+LSN_PATTERN = re.compile(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$')
+# Реплика, догнавшая приёмник WAL, не отстаёт, даже если последняя транзакция была давно
+REPLICA_STATUS_SQL = '''
+    SELECT
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+             ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END,
+        pg_last_wal_replay_lsn() >= %s::pg_lsn
+'''
+
+_pools = {}
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = {target: threading.BoundedSemaphore(DB_POOL_MAX) for target in ('primary', 'replica')}
+_owners = {}
+_last_used = {}
+_replica = {'checked_at': 0.0, 'healthy': True}
+
+def _is_alive(conn) -> bool:
+    '''Проверка, что соединение из пула не разорвано сервером'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    '''Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются'''
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection(target: str = 'primary'):
+    '''Соединение из пула, который переживает тёплые вызовы функции; target='replica' — пул DATABASE_REPLICA_URL.
+    При занятом пуле вызов ждёт свободное соединение до DB_POOL_TIMEOUT'''
+    with phase('connect'):
+        slots = _slots[target]
+        if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free {target} database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            pool = _pools.get(target)
+            if pool is None or pool.closed:
+                url = DATABASE_REPLICA_URL if target == 'replica' else os.environ['DATABASE_URL']
+                pool = _pools[target] = ThreadedConnectionPool(0, DB_POOL_MAX, url)
+            conn = pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            slots.release()
+            raise
+        _owners[id(conn)] = (pool, slots)
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    '''Возврат соединения в его пул; закрытые и сломанные соединения выбрасываются'''
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    pool, slots = _owners.pop(id(conn))
+    pool.putconn(conn, close=broken)
+    slots.release()
+
+def get_read_connection(event: dict):
+    '''Соединение для чтения: реплика, если она доступна, отстаёт не больше REPLICA_MAX_LAG секунд
+    и уже применила запись клиента из X-Min-Lsn; иначе основная база'''
+    if not DATABASE_REPLICA_URL:
+        return get_db_connection()
+    min_lsn = get_header(event, 'X-Min-Lsn')
+    if min_lsn and not LSN_PATTERN.match(min_lsn):
+        min_lsn = None
+    now = time.monotonic()
+    stale = now - _replica['checked_at'] > REPLICA_CHECK_INTERVAL
+    if not _replica['healthy'] and not stale:
+        return get_db_connection()
+    
+    try:
+        conn = get_db_connection('replica')
+    except psycopg2.OperationalError:
+        _replica.update(checked_at=now, healthy=False)
+        return get_db_connection()
+    except PoolError:
+        # Все соединения реплики заняты: реплика исправна, чтение уходит на основную базу
+        return get_db_connection()
+    
+    if stale or min_lsn:
+        try:
+            with phase('replica'), conn.cursor() as cur:
+                cur.execute(REPLICA_STATUS_SQL, (min_lsn or '0/0',))
+                lag, caught_up = cur.fetchone()
+            conn.rollback()
+        except psycopg2.Error:
+            release_db_connection(conn, broken=True)
+            _replica.update(checked_at=now, healthy=False)
+            return get_db_connection()
+        if stale:
+            _replica.update(checked_at=now, healthy=lag <= REPLICA_MAX_LAG)
+        if not _replica['healthy'] or (min_lsn and not caught_up):
+            release_db_connection(conn)
+            return get_db_connection()
+    return conn
+
+ASYNC_POOL_MAX = int(os.environ.get('ASYNC_POOL_MAX', '10'))
+
+_async_pools = {}
+
+async def _init_async_connection(conn):
+    '''items читаются объектами, как из psycopg2; параметры jsonb построители запросов передают уже сериализованными'''
+    await conn.set_type_codec('jsonb', encoder=str, decoder=json.loads, schema='pg_catalog')
+
+async def get_async_pool(target: str = 'primary'):
+    '''Пул asyncpg для handler_async: один на цикл событий процесса и target ('replica' — DATABASE_REPLICA_URL), создаётся при первом запросе'''
+    import asyncio
+    import asyncpg
+    
+    loop = asyncio.get_running_loop()
+    state = _async_pools.setdefault(target, {})
+    if state.get('loop') is not loop:
+        url = DATABASE_REPLICA_URL if target == 'replica' else os.environ['DATABASE_URL']
+        # Задача, а не пул: одновременные первые запросы ждут одно и то же создание
+        creating = loop.create_task(
+            asyncpg.create_pool(url, min_size=0, max_size=ASYNC_POOL_MAX, init=_init_async_connection)
+        )
+        state.update(loop=loop, pool=creating)
+    task = state['pool']
+    with phase('connect'):
+        try:
+            return await task
+        except Exception:
+            # Неудачное создание не запоминается: следующий запрос попробует снова
+            if state.get('pool') is task:
+                state.clear()
+            raise
+
+async def get_async_read_pool(event: dict):
+    '''Пул asyncpg для чтения по правилам get_read_connection: реплика, если она доступна, отстаёт не больше REPLICA_MAX_LAG секунд и применила X-Min-Lsn; иначе основная база'''
+    import asyncio
+    import asyncpg
+    
+    if not DATABASE_REPLICA_URL:
+        return await get_async_pool()
+    min_lsn = get_header(event, 'X-Min-Lsn')
+    if min_lsn and not LSN_PATTERN.match(min_lsn):
+        min_lsn = None
+    now = time.monotonic()
+    stale = now - _replica['checked_at'] > REPLICA_CHECK_INTERVAL
+    if not _replica['healthy'] and not stale:
+        return await get_async_pool()
+    if not stale and not min_lsn:
+        return await get_async_pool('replica')
+    
+    try:
+        pool = await get_async_pool('replica')
+        with phase('replica'):
+            lag, caught_up = await pool.fetchrow(to_asyncpg(REPLICA_STATUS_SQL), min_lsn or '0/0')
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+        _replica.update(checked_at=now, healthy=False)
+        return await get_async_pool()
+    if stale:
+        _replica.update(checked_at=now, healthy=lag <= REPLICA_MAX_LAG)
+    if not _replica['healthy'] or (min_lsn and not caught_up):
+        return await get_async_pool()
+    return pool
+
+def to_asyncpg(sql: str) -> str:
+    '''Плейсхолдеры psycopg2 (%s) в нумерованные параметры asyncpg ($1, $2, ...)'''
+    counter = iter(range(1, sql.count('%s') + 1))
+    return re.sub('%s', lambda match: f'${next(counter)}', sql)
+
+ORDERS_SELECT = '''
+    SELECT 
+        id,
+        last_name,
+        first_name,
+        middle_name,
+        phone,
+        city,
+        address,
+        items,
+        total,
+        status,
+        notes,
+        created_at,
+        updated_at
+    FROM orders
+'''
+
+# python — строки собираются в словари и сериализуются json.dumps;
+# postgres — полный список и NDJSON-выгрузку собирает сама база, handler отдаёт готовый текст
+JSON_SERIALIZATION = os.environ.get('JSON_SERIALIZATION', 'postgres')
+# Те же поля, что в serialize_order; время в JSON Postgres пишет в ISO 8601, как isoformat()
+ORDERS_JSON_SELECT = '''
+    SELECT
+        id AS "id",
+        last_name AS "lastName",
+        first_name AS "firstName",
+        middle_name AS "middleName",
+        phone AS "phone",
+        city AS "city",
+        address AS "address",
+        items AS "items",
+        total::float8 AS "total",
+        status AS "status",
+        COALESCE(notes, '') AS "notes",
+        created_at AS "createdAt",
+        updated_at AS "updatedAt"
+    FROM orders
+'''
+ORDERS_JSON_ARRAY = f'''
+    SELECT COALESCE(json_agg(o ORDER BY "createdAt" DESC), '[]')::text AS body, count(*) AS rows_count
+    FROM ({ORDERS_JSON_SELECT}) o
+'''
+
+PAGINATION_PARAMS = ('limit', 'cursor', 'status', 'phone', 'dateFrom', 'dateTo', 'product', 'productName', 'fields')
+# Поля ответа и колонки orders, из которых они берутся
+ORDER_FIELDS = {
+    'id': 'id',
+    'lastName': 'last_name',
+    'firstName': 'first_name',
+    'middleName': 'middle_name',
+    'phone': 'phone',
+    'city': 'city',
+    'address': 'address',
+    'items': 'items',
+    'itemsCount': 'items_count',
+    'total': 'total',
+    'status': 'status',
+    'notes': 'notes',
+    'createdAt': 'created_at',
+    'updatedAt': 'updated_at'
+}
+# Постраничный список по умолчанию: число позиций и сумма вместо items
+COMPACT_ORDER_FIELDS = (
+    'id', 'lastName', 'firstName', 'middleName', 'phone', 'city',
+    'itemsCount', 'total', 'status', 'createdAt', 'updatedAt'
+)
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
+EXPORT_CSV_FIELDS = (
+    'id', 'lastName', 'firstName', 'middleName', 'phone', 'city', 'address',
+    'items', 'total', 'status', 'notes', 'createdAt'
+)
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+# Строк в одном ответе выгрузки: тело и память функции ограничены при любом объёме, дальше — по X-Next-Cursor
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '10000'))
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_PRODUCT_FILTER = 50
+CHANGES_SAFETY_LAG = int(os.environ.get('CHANGES_SAFETY_LAG', '5'))
+
+def encode_cursor(order: dict, field: str = 'created_at') -> str:
+    '''Курсор на позицию заказа в выдаче (created_at, id) или в ленте изменений (updated_at, id)'''
+    raw = json.dumps([order[field].isoformat(), order['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    '''Разбор курсора из nextCursor предыдущей страницы'''
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return naive_utc(datetime.fromisoformat(created_at)), int(order_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_order_id(value: str) -> int:
+    '''Номер заказа для режима ?id='''
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Invalid id')
+
+def naive_utc(value: datetime) -> datetime:
+    '''Время с часовым поясом в UTC без пояса, как в колонках timestamp; asyncpg не принимает aware datetime для timestamp'''
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def parse_date(value: str, name: str) -> datetime:
+    '''Дата или дата-время в формате ISO 8601; со смещением — приводится к UTC'''
+    try:
+        return naive_utc(datetime.fromisoformat(value))
+    except ValueError:
+        raise ValueError(f'Invalid {name}, expected ISO 8601 date')
+
+def parse_fields(params: dict, default: tuple = None) -> tuple:
+    '''Поля из fields=; без параметра — default (None — заказ целиком)'''
+    if not params.get('fields'):
+        return default
+    fields = tuple(dict.fromkeys(field.strip() for field in params['fields'].split(',') if field.strip()))
+    unknown = [field for field in fields if field not in ORDER_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}. Allowed: {", ".join(ORDER_FIELDS)}')
+    return fields
+
+def orders_select(fields: tuple = None) -> str:
+    '''SELECT под набор полей; id, created_at и updated_at нужны курсорам всегда'''
+    if fields is None:
+        return ORDERS_SELECT
+    columns = ['id', 'created_at', 'updated_at']
+    columns.extend(ORDER_FIELDS[field] for field in fields if ORDER_FIELDS[field] not in columns)
+    return f"SELECT {', '.join(columns)} FROM orders"
+
+def parse_product_ids(value: str) -> list:
+    '''Номера товаров из product=42,43'''
+    try:
+        product_ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError:
+        raise ValueError('Invalid product')
+    if not product_ids or len(product_ids) > MAX_PRODUCT_FILTER:
+        raise ValueError(f'product must list from 1 to {MAX_PRODUCT_FILTER} ids')
+    return product_ids
+
+def build_product_filter(params: dict) -> tuple:
+    '''Условия по товару (product, productName): для заказа через GIN-индекс по items и для отдельной позиции'''
+    if params.get('product'):
+        product_ids = parse_product_ids(params['product'])
+        # items @> '[{"id": 42}]' ищется по idx_orders_items_path; ANY даёт по поиску в индексе на каждый товар
+        order_condition = 'items @> ANY(%s::jsonb[])'
+        order_params = [json.dumps([{'id': product_id}]) for product_id in product_ids]
+        item_condition = "(item->>'id')::integer = ANY(%s)"
+        return order_condition, [order_params], item_condition, [product_ids]
+    
+    if params.get('productName'):
+        name = params['productName']
+        pattern = '%' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        # Товары каталога с подходящим названием плюс точное название из позиций удалённых товаров
+        order_condition = '''items @> ANY(
+            ARRAY(SELECT jsonb_build_array(jsonb_build_object('id', p.id)) FROM products p WHERE p.name ILIKE %s)
+            || jsonb_build_array(jsonb_build_object('name', %s::text))
+        )'''
+        item_condition = "((item->>'id')::integer IN (SELECT p.id FROM products p WHERE p.name ILIKE %s) OR item->>'name' = %s)"
+        return order_condition, [pattern, name], item_condition, [pattern, name]
+    
+    return None
+
+def build_orders_filters(params: dict) -> tuple:
+    '''Условия WHERE по фильтрам списка заказов (status, phone, dateFrom, dateTo, product, productName)'''
+    conditions = []
+    sql_params = []
+    
+    if params.get('status'):
+        statuses = params['status'].split(',')
+        conditions.append('status = ANY(%s)')
+        sql_params.append(statuses)
+    
+    if params.get('phone'):
+        conditions.append('phone = %s')
+        sql_params.append(params['phone'])
+    
+    if params.get('dateFrom'):
+        conditions.append('created_at >= %s')
+        sql_params.append(parse_date(params['dateFrom'], 'dateFrom'))
+    
+    if params.get('dateTo'):
+        conditions.append('created_at < %s')
+        sql_params.append(parse_date(params['dateTo'], 'dateTo'))
+    
+    product_filter = build_product_filter(params)
+    if product_filter:
+        order_condition, order_params = product_filter[:2]
+        conditions.append(order_condition)
+        sql_params.extend(order_params)
+    
+    return conditions, sql_params
+
+def build_orders_query(params: dict, fields: tuple = None) -> tuple:
+    '''SQL для страницы заказов с фильтрами и keyset-пагинацией по (created_at, id)'''
+    try:
+        limit = int(params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    
+    conditions, sql_params = build_orders_filters(params)
+    
+    if params.get('cursor'):
+        created_at, order_id = decode_cursor(params['cursor'])
+        # created_at <= %s отдельно, чтобы сработал диапазон по idx_orders_created_at
+        conditions.append('created_at <= %s AND (created_at < %s OR id < %s)')
+        sql_params.extend([created_at, created_at, order_id])
+    
+    sql = orders_select(fields)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT %s'
+    sql_params.append(limit + 1)
+    
+    return sql, sql_params, limit
+
+def build_product_sales_query(params: dict) -> tuple:
+    '''SQL для проданного количества и выручки по товарам из фильтра среди всех заказов под фильтрами списка'''
+    conditions, sql_params = build_orders_filters(params)
+    _, _, item_condition, item_params = build_product_filter(params)
+    conditions.append(item_condition)
+    sql = f'''
+    SELECT
+        (item->>'id')::integer AS product_id,
+        MAX(item->>'name') AS name,
+        SUM((item->>'quantity')::integer) AS quantity,
+        SUM((item->>'price')::numeric * (item->>'quantity')::integer) AS revenue,
+        COUNT(DISTINCT o.id) AS orders
+    FROM orders o, jsonb_array_elements(o.items) AS item
+    WHERE {' AND '.join(conditions)}
+    GROUP BY 1
+    ORDER BY quantity DESC, product_id
+    '''
+    return sql, sql_params + item_params
+
+def build_changes_query(params: dict, fields: tuple = None) -> tuple:
+    '''SQL для ленты заказов, созданных или изменённых после since (курсор или ISO-время)'''
+    try:
+        limit = int(params.get('limit') or MAX_LIMIT)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    
+    since = params['since']
+    try:
+        updated_at, order_id = decode_cursor(since)
+    except ValueError:
+        updated_at, order_id = parse_date(since, 'since'), 0
+    
+    # Строки моложе CHANGES_SAFETY_LAG не отдаются: ещё не закоммиченная транзакция
+    # может записать updated_at раньше уже выданной отметки и потеряться для клиента
+    sql = orders_select(fields) + '''
+    WHERE updated_at >= %s AND (updated_at > %s OR id > %s)
+        AND updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+    ORDER BY updated_at, id
+    LIMIT %s
+    '''
+    return sql, [updated_at, updated_at, order_id, CHANGES_SAFETY_LAG, limit + 1], limit
+
+def build_export_query(params: dict) -> tuple:
+    '''SQL для куска выгрузки заказов под фильтрами списка: EXPORT_CHUNK_ROWS строк после курсора (created_at, id)'''
+    if params['export'] not in EXPORT_FORMATS:
+        raise ValueError(f'Invalid export format. Allowed: {", ".join(EXPORT_FORMATS)}')
+    conditions, sql_params = build_orders_filters(params)
+    if params.get('cursor'):
+        created_at, order_id = decode_cursor(params['cursor'])
+        conditions.append('created_at <= %s AND (created_at < %s OR id < %s)')
+        sql_params.extend([created_at, created_at, order_id])
+    
+    as_json = params['export'] == 'ndjson' and JSON_SERIALIZATION == 'postgres'
+    sql = ORDERS_JSON_SELECT if as_json else ORDERS_SELECT
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT %s'
+    sql_params.append(EXPORT_CHUNK_ROWS + 1)
+    if as_json:
+        # Каждая строка выгрузки — готовый JSON-объект из базы; created_at и id — для курсора следующего куска
+        sql = f'SELECT row_to_json(o)::text AS line, o."createdAt" AS created_at, o.id FROM ({sql}) o'
+    return sql, sql_params, EXPORT_CHUNK_ROWS
+
+def serialize_order(order: dict, fields: tuple = None) -> dict:
+    '''Заказ в формате ответа API; fields — только перечисленные поля'''
+    if fields is not None:
+        result = {}
+        for field in fields:
+            value = order[ORDER_FIELDS[field]]
+            if field == 'total':
+                value = float(value)
+            elif field == 'notes':
+                value = value or ''
+            elif field in ('createdAt', 'updatedAt'):
+                value = value.isoformat()
+            result[field] = value
+        return result
+    return {
+        'id': order['id'],
+        'lastName': order['last_name'],
+        'firstName': order['first_name'],
+        'middleName': order['middle_name'],
+        'phone': order['phone'],
+        'city': order['city'],
+        'address': order['address'],
+        'items': order['items'],
+        'total': float(order['total']),
+        'status': order['status'],
+        'notes': order['notes'] or '',
+        'createdAt': order['created_at'].isoformat(),
+        'updatedAt': order['updated_at'].isoformat()
+    }
+
+def orders_page(orders: list, limit: int, fields: tuple) -> dict:
+    '''Страница списка из limit + 1 прочитанных строк: лишняя строка означает, что есть следующая'''
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1])
+    with phase('serialize'):
+        serialized = [serialize_order(order, fields) for order in orders]
+    return {
+        'orders': serialized,
+        'nextCursor': next_cursor
+    }
+
+def wants_product_sales(params: dict) -> bool:
+    '''Итоги по товарам считаются один раз, на первой странице списка с фильтром по товару'''
+    return bool(build_product_filter(params)) and not params.get('cursor')
+
+def serialize_product_sales(rows: list) -> list:
+    '''Итоги по товарам в формате ответа API'''
+    return [
+        {
+            'productId': row['product_id'],
+            'name': row['name'],
+            'quantity': int(row['quantity']),
+            'revenue': float(row['revenue']),
+            'orders': row['orders']
+        }
+        for row in rows
+    ]
+
+def export_chunk(conn, sql: str, sql_params: list, export_format: str, limit: int, header: bool = True) -> tuple:
+    '''Кусок выгрузки не больше limit строк через серверный курсор и курсор следующего куска (None — выгрузка закончена).
+    В памяти Python — тело куска и не больше EXPORT_ITERSIZE прочитанных строк, сколько бы заказов ни подходило'''
+    import csv
+    
+    cur = conn.cursor(name='orders_export', cursor_factory=RealDictCursor)
+    cur.itersize = EXPORT_ITERSIZE
+    try:
+        cur.execute(sql, sql_params)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv' and header:
+            writer.writerow(EXPORT_CSV_FIELDS)
+        
+        last = None
+        next_cursor = None
+        for rows, order in enumerate(cur, start=1):
+            if rows > limit:
+                next_cursor = encode_cursor(last)
+                break
+            if 'line' in order:
+                buffer.write(order['line'])
+                buffer.write('\n')
+            elif export_format == 'csv':
+                item = serialize_order(order)
+                item['items'] = json.dumps(item['items'], ensure_ascii=False)
+                writer.writerow([item[field] for field in EXPORT_CSV_FIELDS])
+            else:
+                buffer.write(json.dumps(serialize_order(order), ensure_ascii=False))
+                buffer.write('\n')
+            last = order
+        
+        record_rows(min(cur.rownumber, limit))
+        return buffer.getvalue(), next_cursor
+    finally:
+        cur.close()
+
+# Админские списки: кэшировать только в браузере и всегда перепроверять по ETag
+ADMIN_CACHE_CONTROL = 'private, no-cache'
+
+def get_header(event: dict, name: str):
+    '''Заголовок запроса без учёта регистра имени'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def etag_matches(event: dict, etag: str) -> bool:
+    '''Проверка If-None-Match против текущего ETag (слабое сравнение)'''
+    if_none_match = get_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Сжатые представления отличаются от исходного только суффиксом -br/-gzip
+    tags = [re.sub(r'-(br|gzip)"$', '"', tag.strip().removeprefix('W/')) for tag in if_none_match.split(',')]
+    return etag.removeprefix('W/') in tags
+
+def body_etag(body: str) -> str:
+    '''ETag по хэшу сериализованного ответа'''
+    return '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+COMPRESS_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+def choose_encoding(event: dict):
+    '''Лучшее сжатие из Accept-Encoding клиента: brotli, если модуль установлен, иначе gzip'''
+    accepted = {}
+    for part in (get_header(event, 'Accept-Encoding') or '').lower().split(','):
+        token, _, weight = part.strip().partition(';')
+        try:
+            accepted[token.strip()] = float(weight.strip()[2:]) if weight.strip().startswith('q=') else 1.0
+        except ValueError:
+            accepted[token.strip()] = 0.0
+    for encoding in COMPRESS_ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress_response(event: dict, response: dict, memo: dict = None) -> dict:
+    '''Сжатие тела ответа gzip/brotli в base64; маленькие тела отдаются как есть'''
+    headers = {**response['headers'], 'Vary': 'Accept-Encoding'}
+    body = response['body']
+    encoding = choose_encoding(event) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding is None:
+        return {**response, 'headers': headers}
+    
+    if memo is not None and encoding in memo:
+        encoded = memo[encoding]
+    else:
+        with phase('compress'):
+            data = body.encode()
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+            encoded = base64.b64encode(compressed).decode()
+        if memo is not None:
+            memo[encoding] = encoded
+    
+    headers['Content-Encoding'] = encoding
+    if 'ETag' in headers:
+        # У сжатого представления свой ETag; etag_matches снимает суффикс при сравнении
+        headers['ETag'] = headers['ETag'][:-1] + f'-{encoding}"'
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+@instrumented('get-orders')
 def handler(event: dict, context) -> dict:
-    '''API для получения списка всех заказов из базы данных'''
+    '''API для получения заказов: весь список, постранично с фильтрами (limit, cursor, status, phone, dateFrom, dateTo, product, productName, fields) и итогами по товарам, выгрузкой кусками (export=ndjson|csv, продолжение — cursor из X-Next-Cursor), лентой изменений (since) или один заказ (id)'''
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
+        return compress_response(event, {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Min-Lsn'
             },
             'body': '',
             'isBase64Encoded': False
-        }
+        })
     
     if method != 'GET':
         return {
@@ -30,60 +783,149 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
     
+    params = event.get('queryStringParameters') or {}
+    export_format = params.get('export')
+    since = params.get('since')
+    paginated = any(params.get(key) for key in PAGINATION_PARAMS)
+    
+    fields = None
+    try:
+        if params.get('id'):
+            query = parse_order_id(params['id'])
+        elif export_format:
+            query = build_export_query(params)
+        elif since:
+            fields = parse_fields(params)
+            query = build_changes_query(params, fields)
+        else:
+            fields = parse_fields(params, COMPACT_ORDER_FIELDS)
+            query = build_orders_query(params, fields) if paginated else None
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
     conn = None
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_read_connection(event)
         cur = conn.cursor(cursor_factory=RealDictCursor)
+        response_body = None
         
-        cur.execute(
-            '''
-            SELECT 
-                id,
-                last_name,
-                first_name,
-                middle_name,
-                phone,
-                city,
-                address,
-                items,
-                total,
-                status,
-                notes,
-                created_at
-            FROM orders
-            ORDER BY created_at DESC
-            '''
-        )
+        if export_format:
+            # Выгрузка отдаётся кусками: следующий кусок — тот же запрос с cursor из X-Next-Cursor
+            sql, sql_params, limit = query
+            with phase('export'):
+                export_body, next_cursor = export_chunk(conn, sql, sql_params, export_format, limit, header=not params.get('cursor'))
+            headers = {
+                'Content-Type': EXPORT_FORMATS[export_format],
+                'Content-Disposition': f'attachment; filename="orders.{export_format}"',
+                'Cache-Control': ADMIN_CACHE_CONTROL,
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'X-Next-Cursor'
+            }
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+            return compress_response(event, {
+                'statusCode': 200,
+                'headers': headers,
+                'body': export_body,
+                'isBase64Encoded': False
+            })
         
-        orders = cur.fetchall()
+        if params.get('id'):
+            # Один заказ целиком, с позициями
+            with phase('query'):
+                cur.execute(ORDERS_SELECT + ' WHERE id = %s', (query,))
+                order = cur.fetchone()
+            if order is None:
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Order not found'}),
+                    'isBase64Encoded': False
+                }
+            record_rows(1)
+            result = serialize_order(order)
+        elif since:
+            sql, sql_params, limit = query
+            with phase('query'):
+                cur.execute(sql, sql_params)
+                orders = cur.fetchall()
+            record_rows(len(orders))
+            
+            has_more = len(orders) > limit
+            orders = orders[:limit]
+            with phase('serialize'):
+                serialized = [serialize_order(order, fields) for order in orders]
+            
+            result = {
+                'orders': serialized,
+                'nextSince': encode_cursor(orders[-1], 'updated_at') if orders else since,
+                'hasMore': has_more
+            }
+        elif not paginated and JSON_SERIALIZATION == 'postgres':
+            # Массив JSON собирает база: строки заказов не превращаются в объекты Python
+            with phase('query'):
+                cur.execute(ORDERS_JSON_ARRAY)
+                row = cur.fetchone()
+            record_rows(row['rows_count'])
+            response_body = row['body']
+        elif not paginated:
+            with phase('query'):
+                cur.execute(ORDERS_SELECT + ' ORDER BY created_at DESC')
+                orders = cur.fetchall()
+            record_rows(len(orders))
+            with phase('serialize'):
+                result = [serialize_order(order) for order in orders]
+        else:
+            sql, sql_params, limit = query
+            with phase('query'):
+                cur.execute(sql, sql_params)
+                orders = cur.fetchall()
+            record_rows(len(orders))
+            result = orders_page(orders, limit, fields)
+            
+            if wants_product_sales(params):
+                with phase('facets'):
+                    cur.execute(*build_product_sales_query(params))
+                    result['productSales'] = serialize_product_sales(cur.fetchall())
         
-        result = []
-        for order in orders:
-            result.append({
-                'id': order['id'],
-                'lastName': order['last_name'],
-                'firstName': order['first_name'],
-                'middleName': order['middle_name'],
-                'phone': order['phone'],
-                'city': order['city'],
-                'address': order['address'],
-                'items': order['items'],
-                'total': float(order['total']),
-                'status': order['status'],
-                'notes': order['notes'] or '',
-                'createdAt': order['created_at'].isoformat()
-            })
+        if response_body is None:
+            with phase('json'):
+                response_body = json.dumps(result)
+        etag = body_etag(response_body)
+        if etag_matches(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': {
+                    'ETag': etag,
+                    'Cache-Control': ADMIN_CACHE_CONTROL,
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': '',
+                'isBase64Encoded': False
+            }
         
-        return {
+        return compress_response(event, {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
+                'ETag': etag,
+                'Cache-Control': ADMIN_CACHE_CONTROL,
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps(result),
+            'body': response_body,
             'isBase64Encoded': False
-        }
+        })
         
     except Exception as e:
         return {
@@ -98,4 +940,83 @@ def handler(event: dict, context) -> dict:
     finally:
         if conn:
             cur.close()
-            conn.close()
\ No newline at end of file
+            release_db_connection(conn)
+
+@instrumented_async('get-orders')
+async def handler_async(event: dict, context) -> dict:
+    '''Постраничный список на asyncpg: страница и итоги по товарам параллельно, много запросов на процесс; прочие режимы — handler в потоке'''
+    import asyncio
+    
+    params = event.get('queryStringParameters') or {}
+    paginated = any(params.get(key) for key in PAGINATION_PARAMS)
+    if event.get('httpMethod', 'GET') != 'GET' or not paginated or params.get('id') or params.get('export') or params.get('since'):
+        return await asyncio.to_thread(handler.__wrapped__, event, context)
+    
+    try:
+        fields = parse_fields(params, COMPACT_ORDER_FIELDS)
+        sql, sql_params, limit = build_orders_query(params, fields)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        pool = await get_async_read_pool(event)
+        
+        async def fetch(name: str, query_sql: str, query_params: list) -> list:
+            with phase(name):
+                return await pool.fetch(to_asyncpg(query_sql), *query_params)
+        
+        queries = [fetch('query', sql, sql_params)]
+        if wants_product_sales(params):
+            queries.append(fetch('facets', *build_product_sales_query(params)))
+        fetched = await asyncio.gather(*queries)
+        record_rows(len(fetched[0]))
+        
+        result = orders_page(fetched[0], limit, fields)
+        if len(fetched) > 1:
+            result['productSales'] = serialize_product_sales(fetched[1])
+        
+        with phase('json'):
+            response_body = json.dumps(result)
+        etag = body_etag(response_body)
+        if etag_matches(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': {
+                    'ETag': etag,
+                    'Cache-Control': ADMIN_CACHE_CONTROL,
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': '',
+                'isBase64Encoded': False
+            }
+        
+        return compress_response(event, {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'ETag': etag,
+                'Cache-Control': ADMIN_CACHE_CONTROL,
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': response_body,
+            'isBase64Encoded': False
+        })
+        
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
@@ -0,0 +1,314 @@
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+import psycopg2
+from psycopg2 import sql
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    '''Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога'''
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    '''Учёт прочитанных или записанных строк для структурного лога'''
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    '''Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile'''
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    '''Конец вызова: заголовки Server-Timing и одна JSON-строка лога'''
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    '''Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+_pool = None
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}
+
+def _is_alive(conn) -> bool:
+    '''Проверка, что соединение из пула не разорвано сервером'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    '''Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются'''
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection():
+    '''Соединение из пула, который переживает тёплые вызовы функции; при занятом пуле вызов ждёт до DB_POOL_TIMEOUT'''
+    global _pool
+    with phase('connect'):
+        if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            if _pool is None or _pool.closed:
+                _pool = ThreadedConnectionPool(0, DB_POOL_MAX, os.environ['DATABASE_URL'])
+            conn = _pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                _pool.putconn(conn, close=True)
+                conn = _pool.getconn()
+        except Exception:
+            _slots.release()
+            raise
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    '''Возврат соединения в пул; закрытые и сломанные соединения выбрасываются'''
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    _pool.putconn(conn, close=broken)
+    _slots.release()
+
+PARTITIONS_AHEAD = int(os.environ.get('ORDERS_PARTITIONS_AHEAD', '3'))
+ARCHIVE_AFTER_MONTHS = int(os.environ.get('ORDERS_ARCHIVE_AFTER_MONTHS', '12'))
+ARCHIVE_LOCK_TIMEOUT = os.environ.get('ORDERS_ARCHIVE_LOCK_TIMEOUT', '5s')
+ARCHIVE_SCHEMA = 'orders_archive'
+# В архив уходит месяц, в котором все заказы в одном из этих статусов
+FINISHED_STATUSES = ['delivered', 'cancelled']
+PARTITION_NAME = re.compile(r'^orders_p(\d{4})_(\d{2})$')
+
+def archive_cutoff(today: date) -> date:
+    '''Первое число месяца, раньше которого секции можно отсоединять'''
+    months = today.year * 12 + today.month - 1 - ARCHIVE_AFTER_MONTHS
+    return date(months // 12, months % 12 + 1, 1)
+
+def archive_candidates(cur, cutoff: date) -> list:
+    '''Месячные секции orders до cutoff от старых к новым и их состояние: attached, pending (отсоединение прервано) или detached (ещё в public)'''
+    cur.execute(
+        '''
+        SELECT c.relname, i.inhdetachpending
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'public.orders'::regclass
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname ~ '^orders_p[0-9]{4}_[0-9]{2}$'
+        '''
+    )
+    candidates = []
+    for name, pending in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match and date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            candidates.append((name, 'detached' if pending is None else 'pending' if pending else 'attached'))
+    return sorted(candidates)
+
+def partition_bounds(name: str) -> tuple:
+    '''Границы месяца секции orders_pYYYY_MM: [первое число, первое число следующего месяца)'''
+    match = PARTITION_NAME.match(name)
+    year, month = int(match.group(1)), int(match.group(2))
+    return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+def has_unfinished(cur, partition) -> bool:
+    '''Есть ли в секции заказы не в FINISHED_STATUSES; SHARE-блокировка секции до конца транзакции'''
+    cur.execute(sql.SQL('SET LOCAL lock_timeout = {}').format(sql.Literal(ARCHIVE_LOCK_TIMEOUT)))
+    cur.execute(sql.SQL('LOCK TABLE {} IN SHARE MODE').format(partition))
+    cur.execute(
+        sql.SQL('SELECT EXISTS (SELECT 1 FROM {} WHERE status IS NULL OR status <> ALL(%s))').format(partition),
+        (FINISHED_STATUSES,)
+    )
+    return cur.fetchone()[0]
+
+def detach_partition(conn, partition, finalize: bool = False):
+    '''DETACH CONCURRENTLY вне транзакции берёт на orders SHARE UPDATE EXCLUSIVE: чтение и вставка заказов не ждут; прерванное отсоединение завершает FINALIZE'''
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL('SET lock_timeout = {}').format(sql.Literal(ARCHIVE_LOCK_TIMEOUT)))
+            try:
+                cur.execute(
+                    sql.SQL('ALTER TABLE public.orders DETACH PARTITION {} {}').format(
+                        partition, sql.SQL('FINALIZE' if finalize else 'CONCURRENTLY')
+                    )
+                )
+            finally:
+                cur.execute('RESET lock_timeout')
+    finally:
+        conn.autocommit = False
+
+def archive_partition(conn, name: str, state: str) -> bool:
+    '''Перенос секции в схему orders_archive, если в ней не осталось незавершённых заказов'''
+    partition = sql.Identifier('public', name)
+    if state == 'attached':
+        try:
+            with conn.cursor() as cur:
+                unfinished = has_unfinished(cur, partition)
+        finally:
+            conn.rollback()
+        if unfinished:
+            return False
+    if state != 'detached':
+        detach_partition(conn, partition, finalize=state == 'pending')
+    
+    # Отсоединённая секция не видна через orders; статус могли сменить до отсоединения, тогда она возвращается
+    try:
+        with conn.cursor() as cur:
+            if has_unfinished(cur, partition):
+                month_start, month_end = partition_bounds(name)
+                cur.execute(
+                    sql.SQL('ALTER TABLE public.orders ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})').format(
+                        partition, sql.Literal(month_start), sql.Literal(month_end)
+                    )
+                )
+                conn.commit()
+                return False
+            cur.execute(sql.SQL('ALTER TABLE {} SET SCHEMA {}').format(partition, sql.Identifier(ARCHIVE_SCHEMA)))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+
+@instrumented('orders-archive')
+def handler(event: dict, context) -> dict:
+    '''Обслуживание секций orders по расписанию: секции на будущие месяцы и архивация старых месяцев завершённых заказов'''
+    method = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        
+        with phase('partitions'):
+            with conn.cursor() as cur:
+                cur.execute('SELECT create_orders_partitions(%s)', (PARTITIONS_AHEAD,))
+                created = cur.fetchone()[0]
+            conn.commit()
+        
+        archived = []
+        skipped = []
+        with phase('archive'):
+            with conn.cursor() as cur:
+                candidates = archive_candidates(cur, archive_cutoff(date.today()))
+            conn.rollback()
+            for name, state in candidates:
+                try:
+                    (archived if archive_partition(conn, name, state) else skipped).append(name)
+                except psycopg2.Error:
+                    # Секцию держит чужая транзакция или отсоединение прервано: продолжим при следующем запуске
+                    skipped.append(name)
+        record_rows(len(archived))
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'partitionsCreated': created, 'archived': archived, 'skipped': skipped}),
+            'isBase64Encoded': False
+        }
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            release_db_connection(conn)
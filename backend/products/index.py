@@ -1,12 +1,878 @@
+import base64
+import functools
+import gzip
+import hashlib
+import io
 import json
 import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import OrderedDict
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
-def get_db_connection():
-    """Подключение к базе данных"""
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    """Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога"""
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    """Учёт прочитанных или записанных строк для структурного лога"""
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    """Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile"""
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    """Конец вызова: заголовки Server-Timing и одна JSON-строка лога"""
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    """Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+def instrumented_async(name: str):
+    """То же для async handler; без cProfile: профилировщик один на поток, а вызовы в цикле событий идут вперемешку"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=False)
+            response = None
+            try:
+                response = await handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '5'))
+LSN_PATTERN = re.compile(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$')
+# Реплика, догнавшая приёмник WAL, не отстаёт, даже если последняя транзакция была давно
+REPLICA_STATUS_SQL = """
+    SELECT
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+             ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END,
+        pg_last_wal_replay_lsn() >= %s::pg_lsn
+"""
+
+_pools = {}
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = {target: threading.BoundedSemaphore(DB_POOL_MAX) for target in ('primary', 'replica')}
+_owners = {}
+_last_used = {}
+_replica = {'checked_at': 0.0, 'healthy': True}
+
+def _is_alive(conn) -> bool:
+    """Проверка, что соединение из пула не разорвано сервером"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    """Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются"""
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection(target: str = 'primary'):
+    """Соединение из пула, который переживает тёплые вызовы функции; target='replica' — пул DATABASE_REPLICA_URL.
+    При занятом пуле вызов ждёт свободное соединение до DB_POOL_TIMEOUT"""
+    with phase('connect'):
+        slots = _slots[target]
+        if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free {target} database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            pool = _pools.get(target)
+            if pool is None or pool.closed:
+                url = DATABASE_REPLICA_URL if target == 'replica' else os.environ['DATABASE_URL']
+                pool = _pools[target] = ThreadedConnectionPool(0, DB_POOL_MAX, url)
+            conn = pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            slots.release()
+            raise
+        _owners[id(conn)] = (pool, slots)
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    """Возврат соединения в его пул; закрытые и сломанные соединения выбрасываются"""
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    pool, slots = _owners.pop(id(conn))
+    pool.putconn(conn, close=broken)
+    slots.release()
+
+def get_read_connection(event: dict):
+    """Соединение для чтения: реплика, если она доступна, отстаёт не больше REPLICA_MAX_LAG секунд
+    и уже применила запись клиента из X-Min-Lsn; иначе основная база"""
+    if not DATABASE_REPLICA_URL:
+        return get_db_connection()
+    min_lsn = get_header(event, 'X-Min-Lsn')
+    if min_lsn and not LSN_PATTERN.match(min_lsn):
+        min_lsn = None
+    now = time.monotonic()
+    stale = now - _replica['checked_at'] > REPLICA_CHECK_INTERVAL
+    if not _replica['healthy'] and not stale:
+        return get_db_connection()
+    
+    try:
+        conn = get_db_connection('replica')
+    except psycopg2.OperationalError:
+        _replica.update(checked_at=now, healthy=False)
+        return get_db_connection()
+    except PoolError:
+        # Все соединения реплики заняты: реплика исправна, чтение уходит на основную базу
+        return get_db_connection()
+    
+    if stale or min_lsn:
+        try:
+            with phase('replica'), conn.cursor() as cur:
+                cur.execute(REPLICA_STATUS_SQL, (min_lsn or '0/0',))
+                lag, caught_up = cur.fetchone()
+            conn.rollback()
+        except psycopg2.Error:
+            release_db_connection(conn, broken=True)
+            _replica.update(checked_at=now, healthy=False)
+            return get_db_connection()
+        if stale:
+            _replica.update(checked_at=now, healthy=lag <= REPLICA_MAX_LAG)
+        if not _replica['healthy'] or (min_lsn and not caught_up):
+            release_db_connection(conn)
+            return get_db_connection()
+    return conn
+
+ASYNC_POOL_MAX = int(os.environ.get('ASYNC_POOL_MAX', '10'))
+
+_async_pools = {}
+
+async def get_async_pool(target: str = 'primary'):
+    """Пул asyncpg для handler_async: один на цикл событий процесса и target ('replica' — DATABASE_REPLICA_URL), создаётся при первом запросе"""
+    import asyncio
+    import asyncpg
+    
+    loop = asyncio.get_running_loop()
+    state = _async_pools.setdefault(target, {})
+    if state.get('loop') is not loop:
+        url = DATABASE_REPLICA_URL if target == 'replica' else os.environ['DATABASE_URL']
+        # Задача, а не пул: одновременные первые запросы ждут одно и то же создание
+        creating = loop.create_task(
+            asyncpg.create_pool(url, min_size=0, max_size=ASYNC_POOL_MAX)
+        )
+        state.update(loop=loop, pool=creating)
+    task = state['pool']
+    with phase('connect'):
+        try:
+            return await task
+        except Exception:
+            # Неудачное создание не запоминается: следующий запрос попробует снова
+            if state.get('pool') is task:
+                state.clear()
+            raise
+
+async def get_async_read_pool(event: dict):
+    """Пул asyncpg для чтения по правилам get_read_connection: реплика, если она доступна, отстаёт не больше REPLICA_MAX_LAG секунд и применила X-Min-Lsn; иначе основная база"""
+    import asyncio
+    import asyncpg
+    
+    if not DATABASE_REPLICA_URL:
+        return await get_async_pool()
+    min_lsn = get_header(event, 'X-Min-Lsn')
+    if min_lsn and not LSN_PATTERN.match(min_lsn):
+        min_lsn = None
+    now = time.monotonic()
+    stale = now - _replica['checked_at'] > REPLICA_CHECK_INTERVAL
+    if not _replica['healthy'] and not stale:
+        return await get_async_pool()
+    if not stale and not min_lsn:
+        return await get_async_pool('replica')
+    
+    try:
+        pool = await get_async_pool('replica')
+        with phase('replica'):
+            lag, caught_up = await pool.fetchrow(to_asyncpg(REPLICA_STATUS_SQL), min_lsn or '0/0')
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+        _replica.update(checked_at=now, healthy=False)
+        return await get_async_pool()
+    if stale:
+        _replica.update(checked_at=now, healthy=lag <= REPLICA_MAX_LAG)
+    if not _replica['healthy'] or (min_lsn and not caught_up):
+        return await get_async_pool()
+    return pool
+
+def to_asyncpg(sql: str) -> str:
+    """Плейсхолдеры psycopg2 (%s) в нумерованные параметры asyncpg ($1, $2, ...)"""
+    counter = iter(range(1, sql.count('%s') + 1))
+    return re.sub('%s', lambda match: f'${next(counter)}', sql)
+
+def write_lsn_headers(conn) -> dict:
+    """Позиция WAL после коммита: админка передаёт её в X-Min-Lsn, чтобы следующее чтение не ушло на отстающую реплику"""
+    if not DATABASE_REPLICA_URL:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()')
+        lsn = cur.fetchone()[0]
+    conn.rollback()
+    return {'X-Write-Lsn': lsn, 'Access-Control-Expose-Headers': 'X-Write-Lsn'}
+
+PRODUCTS_SELECT = '''
+    SELECT 
+        id, name, price, images, category, material, style, color, 
+        manufacturer, description,
+        dimension_length, dimension_width, dimension_height,
+        created_at, updated_at
+    FROM products
+'''
+
+# python — строки собираются в словари и сериализуются json.dumps;
+# postgres — полный список товаров собирает сама база, handler отдаёт готовый текст
+JSON_SERIALIZATION = os.environ.get('JSON_SERIALIZATION', 'postgres')
+# Те же поля, что в serialize_product, массивом в порядке id
+PRODUCTS_JSON_ARRAY = '''
+    SELECT COALESCE(json_agg(p ORDER BY "id"), '[]')::text AS body, count(*) AS rows_count
+    FROM (
+        SELECT
+            id AS "id",
+            name AS "name",
+            price AS "price",
+            images AS "images",
+            category AS "category",
+            material AS "material",
+            style AS "style",
+            color AS "color",
+            manufacturer AS "manufacturer",
+            description AS "description",
+            json_build_object(
+                'length', dimension_length,
+                'width', dimension_width,
+                'height', dimension_height
+            ) AS "dimensions"
+        FROM products
+    ) p
+'''
+
+CATALOG_PARAMS = ('q', 'priceMin', 'priceMax', 'category', 'material', 'color', 'sort', 'limit', 'offset', 'fields', 'id')
+# Поля ответа и колонки products, из которых они собираются
+PRODUCT_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'price': ('price',),
+    'images': ('images',),
+    'category': ('category',),
+    'material': ('material',),
+    'style': ('style',),
+    'color': ('color',),
+    'manufacturer': ('manufacturer',),
+    'description': ('description',),
+    'dimensions': ('dimension_length', 'dimension_width', 'dimension_height')
+}
+# Список каталога по умолчанию: без описания и размеров, из картинок только первая
+COMPACT_PRODUCT_FIELDS = ('id', 'name', 'price', 'images', 'category', 'material', 'style', 'color')
+FACETS = ('category', 'material', 'color')
+SORTS = {
+    'id': 'id',
+    'price_asc': 'price ASC, id',
+    'price_desc': 'price DESC, id',
+    'name': 'name, id',
+    'newest': 'created_at DESC, id DESC'
+}
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', '256'))
+CATALOG_CACHE_CONTROL = f"public, max-age={os.environ.get('CATALOG_MAX_AGE', '60')}"
+
+_catalog_cache = OrderedDict()
+# Кэш общий для потоков локального сервера и asyncio.to_thread в handler_async
+_catalog_cache_lock = threading.Lock()
+
+def get_header(event: dict, name: str):
+    """Заголовок запроса без учёта регистра имени"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def etag_matches(event: dict, etag: str) -> bool:
+    """Проверка If-None-Match против текущего ETag (слабое сравнение)"""
+    if_none_match = get_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Сжатые представления отличаются от исходного только суффиксом -br/-gzip
+    tags = [re.sub(r'-(br|gzip)"$', '"', tag.strip().removeprefix('W/')) for tag in if_none_match.split(',')]
+    return etag.removeprefix('W/') in tags
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+COMPRESS_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+def choose_encoding(event: dict):
+    """Лучшее сжатие из Accept-Encoding клиента: brotli, если модуль установлен, иначе gzip"""
+    accepted = {}
+    for part in (get_header(event, 'Accept-Encoding') or '').lower().split(','):
+        token, _, weight = part.strip().partition(';')
+        try:
+            accepted[token.strip()] = float(weight.strip()[2:]) if weight.strip().startswith('q=') else 1.0
+        except ValueError:
+            accepted[token.strip()] = 0.0
+    for encoding in COMPRESS_ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress_response(event: dict, response: dict, memo: dict = None) -> dict:
+    """Сжатие тела ответа gzip/brotli в base64; маленькие тела отдаются как есть"""
+    headers = {**response['headers'], 'Vary': 'Accept-Encoding'}
+    body = response['body']
+    encoding = choose_encoding(event) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding is None:
+        return {**response, 'headers': headers}
+    
+    if memo is not None and encoding in memo:
+        encoded = memo[encoding]
+    else:
+        with phase('compress'):
+            data = body.encode()
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+            encoded = base64.b64encode(compressed).decode()
+        if memo is not None:
+            memo[encoding] = encoded
+    
+    headers['Content-Encoding'] = encoding
+    if 'ETag' in headers:
+        # У сжатого представления свой ETag; etag_matches снимает суффикс при сравнении
+        headers['ETag'] = headers['ETag'][:-1] + f'-{encoding}"'
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+def catalog_etag(cache_key: tuple, version: int) -> str:
+    """ETag ответа каталога: он однозначно задаётся версией каталога и параметрами запроса"""
+    digest = hashlib.sha1(repr(cache_key).encode()).hexdigest()[:16]
+    return f'"v{version}-{digest}"'
+
+def catalog_cache_key(params: dict) -> tuple:
+    """Ключ кэша: параметры каталога без пустых значений в стабильном порядке"""
+    return tuple(sorted((key, params[key]) for key in CATALOG_PARAMS if params.get(key)))
+
+def get_cached_catalog(key: tuple, version: int):
+    """Готовый JSON ответа и его сжатые варианты, если он не устарел по TTL и по версии каталога"""
+    with _catalog_cache_lock:
+        entry = _catalog_cache.get(key)
+        if entry is None:
+            return None
+        cached_version, expires_at, body, encoded = entry
+        if cached_version != version or expires_at < time.monotonic():
+            del _catalog_cache[key]
+            return None
+        _catalog_cache.move_to_end(key)
+        return body, encoded
+
+def put_cached_catalog(key: tuple, version: int, body: str) -> dict:
+    """Сохранение ответа в кэш с вытеснением самых давно использованных записей; возвращает словарь для сжатых вариантов"""
+    encoded = {}
+    with _catalog_cache_lock:
+        _catalog_cache[key] = (version, time.monotonic() + CATALOG_CACHE_TTL, body, encoded)
+        _catalog_cache.move_to_end(key)
+        while len(_catalog_cache) > CATALOG_CACHE_SIZE:
+            _catalog_cache.popitem(last=False)
+    return encoded
+
+def invalidate_catalog_cache():
+    """Сброс кэша после изменения товаров в этом экземпляре функции"""
+    with _catalog_cache_lock:
+        _catalog_cache.clear()
+
+def serialize_product(p: dict, fields: tuple = None) -> dict:
+    """Товар в формате ответа API; fields — только перечисленные поля"""
+    if fields is not None:
+        product = {}
+        for field in fields:
+            if field == 'dimensions':
+                product[field] = {
+                    'length': p['dimension_length'],
+                    'width': p['dimension_width'],
+                    'height': p['dimension_height']
+                }
+            else:
+                product[field] = p[field]
+        return product
+    return {
+        'id': p['id'],
+        'name': p['name'],
+        'price': p['price'],
+        'images': p['images'],
+        'category': p['category'],
+        'material': p['material'],
+        'style': p['style'],
+        'color': p['color'],
+        'manufacturer': p['manufacturer'],
+        'description': p['description'],
+        'dimensions': {
+            'length': p['dimension_length'],
+            'width': p['dimension_width'],
+            'height': p['dimension_height']
+        }
+    }
+
+def parse_int(params: dict, name: str, default: int = None) -> int:
+    """Целочисленный параметр запроса"""
+    value = params.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}')
+
+def parse_fields(params: dict) -> tuple:
+    """Поля из fields=; без параметра — компактный вид списка"""
+    if not params.get('fields'):
+        return COMPACT_PRODUCT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in params['fields'].split(',') if field.strip()))
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}. Allowed: {", ".join(PRODUCT_FIELDS)}')
+    return fields
+
+def product_columns(fields: tuple, first_image_only: bool) -> str:
+    """Колонки SELECT под набор полей: непрошенные description и картинки не читаются из TOAST"""
+    # Колонки сортировки нужны внешнему ORDER BY, даже если их нет в ответе
+    columns = ['id', 'name', 'price', 'created_at']
+    for field in fields:
+        columns.extend(column for column in PRODUCT_FIELDS[field] if column not in columns)
+    return ', '.join('images[1:1] AS images' if column == 'images' and first_image_only else column for column in columns)
+
+def get_product(cur, params: dict):
+    """Один товар целиком для режима ?id=; None, если его нет"""
+    product_id = parse_int(params, 'id')
+    with phase('query'):
+        cur.execute(PRODUCTS_SELECT + ' WHERE id = %s', (product_id,))
+        row = cur.fetchone()
+    record_rows(1 if row else 0)
+    return serialize_product(row) if row else None
+
+def build_catalog_filters(params: dict, exclude: str = None) -> tuple:
+    """WHERE для каталога; exclude пропускает фильтр по одному фасету при подсчёте его значений"""
+    conditions = []
+    sql_params = []
+    
+    if params.get('q'):
+        pattern = '%' + params['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append('(name ILIKE %s OR description ILIKE %s)')
+        sql_params.extend([pattern, pattern])
+    
+    price_min = parse_int(params, 'priceMin')
+    if price_min is not None:
+        conditions.append('price >= %s')
+        sql_params.append(price_min)
+    
+    price_max = parse_int(params, 'priceMax')
+    if price_max is not None:
+        conditions.append('price <= %s')
+        sql_params.append(price_max)
+    
+    for facet in FACETS:
+        if facet != exclude and params.get(facet):
+            conditions.append(f'{facet} = ANY(%s)')
+            sql_params.append(params[facet].split(','))
+    
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return where, sql_params
+
+def build_catalog_queries(params: dict) -> dict:
+    """SQL страницы каталога и счётчиков фасетов; запросы независимы друг от друга"""
+    sort = params.get('sort') or 'id'
+    if sort not in SORTS:
+        raise ValueError(f'Invalid sort. Allowed: {", ".join(SORTS)}')
+    limit = parse_int(params, 'limit', DEFAULT_LIMIT)
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    offset = parse_int(params, 'offset', 0)
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    
+    fields = parse_fields(params)
+    columns = product_columns(fields, first_image_only=not params.get('fields'))
+    
+    where, sql_params = build_catalog_filters(params)
+    page_sql = f'''
+        SELECT {columns} FROM products{where}
+        ORDER BY {SORTS[sort]}
+        LIMIT %s OFFSET %s
+    '''
+    
+    # Счётчики фасета считаются без его собственного фильтра, чтобы были видны альтернативы
+    facet_queries = []
+    facet_params = []
+    for facet in FACETS:
+        facet_where, facet_sql_params = build_catalog_filters(params, exclude=facet)
+        facet_queries.append(
+            f"SELECT '{facet}' AS facet, {facet} AS value, COUNT(*) AS count FROM products{facet_where} GROUP BY {facet}"
+        )
+        facet_params.extend(facet_sql_params)
+    # total в запросе фасетов, а не COUNT(*) OVER() страницы: страница за концом выдачи пуста, а total нужен и ей
+    facet_queries.append(f"SELECT 'total' AS facet, NULL AS value, COUNT(*) AS count FROM products{where}")
+    facet_params.extend(sql_params)
+    
+    return {
+        'fields': fields,
+        'limit': limit,
+        'offset': offset,
+        'page': (page_sql, sql_params + [limit, offset]),
+        'facets': (' UNION ALL '.join(facet_queries), facet_params)
+    }
+
+def catalog_result(query: dict, rows: list, facet_rows: list) -> dict:
+    """Ответ каталога из строк страницы и счётчиков фасетов"""
+    facets = {facet: {} for facet in FACETS}
+    total = 0
+    for row in facet_rows:
+        if row['facet'] == 'total':
+            total = row['count']
+        else:
+            facets[row['facet']][row['value']] = row['count']
+    
+    with phase('serialize'):
+        products = [serialize_product(p, query['fields']) for p in rows]
+    
+    return {
+        'products': products,
+        'total': total,
+        'limit': query['limit'],
+        'offset': query['offset'],
+        'facets': facets
+    }
+
+def query_catalog(cur, params: dict) -> dict:
+    """Страница каталога, общее число найденных товаров и счётчики по фасетам"""
+    query = build_catalog_queries(params)
+    with phase('query'):
+        cur.execute(*query['page'])
+        rows = cur.fetchall()
+    record_rows(len(rows))
+    
+    with phase('facets'):
+        cur.execute(*query['facets'])
+        facet_rows = cur.fetchall()
+    
+    return catalog_result(query, rows, facet_rows)
+
+async def query_catalog_async(pool, params: dict) -> dict:
+    """То же на asyncpg: страница и фасеты идут параллельно на двух соединениях пула"""
+    import asyncio
+    
+    query = build_catalog_queries(params)
+    
+    async def fetch(name: str, sql: str, sql_params: list) -> list:
+        with phase(name):
+            return await pool.fetch(to_asyncpg(sql), *sql_params)
+    
+    rows, facet_rows = await asyncio.gather(fetch('query', *query['page']), fetch('facets', *query['facets']))
+    record_rows(len(rows))
+    return catalog_result(query, rows, facet_rows)
+
+BULK_FORMATS = ('ndjson', 'csv')
+BULK_COLUMNS = (
+    'row_num', 'id', 'name', 'price', 'images', 'category', 'material', 'style', 'color',
+    'manufacturer', 'description', 'dimension_length', 'dimension_width', 'dimension_height'
+)
+CSV_FIELDS = (
+    'id', 'name', 'price', 'images', 'category', 'material', 'style', 'color',
+    'manufacturer', 'description', 'length', 'width', 'height'
+)
+
+def parse_bulk_products(raw_body: str, bulk_format: str, parsed) -> list:
+    """Товары для массовой загрузки в формате тела POST; в CSV картинки разделяются символом |"""
+    if bulk_format == 'ndjson':
+        rows = []
+        for line in raw_body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+    
+    if bulk_format == 'csv':
+        import csv
+        
+        rows = []
+        for record in csv.DictReader(io.StringIO(raw_body)):
+            rows.append({
+                'id': record.get('id') or None,
+                'name': record.get('name'),
+                'price': record.get('price'),
+                'images': [url for url in (record.get('images') or '').split('|') if url],
+                'category': record.get('category'),
+                'material': record.get('material'),
+                'style': record.get('style'),
+                'color': record.get('color'),
+                'manufacturer': record.get('manufacturer'),
+                'description': record.get('description'),
+                'dimensions': {
+                    'length': record.get('length'),
+                    'width': record.get('width'),
+                    'height': record.get('height')
+                }
+            })
+        return rows
+    
+    return parsed
+
+# Ограничения столбцов products: строка, которая в них не влезет, отклоняется до COPY, а не роняет всю загрузку
+BULK_TEXT_LIMITS = {
+    'name': 255, 'category': 100, 'material': 100, 'style': 100, 'color': 100,
+    'manufacturer': 255, 'description': None
+}
+PG_INTEGER_MAX = 2 ** 31 - 1
+
+def bulk_integer(value, field: str) -> int:
+    """Значение для столбца INTEGER; bool, дробные и числа вне диапазона отклоняются"""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f'{field} must be an integer')
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be an integer')
+    if not -PG_INTEGER_MAX - 1 <= number <= PG_INTEGER_MAX:
+        raise ValueError(f'{field} is out of range')
+    return number
+
+def validate_bulk_product(row_num: int, item) -> tuple:
+    """Строка для staging-таблицы; ValueError с причиной отказа для некорректного товара"""
+    if not isinstance(item, dict):
+        raise ValueError('Invalid product record')
+    dimensions = item.get('dimensions')
+    if not isinstance(dimensions, dict):
+        raise ValueError('dimensions must be an object')
+    product_id = bulk_integer(item['id'], 'id') if item.get('id') is not None else None
+    if product_id is not None and product_id < 1:
+        raise ValueError('id must be positive')
+    price = bulk_integer(item.get('price'), 'price')
+    sizes = [bulk_integer(dimensions.get(key), f'dimensions.{key}') for key in ('length', 'width', 'height')]
+    
+    text_fields = []
+    for field, limit in BULK_TEXT_LIMITS.items():
+        value = item.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'Missing {field}')
+        if limit and len(value) > limit:
+            raise ValueError(f'{field} is too long: max {limit} characters')
+        # NUL не допускается в текстовых столбцах Postgres
+        if '\x00' in value:
+            raise ValueError(f'{field} contains a NUL character')
+        text_fields.append(value)
+    
+    images = item.get('images')
+    if not isinstance(images, list) or not images or not all(isinstance(url, str) and url and '\x00' not in url for url in images):
+        raise ValueError('images must be a non-empty list of URLs')
+    
+    name, category, material, style, color, manufacturer, description = text_fields
+    return (
+        row_num, product_id, name, price, json.dumps(images), category, material, style, color,
+        manufacturer, description, *sizes
+    )
+
+def bulk_upsert_products(cur, items: list) -> dict:
+    """Загрузка товаров через COPY во временную таблицу и upsert в products одним запросом"""
+    import csv
+    
+    results = {}
+    staged = io.StringIO()
+    writer = csv.writer(staged)
+    seen_ids = set()
+    
+    for row_num, item in enumerate(items):
+        try:
+            row = validate_bulk_product(row_num, item)
+        except ValueError as e:
+            results[row_num] = {'row': row_num, 'status': 'rejected', 'error': str(e)}
+            continue
+        if row[1] is not None:
+            if row[1] in seen_ids:
+                results[row_num] = {'row': row_num, 'status': 'rejected', 'error': 'Duplicate id in payload'}
+                continue
+            seen_ids.add(row[1])
+        writer.writerow(row)
+    
+    cur.execute(
+        '''
+        CREATE TEMP TABLE products_staging (
+            row_num INTEGER PRIMARY KEY,
+            id INTEGER,
+            name VARCHAR(255),
+            price INTEGER,
+            images TEXT,
+            category VARCHAR(100),
+            material VARCHAR(100),
+            style VARCHAR(100),
+            color VARCHAR(100),
+            manufacturer VARCHAR(255),
+            description TEXT,
+            dimension_length INTEGER,
+            dimension_width INTEGER,
+            dimension_height INTEGER
+        ) ON COMMIT DROP
+        '''
+    )
+    staged.seek(0)
+    cur.copy_expert(f"COPY products_staging ({', '.join(BULK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", staged)
+    
+    # Обновлять можно только существующие товары: явный id новой строки сломал бы последовательность
+    cur.execute(
+        '''
+        DELETE FROM products_staging s
+        WHERE s.id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM products p WHERE p.id = s.id)
+        RETURNING row_num
+        '''
+    )
+    for row in cur.fetchall():
+        results[row['row_num']] = {'row': row['row_num'], 'status': 'rejected', 'error': 'Product not found'}
+    
+    cur.execute("UPDATE products_staging SET id = nextval(pg_get_serial_sequence('products', 'id')) WHERE id IS NULL")
+    cur.execute(
+        '''
+        INSERT INTO products (
+            id, name, price, images, category, material, style, color,
+            manufacturer, description,
+            dimension_length, dimension_width, dimension_height
+        )
+        SELECT
+            id, name, price, ARRAY(SELECT jsonb_array_elements_text(images::jsonb)), category, material, style, color,
+            manufacturer, description,
+            dimension_length, dimension_width, dimension_height
+        FROM products_staging
+        ON CONFLICT (id) DO UPDATE SET
+            name = EXCLUDED.name,
+            price = EXCLUDED.price,
+            images = EXCLUDED.images,
+            category = EXCLUDED.category,
+            material = EXCLUDED.material,
+            style = EXCLUDED.style,
+            color = EXCLUDED.color,
+            manufacturer = EXCLUDED.manufacturer,
+            description = EXCLUDED.description,
+            dimension_length = EXCLUDED.dimension_length,
+            dimension_width = EXCLUDED.dimension_width,
+            dimension_height = EXCLUDED.dimension_height,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING id, (xmax = 0) AS created
+        '''
+    )
+    upserted = {row['id']: row['created'] for row in cur.fetchall()}
+    
+    cur.execute('SELECT row_num, id FROM products_staging')
+    for row in cur.fetchall():
+        status = 'created' if upserted[row['id']] else 'updated'
+        results[row['row_num']] = {'row': row['row_num'], 'status': status, 'id': row['id']}
+    
+    ordered = [results[row_num] for row_num in sorted(results)]
+    return {
+        'created': sum(1 for r in ordered if r['status'] == 'created'),
+        'updated': sum(1 for r in ordered if r['status'] == 'updated'),
+        'rejected': sum(1 for r in ordered if r['status'] == 'rejected'),
+        'results': ordered
+    }
+
+@instrumented('products')
 def handler(event: dict, context) -> dict:
     """API для управления товарами (получение, создание, обновление, удаление)"""
     method = event.get('httpMethod', 'GET')
@@ -17,64 +883,114 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Min-Lsn'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
     try:
-        conn = get_db_connection()
+        conn = get_read_connection(event) if method == 'GET' else get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
-            # Получение всех товаров
-            cur.execute('''
-                SELECT 
-                    id, name, price, images, category, material, style, color, 
-                    manufacturer, description,
-                    dimension_length, dimension_width, dimension_height,
-                    created_at, updated_at
-                FROM products
-                ORDER BY id
-            ''')
-            products = cur.fetchall()
+            params = event.get('queryStringParameters') or {}
+            cache_key = catalog_cache_key(params)
+            cur.execute('SELECT version FROM catalog_version WHERE id = 1')
+            version = cur.fetchone()['version']
             
-            # Преобразуем в нужный формат
-            result = []
-            for p in products:
-                result.append({
-                    'id': p['id'],
-                    'name': p['name'],
-                    'price': p['price'],
-                    'images': p['images'],
-                    'category': p['category'],
-                    'material': p['material'],
-                    'style': p['style'],
-                    'color': p['color'],
-                    'manufacturer': p['manufacturer'],
-                    'description': p['description'],
-                    'dimensions': {
-                        'length': p['dimension_length'],
-                        'width': p['dimension_width'],
-                        'height': p['dimension_height']
-                    }
-                })
+            etag = catalog_etag(cache_key, version)
+            if etag_matches(event, etag):
+                return {
+                    'statusCode': 304,
+                    'headers': {
+                        'ETag': etag,
+                        'Cache-Control': CATALOG_CACHE_CONTROL,
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': '',
+                    'isBase64Encoded': False
+                }
             
-            return {
+            cached = get_cached_catalog(cache_key, version)
+            if cached is not None:
+                response_body, encoded = cached
+            else:
+                if params.get('id'):
+                    # Карточка одного товара со всеми полями
+                    result = get_product(cur, params)
+                    if result is None:
+                        return {
+                            'statusCode': 404,
+                            'headers': {
+                                'Content-Type': 'application/json',
+                                'Access-Control-Allow-Origin': '*'
+                            },
+                            'body': json.dumps({'error': 'Product not found'}),
+                            'isBase64Encoded': False
+                        }
+                elif cache_key:
+                    # Страница каталога с фильтрами и счётчиками фасетов
+                    result = query_catalog(cur, params)
+                elif JSON_SERIALIZATION == 'postgres':
+                    # Все товары: массив JSON собирает база
+                    with phase('query'):
+                        cur.execute(PRODUCTS_JSON_ARRAY)
+                        row = cur.fetchone()
+                    record_rows(row['rows_count'])
+                    result = None
+                    response_body = row['body']
+                else:
+                    # Получение всех товаров
+                    with phase('query'):
+                        cur.execute(PRODUCTS_SELECT + ' ORDER BY id')
+                        rows = cur.fetchall()
+                    record_rows(len(rows))
+                    with phase('serialize'):
+                        result = [serialize_product(p) for p in rows]
+                if result is not None:
+                    with phase('json'):
+                        response_body = json.dumps(result)
+                encoded = put_cached_catalog(cache_key, version, response_body)
+            
+            return compress_response(event, {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
+                    'ETag': etag,
+                    'Cache-Control': CATALOG_CACHE_CONTROL,
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps(result),
+                'body': response_body,
                 'isBase64Encoded': False
-            }
+            }, memo=encoded)
         
         elif method == 'POST':
-            # Создание нового товара
-            body = json.loads(event.get('body', '{}'))
+            params = event.get('queryStringParameters') or {}
+            raw_body = event.get('body') or '{}'
+            bulk_format = params.get('format')
+            body = None if bulk_format in BULK_FORMATS else json.loads(raw_body)
+            
+            if body is None or isinstance(body, list):
+                # Массовая загрузка: JSON-массив, NDJSON или CSV
+                with phase('query'):
+                    result = bulk_upsert_products(cur, parse_bulk_products(raw_body, bulk_format, body))
+                    conn.commit()
+                record_rows(result['created'] + result['updated'])
+                invalidate_catalog_cache()
+                
+                return compress_response(event, {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*',
+                        **write_lsn_headers(conn)
+                    },
+                    'body': json.dumps(result),
+                    'isBase64Encoded': False
+                })
             
+            # Создание нового товара
             cur.execute('''
                 INSERT INTO products (
                     name, price, images, category, material, style, color,
@@ -99,12 +1015,14 @@ def handler(event: dict, context) -> dict:
             
             new_id = cur.fetchone()['id']
             conn.commit()
+            invalidate_catalog_cache()
             
             return {
                 'statusCode': 201,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    **write_lsn_headers(conn)
                 },
                 'body': json.dumps({'id': new_id, 'message': 'Product created'}),
                 'isBase64Encoded': False
@@ -148,12 +1066,14 @@ def handler(event: dict, context) -> dict:
             ))
             
             conn.commit()
+            invalidate_catalog_cache()
             
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    **write_lsn_headers(conn)
                 },
                 'body': json.dumps({'message': 'Product updated'}),
                 'isBase64Encoded': False
@@ -166,12 +1086,14 @@ def handler(event: dict, context) -> dict:
             
             cur.execute('DELETE FROM products WHERE id = %s', (product_id,))
             conn.commit()
+            invalidate_catalog_cache()
             
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    **write_lsn_headers(conn)
                 },
                 'body': json.dumps({'message': 'Product deleted'}),
                 'isBase64Encoded': False
@@ -187,6 +1109,17 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
     
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -202,4 +1135,103 @@ def handler(event: dict, context) -> dict:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            release_db_connection(conn)
+
+@instrumented_async('products')
+async def handler_async(event: dict, context) -> dict:
+    """Чтение каталога на asyncpg: страница и фасеты параллельно, много запросов на процесс; запись и OPTIONS — handler в потоке"""
+    import asyncio
+    
+    if event.get('httpMethod', 'GET') != 'GET':
+        return await asyncio.to_thread(handler.__wrapped__, event, context)
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        pool = await get_async_read_pool(event)
+        cache_key = catalog_cache_key(params)
+        version = await pool.fetchval('SELECT version FROM catalog_version WHERE id = 1')
+        
+        etag = catalog_etag(cache_key, version)
+        if etag_matches(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': {
+                    'ETag': etag,
+                    'Cache-Control': CATALOG_CACHE_CONTROL,
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': '',
+                'isBase64Encoded': False
+            }
+        
+        cached = get_cached_catalog(cache_key, version)
+        if cached is not None:
+            response_body, encoded = cached
+        else:
+            result = None
+            if params.get('id'):
+                with phase('query'):
+                    row = await pool.fetchrow(to_asyncpg(PRODUCTS_SELECT + ' WHERE id = %s'), parse_int(params, 'id'))
+                if row is None:
+                    return {
+                        'statusCode': 404,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': 'Product not found'}),
+                        'isBase64Encoded': False
+                    }
+                record_rows(1)
+                result = serialize_product(row)
+            elif cache_key:
+                result = await query_catalog_async(pool, params)
+            elif JSON_SERIALIZATION == 'postgres':
+                with phase('query'):
+                    row = await pool.fetchrow(PRODUCTS_JSON_ARRAY)
+                record_rows(row['rows_count'])
+                response_body = row['body']
+            else:
+                with phase('query'):
+                    rows = await pool.fetch(PRODUCTS_SELECT + ' ORDER BY id')
+                record_rows(len(rows))
+                with phase('serialize'):
+                    result = [serialize_product(p) for p in rows]
+            if result is not None:
+                with phase('json'):
+                    response_body = json.dumps(result)
+            encoded = put_cached_catalog(cache_key, version, response_body)
+        
+        return compress_response(event, {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'ETag': etag,
+                'Cache-Control': CATALOG_CACHE_CONTROL,
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': response_body,
+            'isBase64Encoded': False
+        }, memo=encoded)
+    
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
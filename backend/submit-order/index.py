@@ -1,34 +1,163 @@
+import functools
+import hashlib
 import json
 import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 import psycopg2
-from psycopg2.extras import Json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
-def send_email(subject: str, body: str):
-    '''Отправка email на shika_room@bk.ru'''
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', '587'))
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
-    
-    recipient = 'shika_room@bk.ru'
-    
-    msg = MIMEMultipart()
-    msg['From'] = smtp_user
-    msg['To'] = recipient
-    msg['Subject'] = subject
-    
-    msg.attach(MIMEText(body, 'plain', 'utf-8'))
-    
-    with smtplib.SMTP(smtp_host, smtp_port) as server:
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-
-def send_order_email(order_id: int, customer: dict, items: list, total: float):
-    '''Отправка уведомления о новом заказе'''
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    '''Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога'''
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    '''Учёт прочитанных или записанных строк для структурного лога'''
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    '''Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile'''
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    '''Конец вызова: заголовки Server-Timing и одна JSON-строка лога'''
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    '''Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+_pool = None
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}
+
+def _is_alive(conn) -> bool:
+    '''Проверка, что соединение из пула не разорвано сервером'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    '''Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются'''
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection():
+    '''Соединение из пула, который переживает тёплые вызовы функции; при занятом пуле вызов ждёт до DB_POOL_TIMEOUT'''
+    global _pool
+    with phase('connect'):
+        if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            if _pool is None or _pool.closed:
+                _pool = ThreadedConnectionPool(0, DB_POOL_MAX, os.environ['DATABASE_URL'])
+            conn = _pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                _pool.putconn(conn, close=True)
+                conn = _pool.getconn()
+        except Exception:
+            _slots.release()
+            raise
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    '''Возврат соединения в пул; закрытые и сломанные соединения выбрасываются'''
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    _pool.putconn(conn, close=broken)
+    _slots.release()
+
+NOTIFY_RECIPIENT = 'shika_room@bk.ru'
+
+def queue_email(cur, subject: str, body: str):
+    '''Постановка письма в email_outbox в текущей транзакции; отправляет функция email-outbox'''
+    cur.execute(
+        'INSERT INTO email_outbox (recipient, subject, body) VALUES (%s, %s, %s)',
+        (NOTIFY_RECIPIENT, subject, body)
+    )
+
+def order_email(order_id: int, customer: dict, items: list, total: float) -> tuple:
+    '''Тема и текст уведомления о новом заказе'''
     items_text = '\n'.join([
         f"  - {item['name']} x {item['quantity']} шт. = {item['price'] * item['quantity']} ₽"
         for item in items
@@ -48,8 +177,235 @@ def send_order_email(order_id: int, customer: dict, items: list, total: float):
 
 Итого: {total} ₽
 """
-    send_email(f'Новый заказ #{order_id}', body)
+    return f'Новый заказ #{order_id}', body
+
+def queue_order_email(cur, order_id: int, customer: dict, items: list, total: float):
+    '''Уведомление о новом заказе'''
+    queue_email(cur, *order_email(order_id, customer, items, total))
+
+MAX_ORDER_LINES = int(os.environ.get('MAX_ORDER_LINES', '200'))
+
+def parse_cart(items) -> dict:
+    '''Количества по id товара из корзины клиента; цены и названия клиента не учитываются'''
+    if not isinstance(items, list) or not items:
+        raise ValueError('Cart is empty')
+    if len(items) > MAX_ORDER_LINES:
+        raise ValueError(f'Too many items in cart: max {MAX_ORDER_LINES}')
+    quantities = {}
+    for item in items:
+        try:
+            product_id = int(item['id'])
+            quantity = int(item.get('quantity', 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError('Invalid cart item')
+        if quantity < 1:
+            raise ValueError('Invalid quantity')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+def price_cart(cur, quantities: dict) -> tuple:
+    '''Позиции по текущим ценам из products одним запросом и итог заказа; третий элемент — id, которых нет в каталоге'''
+    cur.execute('SELECT id, name, price FROM products WHERE id = ANY(%s)', (list(quantities),))
+    products = {product_id: (name, price) for product_id, name, price in cur.fetchall()}
+    missing = [product_id for product_id in quantities if product_id not in products]
+    
+    # В orders.items — только ссылка на товар, количество и цена на момент заказа; название нужно списку заказов и аналитике
+    items = [
+        {'id': product_id, 'name': products[product_id][0], 'price': products[product_id][1], 'quantity': quantity}
+        for product_id, quantity in quantities.items()
+        if product_id in products
+    ]
+    total = sum(item['price'] * item['quantity'] for item in items)
+    return items, total, missing
+
+def order_response(order_id: int, total, created_at) -> str:
+    '''Тело ответа о принятом заказе; его же получают повторы с тем же Idempotency-Key'''
+    return json.dumps({
+        'success': True,
+        'orderId': order_id,
+        'total': total,
+        'createdAt': created_at.isoformat()
+    })
+
+def get_header(event: dict, name: str):
+    '''Заголовок запроса без учёта регистра имени'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_CLEANUP_BATCH = int(os.environ.get('IDEMPOTENCY_CLEANUP_BATCH', '5000'))
+MAX_IDEMPOTENCY_KEY = 255
+
+def request_hash(data: dict) -> str:
+    '''Отпечаток тела заказа: тот же ключ с другой корзиной или клиентом — ошибка клиента, а не повтор'''
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
 
+def claim_idempotency_key(cur, key: str, fingerprint: str):
+    '''Захват ключа в текущей транзакции; None — ключ наш, иначе (request_hash, status_code, response) прежнего запроса.
+    
+    Одновременный дубль ждёт на уникальном индексе, пока транзакция владельца не завершится:
+    после commit он получает сохранённый ответ, после rollback занимает ключ сам.
+    Истёкший ключ занимается заново, даже если фоновая очистка его ещё не удалила.
+    '''
+    cur.execute(
+        '''
+        INSERT INTO idempotency_keys (key, request_hash, expires_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+        ON CONFLICT (key)
+        DO UPDATE SET
+            request_hash = EXCLUDED.request_hash,
+            status_code = NULL,
+            response = NULL,
+            created_at = CURRENT_TIMESTAMP,
+            expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at < CURRENT_TIMESTAMP
+        RETURNING key
+        ''',
+        (key, fingerprint, IDEMPOTENCY_TTL)
+    )
+    if cur.fetchone():
+        return None
+    cur.execute('SELECT request_hash, status_code, response FROM idempotency_keys WHERE key = %s', (key,))
+    return cur.fetchone()
+
+def save_idempotent_response(cur, key: str, status_code: int, response: str):
+    '''Ответ для повторов; пишется до commit в той же транзакции, что и заказ'''
+    cur.execute(
+        'UPDATE idempotency_keys SET status_code = %s, response = %s WHERE key = %s',
+        (status_code, response, key)
+    )
+
+def delete_expired_idempotency_keys(conn) -> int:
+    '''Удаление пачки истёкших ключей по idx_idempotency_keys_expires_at'''
+    with conn.cursor() as cur:
+        cur.execute(
+            '''
+            DELETE FROM idempotency_keys
+            WHERE key IN (
+                SELECT key FROM idempotency_keys
+                WHERE expires_at < CURRENT_TIMESTAMP
+                ORDER BY expires_at
+                LIMIT %s
+            )
+            ''',
+            (IDEMPOTENCY_CLEANUP_BATCH,)
+        )
+        deleted = cur.rowcount
+    conn.commit()
+    return deleted
+
+# Строка orders попала в месяц без секции (секции DEFAULT нет): no partition of relation "orders" found for row
+NO_PARTITION_ERROR = '23514'
+
+def insert_orders(cur, insert, months: list = None):
+    '''Вставка в orders через insert(); если секции месяца нет (расписание orders-archive не отработало), создаются секции на months или текущий месяц и вставка повторяется'''
+    # Savepoint на отдельном курсоре: результат RETURNING на cur остаётся для fetchone
+    with cur.connection.cursor() as savepoint:
+        savepoint.execute('SAVEPOINT orders_insert')
+        try:
+            insert()
+        except psycopg2.Error as e:
+            if e.pgcode != NO_PARTITION_ERROR:
+                raise
+            savepoint.execute('ROLLBACK TO SAVEPOINT orders_insert')
+            try:
+                savepoint.execute(
+                    'SELECT create_orders_partition(month) FROM unnest(COALESCE(%s::date[], ARRAY[CURRENT_DATE])) AS month',
+                    (months,)
+                )
+            except psycopg2.Error:
+                # Ту же секцию одновременно создал другой вызов: после его коммита она уже видна
+                savepoint.execute('ROLLBACK TO SAVEPOINT orders_insert')
+            insert()
+        savepoint.execute('RELEASE SAVEPOINT orders_insert')
+
+INGEST_MODE = os.environ.get('ORDER_INGEST_MODE', 'direct')
+INTAKE_BATCH_SIZE = int(os.environ.get('ORDER_INTAKE_BATCH_SIZE', '500'))
+INTAKE_DRAIN_TIME_LIMIT = float(os.environ.get('ORDER_INTAKE_DRAIN_TIME_LIMIT', '20'))
+# Ключ pg_try_advisory_xact_lock: пачки из order_intake переносит только один вызов за раз
+INTAKE_LOCK_KEY = 170017
+
+def drain_intake(conn) -> int:
+    '''Перенос пачки заказов из order_intake в orders с одним upsert на телефон; 0, если переносит другой вызов'''
+    from psycopg2.extras import execute_values
+    
+    cur = conn.cursor()
+    try:
+        cur.execute('SELECT pg_try_advisory_xact_lock(%s)', (INTAKE_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return 0
+        
+        cur.execute(
+            '''
+            DELETE FROM order_intake
+            WHERE id IN (SELECT id FROM order_intake ORDER BY id LIMIT %s)
+            RETURNING id, order_id, last_name, first_name, middle_name, phone, city, address, items, total, created_at
+            ''',
+            (INTAKE_BATCH_SIZE,)
+        )
+        rows = sorted(cur.fetchall())
+        if not rows:
+            conn.rollback()
+            return 0
+        
+        # Приращения счётчиков по телефону; контактные данные — из последнего заказа, как в прямом режиме
+        customers = {}
+        for _, _, last_name, first_name, middle_name, phone, city, address, _, total, _ in rows:
+            orders_count, spent = customers.get(phone, (0, 0))[-2:]
+            customers[phone] = (last_name, first_name, middle_name, phone, city, address, orders_count + 1, spent + total)
+        
+        execute_values(
+            cur,
+            '''
+            INSERT INTO customers (last_name, first_name, middle_name, phone, city, address, total_orders, total_spent)
+            VALUES %s
+            ON CONFLICT (phone)
+            DO UPDATE SET
+                last_name = EXCLUDED.last_name,
+                first_name = EXCLUDED.first_name,
+                middle_name = EXCLUDED.middle_name,
+                city = EXCLUDED.city,
+                address = EXCLUDED.address,
+                total_orders = customers.total_orders + EXCLUDED.total_orders,
+                total_spent = customers.total_spent + EXCLUDED.total_spent,
+                updated_at = CURRENT_TIMESTAMP
+            ''',
+            [customers[phone] for phone in sorted(customers)],
+            page_size=len(customers)
+        )
+        insert_orders(cur, lambda: execute_values(
+            cur,
+            '''
+            INSERT INTO orders (id, last_name, first_name, middle_name, phone, city, address, items, total, created_at)
+            VALUES %s
+            ''',
+            [(*row[1:8], json.dumps(row[8], ensure_ascii=False), row[9], row[10]) for row in rows],
+            template='(%s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s, %s)',
+            page_size=len(rows)
+        ), sorted({row[10].date() for row in rows}))
+        
+        emails = []
+        for _, order_id, last_name, first_name, middle_name, phone, city, address, items, total, _ in rows:
+            customer = {
+                'lastName': last_name, 'firstName': first_name, 'middleName': middle_name or '',
+                'phone': phone, 'city': city, 'address': address
+            }
+            emails.append((NOTIFY_RECIPIENT, *order_email(order_id, customer, items, total)))
+        execute_values(cur, 'INSERT INTO email_outbox (recipient, subject, body) VALUES %s', emails, page_size=len(emails))
+        
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+@instrumented('submit-order')
 def handler(event: dict, context) -> dict:
     '''API для отправки заказа и обработки формы обратной связи'''
     method = event.get('httpMethod', 'POST')
@@ -60,7 +416,7 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
             },
             'body': '',
             'isBase64Encoded': False
@@ -83,6 +439,7 @@ def handler(event: dict, context) -> dict:
     message_type = data.get('type', 'order')
     
     if message_type == 'contact':
+        conn = None
         try:
             name = data.get('name', '')
             email = data.get('email', '')
@@ -106,7 +463,12 @@ Email: {email}
 Сообщение:
 {message}
 """
-            send_email(f'Новое сообщение с сайта от {name}', body)
+            conn = get_db_connection()
+            cur = conn.cursor()
+            with phase('query'):
+                queue_email(cur, f'Новое сообщение с сайта от {name}', body)
+                conn.commit()
+            record_rows(1)
             
             return {
                 'statusCode': 200,
@@ -115,16 +477,54 @@ Email: {email}
                 'isBase64Encoded': False
             }
         except Exception as e:
+            if conn:
+                conn.rollback()
             return {
                 'statusCode': 500,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'error': f'Ошибка отправки: {str(e)}'}),
                 'isBase64Encoded': False
             }
+        finally:
+            if conn:
+                cur.close()
+                release_db_connection(conn)
+    
+    if message_type == 'drain':
+        # Вызов по расписанию: дренирование order_intake, если ORDER_INGEST_MODE=batched, и очистка истёкших Idempotency-Key
+        conn = None
+        try:
+            conn = get_db_connection()
+            drained = 0
+            started = time.monotonic()
+            with phase('drain'):
+                while time.monotonic() - started < INTAKE_DRAIN_TIME_LIMIT:
+                    batch = drain_intake(conn)
+                    drained += batch
+                    if batch < INTAKE_BATCH_SIZE:
+                        break
+            with phase('cleanup'):
+                expired_keys = delete_expired_idempotency_keys(conn)
+            record_rows(drained + expired_keys)
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'drained': drained, 'expiredKeys': expired_keys}),
+                'isBase64Encoded': False
+            }
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
+        finally:
+            if conn:
+                release_db_connection(conn)
     
     customer = data.get('customer', {})
-    items = data.get('items', [])
-    total = data.get('total', 0)
     
     if not all([customer.get('lastName'), customer.get('firstName'), customer.get('phone'), customer.get('city'), customer.get('address')]):
         return {
@@ -137,66 +537,156 @@ Email: {email}
             'isBase64Encoded': False
         }
     
+    try:
+        quantities = parse_cart(data.get('items'))
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    idempotency_key = (get_header(event, 'Idempotency-Key') or '').strip()
+    if len(idempotency_key) > MAX_IDEMPOTENCY_KEY:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Idempotency-Key is too long: max {MAX_IDEMPOTENCY_KEY}'}),
+            'isBase64Encoded': False
+        }
+    
     conn = None
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_db_connection()
         cur = conn.cursor()
         
-        cur.execute(
-            '''
-            INSERT INTO customers (last_name, first_name, middle_name, phone, city, address, total_orders, total_spent)
-            VALUES (%s, %s, %s, %s, %s, %s, 1, %s)
-            ON CONFLICT (phone) 
-            DO UPDATE SET 
-                last_name = EXCLUDED.last_name,
-                first_name = EXCLUDED.first_name,
-                middle_name = EXCLUDED.middle_name,
-                city = EXCLUDED.city,
-                address = EXCLUDED.address,
-                total_orders = customers.total_orders + 1,
-                total_spent = customers.total_spent + EXCLUDED.total_spent,
-                updated_at = CURRENT_TIMESTAMP
-            RETURNING id
-            ''',
-            (
-                customer['lastName'],
-                customer['firstName'],
-                customer.get('middleName', ''),
-                customer['phone'],
-                customer['city'],
-                customer['address'],
-                total
-            )
-        )
+        if idempotency_key:
+            # Повтор отвечается сохранённым ответом до любых записей в customers и orders
+            fingerprint = request_hash(data)
+            with phase('idempotency'):
+                previous = claim_idempotency_key(cur, idempotency_key, fingerprint)
+            if previous:
+                conn.rollback()
+                stored_hash, status_code, response = previous
+                if stored_hash != fingerprint:
+                    return {
+                        'statusCode': 422,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Idempotency-Key was already used with a different request'}),
+                        'isBase64Encoded': False
+                    }
+                return {
+                    'statusCode': status_code,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*',
+                        'Access-Control-Expose-Headers': 'Idempotent-Replayed',
+                        'Idempotent-Replayed': 'true'
+                    },
+                    'body': response,
+                    'isBase64Encoded': False
+                }
         
-        customer_id = cur.fetchone()[0]
+        # Цены и итог считает сервер: items[].price и total из запроса не используются
+        with phase('prices'):
+            items, total, missing = price_cart(cur, quantities)
+        record_rows(len(items))
+        if missing:
+            conn.rollback()
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Unknown products', 'productIds': missing}),
+                'isBase64Encoded': False
+            }
         
-        cur.execute(
-            '''
-            INSERT INTO orders (last_name, first_name, middle_name, phone, city, address, items, total)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id, created_at
-            ''',
-            (
-                customer['lastName'],
-                customer['firstName'],
-                customer.get('middleName', ''),
-                customer['phone'],
-                customer['city'],
-                customer['address'],
-                Json(items),
-                total
-            )
-        )
+        if INGEST_MODE == 'batched':
+            # Заказ надёжно записан в order_intake и номер уже выдан; в orders его пачкой перенесёт drain_intake
+            with phase('query'):
+                cur.execute(
+                    '''
+                    INSERT INTO order_intake (order_id, last_name, first_name, middle_name, phone, city, address, items, total)
+                    VALUES (nextval(pg_get_serial_sequence('orders', 'id')), %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING order_id, created_at
+                    ''',
+                    (
+                        customer['lastName'],
+                        customer['firstName'],
+                        customer.get('middleName', ''),
+                        customer['phone'],
+                        customer['city'],
+                        customer['address'],
+                        json.dumps(items, ensure_ascii=False),
+                        total
+                    )
+                )
+                order_id, created_at = cur.fetchone()
+                response_body = order_response(order_id, total, created_at)
+                if idempotency_key:
+                    save_idempotent_response(cur, idempotency_key, 200, response_body)
+                conn.commit()
+            record_rows(1)
+            
+            with phase('drain'):
+                try:
+                    record_rows(drain_intake(conn))
+                except psycopg2.Error:
+                    # Заказ уже принят: пачку заберёт следующий вызов или дренирование по расписанию
+                    pass
+        else:
+            with phase('query'):
+                cur.execute(
+                    '''
+                    INSERT INTO customers (last_name, first_name, middle_name, phone, city, address, total_orders, total_spent)
+                    VALUES (%s, %s, %s, %s, %s, %s, 1, %s)
+                    ON CONFLICT (phone) 
+                    DO UPDATE SET 
+                        last_name = EXCLUDED.last_name,
+                        first_name = EXCLUDED.first_name,
+                        middle_name = EXCLUDED.middle_name,
+                        city = EXCLUDED.city,
+                        address = EXCLUDED.address,
+                        total_orders = customers.total_orders + 1,
+                        total_spent = customers.total_spent + EXCLUDED.total_spent,
+                        updated_at = CURRENT_TIMESTAMP
+                    ''',
+                    (
+                        customer['lastName'],
+                        customer['firstName'],
+                        customer.get('middleName', ''),
+                        customer['phone'],
+                        customer['city'],
+                        customer['address'],
+                        total
+                    )
+                )
         
-        order_id, created_at = cur.fetchone()
-        conn.commit()
+                insert_orders(cur, lambda: cur.execute(
+                    '''
+                    INSERT INTO orders (last_name, first_name, middle_name, phone, city, address, items, total)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, created_at
+                    ''',
+                    (
+                        customer['lastName'],
+                        customer['firstName'],
+                        customer.get('middleName', ''),
+                        customer['phone'],
+                        customer['city'],
+                        customer['address'],
+                        json.dumps(items, ensure_ascii=False),
+                        total
+                    )
+                ))
         
-        try:
-            send_order_email(order_id, customer, items, total)
-        except Exception as email_error:
-            pass
+                order_id, created_at = cur.fetchone()
+                queue_order_email(cur, order_id, customer, items, total)
+                response_body = order_response(order_id, total, created_at)
+                if idempotency_key:
+                    save_idempotent_response(cur, idempotency_key, 200, response_body)
+                conn.commit()
+            record_rows(3)
         
         return {
             'statusCode': 200,
@@ -204,11 +694,7 @@ Email: {email}
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({
-                'success': True,
-                'orderId': order_id,
-                'createdAt': created_at.isoformat()
-            }),
+            'body': response_body,
             'isBase64Encoded': False
         }
         
@@ -227,4 +713,4 @@ Email: {email}
     finally:
         if conn:
             cur.close()
-            conn.close()
\ No newline at end of file
+            release_db_connection(conn)
\ No newline at end of file
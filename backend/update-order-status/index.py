@@ -1,9 +1,280 @@
+import functools
 import json
 import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+_cold_start = True
+_timings = ContextVar('timings', default=None)
+
+@contextmanager
+def phase(name: str):
+    '''Замер фазы вызова (connect, query, serialize, json, ...) для Server-Timing и лога'''
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings['phases'][name] = timings['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def record_rows(count: int):
+    '''Учёт прочитанных или записанных строк для структурного лога'''
+    timings = _timings.get()
+    if timings is not None:
+        timings['rows'] += count
+
+def _start_call(profile: bool) -> tuple:
+    '''Начало вызова: отметка холодного старта, словарь замеров в контексте и выборочный cProfile'''
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    timings = {'phases': {}, 'rows': 0}
+    token = _timings.set(timings)
+    profiler = None
+    if profile and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return cold_start, timings, token, profiler, time.perf_counter()
+
+def _finish_call(name: str, event: dict, context, response, call: tuple):
+    '''Конец вызова: заголовки Server-Timing и одна JSON-строка лога'''
+    cold_start, timings, token, profiler, started = call
+    total = (time.perf_counter() - started) * 1000
+    if profiler is not None:
+        profiler.disable()
+    _timings.reset(token)
+    
+    server_timing = [f'{key};dur={value:.1f}' for key, value in timings['phases'].items()]
+    server_timing.append(f'total;dur={total:.1f}')
+    if response is not None:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': ', '.join(server_timing),
+            'Timing-Allow-Origin': '*'
+        }
+    
+    log = {
+        'handler': name,
+        'requestId': getattr(context, 'request_id', None),
+        'method': event.get('httpMethod'),
+        'status': response['statusCode'] if response is not None else 500,
+        'durationMs': round(total, 1),
+        'phases': {key: round(value, 1) for key, value in timings['phases'].items()},
+        'rows': timings['rows'],
+        'coldStart': cold_start
+    }
+    if profiler is not None and total >= PROFILE_SLOW_MS:
+        log['profile'] = os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof')
+        profiler.dump_stats(log['profile'])
+    print(json.dumps(log), flush=True)
+
+def instrumented(name: str):
+    '''Обёртка handler: Server-Timing, одна JSON-строка лога на вызов и выборочный cProfile медленных запросов'''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            call = _start_call(profile=True)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _finish_call(name, event, context, response, call)
+        return wrapper
+    return decorate
+
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+
+_pool = None
+# ThreadedConnectionPool при исчерпании бросает PoolError, а не ждёт: очередь на соединения держит семафор
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}
+
+def _is_alive(conn) -> bool:
+    '''Проверка, что соединение из пула не разорвано сервером'''
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _is_stale(conn) -> bool:
+    '''Соединение закрыто или долго простаивало и не отвечает; новые соединения не проверяются'''
+    last_used = _last_used.get(id(conn))
+    return bool(conn.closed) or (last_used is not None and time.monotonic() - last_used > DB_HEALTHCHECK_AFTER and not _is_alive(conn))
+
+def get_db_connection():
+    '''Соединение из пула, который переживает тёплые вызовы функции; при занятом пуле вызов ждёт до DB_POOL_TIMEOUT'''
+    global _pool
+    with phase('connect'):
+        if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError(f'No free database connection within {DB_POOL_TIMEOUT:g}s')
+        try:
+            if _pool is None or _pool.closed:
+                _pool = ThreadedConnectionPool(0, DB_POOL_MAX, os.environ['DATABASE_URL'])
+            conn = _pool.getconn()
+            while _is_stale(conn):
+                _last_used.pop(id(conn), None)
+                _pool.putconn(conn, close=True)
+                conn = _pool.getconn()
+        except Exception:
+            _slots.release()
+            raise
+        return conn
+
+def release_db_connection(conn, broken: bool = False):
+    '''Возврат соединения в пул; закрытые и сломанные соединения выбрасываются'''
+    broken = broken or bool(conn.closed)
+    if broken:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    _pool.putconn(conn, close=broken)
+    _slots.release()
+
+def write_lsn_headers(conn) -> dict:
+    '''Позиция WAL после коммита: админка передаёт её в X-Min-Lsn, чтобы следующее чтение не ушло на отстающую реплику'''
+    if not DATABASE_REPLICA_URL:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()')
+        lsn = cur.fetchone()[0]
+    conn.rollback()
+    return {'X-Write-Lsn': lsn, 'Access-Control-Expose-Headers': 'X-Write-Lsn'}
+
+ALLOWED_STATUSES = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled']
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '1000'))
+PG_INTEGER_MAX = 2 ** 31 - 1
+
+def validate_batch(updates) -> list:
+    '''Проверка всех изменений до обращения к базе; повтор одного заказа — побеждает последнее изменение'''
+    if not isinstance(updates, list) or not updates:
+        raise ValueError('updates must be a non-empty list')
+    if len(updates) > MAX_BATCH_SIZE:
+        raise ValueError(f'Too many updates, max {MAX_BATCH_SIZE}')
+    
+    by_order = {}
+    for index, update in enumerate(updates):
+        # bool — подкласс int: true/false не должны стать заказами 1 и 0
+        if not isinstance(update, dict) or type(update.get('orderId')) is not int:
+            raise ValueError(f'Update #{index}: missing orderId')
+        # Иначе ошибка случится на %s::integer внутри общего UPDATE и вся пачка получит 500
+        if not 1 <= update['orderId'] <= PG_INTEGER_MAX:
+            raise ValueError(f'Update #{index}: orderId out of range')
+        status = update.get('status')
+        notes = update.get('notes')
+        if status is not None and status not in ALLOWED_STATUSES:
+            raise ValueError(f'Update #{index}: invalid status. Allowed: {", ".join(ALLOWED_STATUSES)}')
+        if notes is not None and not isinstance(notes, str):
+            raise ValueError(f'Update #{index}: notes must be a string')
+        if status is None and notes is None:
+            raise ValueError(f'Update #{index}: no fields to update')
+        by_order[update['orderId']] = (update['orderId'], status, notes)
+    return list(by_order.values())
+
+def handle_batch(updates) -> dict:
+    '''Применение пачки изменений статусов и примечаний одним UPDATE ... FROM (VALUES ...) в одной транзакции'''
+    # Пачки редки, поэтому psycopg2.extras не грузится при холодном старте ради одиночных обновлений
+    from psycopg2.extras import execute_values
+    
+    try:
+        rows = validate_batch(updates)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        
+        with phase('query'):
+            updated = execute_values(
+                cur,
+                '''
+                UPDATE orders SET
+                    status = COALESCE(v.status, orders.status),
+                    notes = COALESCE(v.notes, orders.notes)
+                FROM (VALUES %s) AS v(id, status, notes)
+                WHERE orders.id = v.id
+                RETURNING orders.id, orders.status, orders.notes
+                ''',
+                rows,
+                template='(%s::integer, %s::varchar, %s::text)',
+                page_size=len(rows),
+                fetch=True
+            )
+            conn.commit()
+        record_rows(len(updated))
+        
+        found = {order_id: (status, notes) for order_id, status, notes in updated}
+        results = []
+        for order_id, _, _ in rows:
+            if order_id in found:
+                status, notes = found[order_id]
+                results.append({'orderId': order_id, 'result': 'updated', 'status': status, 'notes': notes or ''})
+            else:
+                results.append({'orderId': order_id, 'result': 'not_found'})
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                **write_lsn_headers(conn)
+            },
+            'body': json.dumps({
+                'success': True,
+                'updated': len(found),
+                'notFound': len(rows) - len(found),
+                'results': results
+            }),
+            'isBase64Encoded': False
+        }
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn:
+            cur.close()
+            release_db_connection(conn)
+
+@instrumented('update-order-status')
 def handler(event: dict, context) -> dict:
-    '''API для обновления статуса заказа и примечаний'''
+    '''API для обновления статуса и примечаний одного заказа или пачки заказов (updates)'''
     method = event.get('httpMethod', 'PUT')
     
     if method == 'OPTIONS':
@@ -32,11 +303,14 @@ def handler(event: dict, context) -> dict:
     body_str = event.get('body', '{}')
     data = json.loads(body_str)
     
+    if isinstance(data, list) or 'updates' in data:
+        return handle_batch(data if isinstance(data, list) else data['updates'])
+    
     order_id = data.get('orderId')
     new_status = data.get('status')
     notes = data.get('notes')
     
-    if not order_id:
+    if not order_id or isinstance(order_id, bool):
         return {
             'statusCode': 400,
             'headers': {
@@ -51,15 +325,14 @@ def handler(event: dict, context) -> dict:
     params = []
     
     if new_status is not None:
-        allowed_statuses = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled']
-        if new_status not in allowed_statuses:
+        if new_status not in ALLOWED_STATUSES:
             return {
                 'statusCode': 400,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': f'Invalid status. Allowed: {", ".join(allowed_statuses)}'}),
+                'body': json.dumps({'error': f'Invalid status. Allowed: {", ".join(ALLOWED_STATUSES)}'}),
                 'isBase64Encoded': False
             }
         updates.append('status = %s')
@@ -84,14 +357,14 @@ def handler(event: dict, context) -> dict:
     
     conn = None
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_db_connection()
         cur = conn.cursor()
         
         sql = f"UPDATE orders SET {', '.join(updates)} WHERE id = %s RETURNING id"
-        cur.execute(sql, params)
+        with phase('query'):
+            cur.execute(sql, params)
+            result = cur.fetchone()
         
-        result = cur.fetchone()
         if not result:
             return {
                 'statusCode': 404,
@@ -103,7 +376,9 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
-        conn.commit()
+        with phase('query'):
+            conn.commit()
+        record_rows(1)
         
         response_data = {'success': True, 'orderId': order_id}
         if new_status is not None:
@@ -115,7 +390,8 @@ def handler(event: dict, context) -> dict:
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+                'Access-Control-Allow-Origin': '*',
+                **write_lsn_headers(conn)
             },
             'body': json.dumps(response_data),
             'isBase64Encoded': False
@@ -136,4 +412,4 @@ def handler(event: dict, context) -> dict:
     finally:
         if conn:
             cur.close()
-            conn.close()
\ No newline at end of file
+            release_db_connection(conn)
\ No newline at end of file
@@ -0,0 +1,44 @@
+import importlib.util
+import os
+import statistics
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+def load_function(name: str):
+    '''Загрузка index.py облачной функции как отдельного модуля'''
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    spec = importlib.util.spec_from_file_location(f"fn_{name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def percentile(samples: list, share: float) -> float:
+    '''Перцентиль по отсортированному списку замеров'''
+    return samples[max(int(len(samples) * share) - 1, 0)]
+
+def summarize(samples: list) -> dict:
+    '''Сводка задержек в миллисекундах: p50, p95, p99 и максимум'''
+    samples = sorted(samples)
+    return {
+        'iterations': len(samples),
+        'p50': round(statistics.median(samples), 3),
+        'p95': round(percentile(samples, 0.95), 3),
+        'p99': round(percentile(samples, 0.99), 3),
+        'max': round(samples[-1], 3),
+    }
+
+def measure(fn, iterations: int) -> dict:
+    '''Запуск fn заданное число раз и сводка задержек в миллисекундах'''
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+def report(title: str, results: dict):
+    '''Печать результатов бенчмарка в виде таблицы'''
+    print(title)
+    for name, stats in results.items():
+        print(f"  {name:<28} p50={stats['p50']:>9.3f}ms  p95={stats['p95']:>9.3f}ms  max={stats['max']:>9.3f}ms")
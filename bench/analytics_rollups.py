@@ -0,0 +1,87 @@
+'''Отчёт analytics по агрегатам против наивной агрегации по orders.
+
+Заполняет orders синтетическими заказами (телефон bench-analytics) за два года,
+пересчитывает агрегаты и сравнивает время отчёта по месяцам с прямым
+GROUP BY по orders и разбором items. Синтетические заказы удаляются после замера.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture BENCH_ROWS=2000000 python bench/analytics_rollups.py
+'''
+import json
+import os
+import sys
+import time
+
+from _common import load_function, measure, report
+
+ROWS = int(os.environ.get('BENCH_ROWS', '2000000'))
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '5'))
+PHONE = 'bench-analytics'
+
+NAIVE_REVENUE = '''
+    SELECT date_trunc('month', created_at)::date, COUNT(*), SUM(total)
+    FROM orders
+    WHERE status <> 'cancelled'
+    GROUP BY 1
+    ORDER BY 1
+'''
+NAIVE_TOP_PRODUCTS = '''
+    SELECT (item->>'id')::integer, SUM((item->>'quantity')::integer) AS quantity,
+        SUM((item->>'price')::numeric * (item->>'quantity')::integer) AS revenue
+    FROM orders, jsonb_array_elements(items) AS item
+    WHERE status <> 'cancelled'
+    GROUP BY 1
+    ORDER BY revenue DESC
+    LIMIT 10
+'''
+
+def execute(analytics, sql: str, params=()):
+    conn = analytics.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else None
+        conn.commit()
+        return rows
+    finally:
+        analytics.release_db_connection(conn)
+
+def seed(analytics, count: int):
+    execute(analytics, 'DELETE FROM orders WHERE phone = %s', (PHONE,))
+    if count:
+        execute(
+            analytics,
+            '''
+            INSERT INTO orders (last_name, first_name, phone, city, address, items, total, status, created_at, updated_at)
+            SELECT 'Иванов', 'Иван', %s, 'Москва', 'ул. Пушкина',
+                jsonb_build_array(jsonb_build_object('id', 1 + n %% 10, 'name', 'Товар ' || (1 + n %% 10), 'price', 1000 * (1 + n %% 10), 'quantity', 1 + n %% 3)),
+                1000 * (1 + n %% 10) * (1 + n %% 3),
+                (ARRAY['pending', 'confirmed', 'shipped', 'delivered', 'cancelled'])[1 + n %% 5],
+                LOCALTIMESTAMP - (n %% 730) * INTERVAL '1 day',
+                LOCALTIMESTAMP - INTERVAL '1 hour'
+            FROM generate_series(1, %s) AS n
+            ''',
+            (PHONE, count)
+        )
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    analytics = load_function('analytics')
+    try:
+        seed(analytics, ROWS)
+        started = time.perf_counter()
+        response = analytics.handler({'httpMethod': 'POST'}, None)
+        assert response['statusCode'] == 200, response['body']
+        print(f'{ROWS} orders, full rollup refresh: {time.perf_counter() - started:.2f}s {json.loads(response["body"])}')
+        
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'bucket': 'month'}}
+        report('monthly revenue + top products', {
+            'naive GROUP BY orders': measure(lambda: (execute(analytics, NAIVE_REVENUE), execute(analytics, NAIVE_TOP_PRODUCTS)), ITERATIONS),
+            'analytics (rollups)': measure(lambda: analytics.handler(event, None), ITERATIONS),
+        })
+    finally:
+        seed(analytics, 0)
+        analytics.handler({'httpMethod': 'POST'}, None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+'''Массовая загрузка товаров через COPY против POST по одному товару.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/bulk_import.py
+Созданные товары удаляются после замера.
+'''
+import json
+import os
+import sys
+import time
+
+from _common import load_function
+
+ROWS = int(os.environ.get('BENCH_ROWS', '2000'))
+
+def make_product(index: int) -> dict:
+    return {
+        'name': f'bench-import-{index}',
+        'price': 10000 + index,
+        'images': ['https://example.com/image.jpg'],
+        'category': 'Аксессуары',
+        'material': 'Металл',
+        'style': 'Модерн',
+        'color': 'Хром',
+        'manufacturer': 'Bench',
+        'description': 'Товар для замера массовой загрузки',
+        'dimensions': {'length': 10, 'width': 10, 'height': 10}
+    }
+
+def cleanup(products):
+    conn = products.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM products WHERE name LIKE 'bench-import-%%'")
+        conn.commit()
+    finally:
+        products.release_db_connection(conn)
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    products = load_function('products')
+    items = [make_product(i) for i in range(ROWS)]
+    
+    cleanup(products)
+    started = time.perf_counter()
+    for item in items:
+        response = products.handler({'httpMethod': 'POST', 'body': json.dumps(item)}, None)
+        assert response['statusCode'] == 201, response['body']
+    per_row = time.perf_counter() - started
+    cleanup(products)
+    
+    started = time.perf_counter()
+    response = products.handler({'httpMethod': 'POST', 'body': json.dumps(items)}, None)
+    bulk = time.perf_counter() - started
+    assert response['statusCode'] == 200, response['body']
+    assert json.loads(response['body'])['created'] == ROWS
+    cleanup(products)
+    
+    print(f'{ROWS} products')
+    print(f'  per-row POST   {per_row:8.3f}s  {ROWS / per_row:10.1f} rows/s')
+    print(f'  bulk COPY      {bulk:8.3f}s  {ROWS / bulk:10.1f} rows/s')
+
+if __name__ == '__main__':
+    main()
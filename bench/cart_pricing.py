@@ -0,0 +1,91 @@
+'''Серверный расчёт цен корзины в submit-order для корзин от 1 до 200 позиций.
+
+Для каждого размера корзины сравнивается price_cart (один запрос WHERE id = ANY) с
+поштучной проверкой цен (запрос на каждую позицию) и замеряется полный вызов
+submit-order. Синтетические заказы, клиенты и письма удаляются.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/cart_pricing.py
+'''
+import json
+import os
+import random
+import sys
+
+from _common import load_function, measure, report
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '50'))
+CART_SIZES = [int(size) for size in os.environ.get('BENCH_CART_SIZES', '1,10,50,100,200').split(',')]
+PHONE = 'bench-cart-pricing'
+
+def execute(submit, sql: str, params=()):
+    conn = submit.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else None
+        conn.commit()
+        return rows
+    finally:
+        submit.release_db_connection(conn)
+
+def cleanup(submit):
+    execute(submit, "DELETE FROM email_outbox WHERE subject IN (SELECT 'Новый заказ #' || id FROM orders WHERE phone = %s)", (PHONE,))
+    execute(submit, 'DELETE FROM orders WHERE phone = %s', (PHONE,))
+    execute(submit, 'DELETE FROM customers WHERE phone = %s', (PHONE,))
+
+def per_line(cur, quantities: dict) -> int:
+    '''Поштучная проверка: один запрос цены на позицию корзины'''
+    total = 0
+    for product_id, quantity in quantities.items():
+        cur.execute('SELECT price FROM products WHERE id = %s', (product_id,))
+        total += cur.fetchone()[0] * quantity
+    return total
+
+def in_transaction(submit, fn, quantities: dict):
+    conn = submit.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            fn(cur, quantities)
+        conn.rollback()
+    finally:
+        submit.release_db_connection(conn)
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    submit = load_function('submit-order')
+    submit.INGEST_MODE = 'direct'
+    product_ids = [row[0] for row in execute(submit, 'SELECT id FROM products')]
+    if len(product_ids) < max(CART_SIZES):
+        sys.exit(f'Need at least {max(CART_SIZES)} products: run bench/seed_data.py first')
+
+    rng = random.Random(20)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    results = {}
+    try:
+        cleanup(submit)
+        for size in CART_SIZES:
+            items = [{'id': product_id, 'quantity': rng.randint(1, 3)} for product_id in rng.sample(product_ids, size)]
+            quantities = submit.parse_cart(items)
+            event = {
+                'httpMethod': 'POST',
+                'body': json.dumps({
+                    'customer': {
+                        'lastName': 'Нагрузочный', 'firstName': 'Тест', 'phone': PHONE,
+                        'city': 'Москва', 'address': 'ул. Синтетическая, д. 1'
+                    },
+                    'items': items
+                })
+            }
+            results[f'{size:>3} lines: ANY lookup'] = measure(lambda: in_transaction(submit, submit.price_cart, quantities), ITERATIONS)
+            results[f'{size:>3} lines: per-line lookup'] = measure(lambda: in_transaction(submit, per_line, quantities), ITERATIONS)
+            results[f'{size:>3} lines: submit-order'] = measure(lambda: submit.handler(dict(event), None), ITERATIONS)
+        cleanup(submit)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    report('cart pricing', results)
+
+if __name__ == '__main__':
+    main()
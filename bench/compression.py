@@ -0,0 +1,82 @@
+'''Стоимость сжатия ответов против сэкономленных байтов на типичных телах списков.
+
+База не нужна: тела собираются в формате ответов products и get-orders.
+Запуск: python bench/compression.py
+'''
+import gzip
+import json
+import os
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '20'))
+IMAGE = 'https://cdn.poehali.dev/projects/3790fdb2-666f-4121-a356-41465cdfc362/files/{}.jpg'
+
+def products_payload(count: int) -> str:
+    return json.dumps([{
+        'id': i,
+        'name': f'Угловая кухня "Модель {i}"',
+        'price': 50000 + i * 100,
+        'images': [IMAGE.format(f'ff25111a-480b-4143-83e4-{i:012d}')],
+        'category': 'Кухни угловые',
+        'material': 'МДФ',
+        'style': 'Модерн',
+        'color': 'Белый',
+        'manufacturer': 'КухниМастер',
+        'description': 'Угловая кухня с глянцевыми фасадами, встроенной техникой и LED-подсветкой',
+        'dimensions': {'length': 300, 'width': 60, 'height': 220}
+    } for i in range(count)])
+
+def orders_payload(count: int) -> str:
+    return json.dumps([{
+        'id': i,
+        'lastName': 'Иванов',
+        'firstName': 'Иван',
+        'middleName': 'Иванович',
+        'phone': f'+7 (999) {i % 1000:03d}-45-67',
+        'city': 'Москва',
+        'address': f'ул. Пушкина, д. {i % 200}',
+        'items': [{'id': 1 + (i + n) % 10, 'name': f'Товар {(i + n) % 10}', 'price': 12500, 'quantity': 1 + n} for n in range(3)],
+        'total': 75000.0,
+        'status': 'delivered',
+        'notes': '',
+        'createdAt': '2025-03-01T12:00:00',
+        'updatedAt': '2025-03-02T09:30:00'
+    } for i in range(count)])
+
+def codecs():
+    yield 'gzip-1', lambda data: gzip.compress(data, compresslevel=1)
+    yield 'gzip-6', lambda data: gzip.compress(data, compresslevel=6)
+    yield 'gzip-9', lambda data: gzip.compress(data, compresslevel=9)
+    if brotli:
+        yield 'br-1', lambda data: brotli.compress(data, quality=1)
+        yield 'br-5', lambda data: brotli.compress(data, quality=5)
+        yield 'br-11', lambda data: brotli.compress(data, quality=11)
+
+def main():
+    payloads = {
+        'products x10': products_payload(10),
+        'products x500': products_payload(500),
+        'orders x50': orders_payload(50),
+        'orders x1000': orders_payload(1000),
+        'error body': json.dumps({'error': 'Method not allowed'}),
+    }
+    for name, body in payloads.items():
+        data = body.encode()
+        print(f'{name}: {len(data)} bytes')
+        for codec, compress in codecs():
+            started = time.perf_counter()
+            for _ in range(ITERATIONS):
+                compressed = compress(data)
+            elapsed = (time.perf_counter() - started) / ITERATIONS * 1000
+            saved = len(data) - len(compressed)
+            print(f'  {codec:<7} {len(compressed):>9} bytes  ratio={len(data) / len(compressed):6.2f}  {elapsed:8.3f}ms  saved {saved / max(elapsed, 1e-6) / 1024:9.1f} KiB per CPU ms')
+        if not brotli:
+            print('  (brotli not installed)')
+
+if __name__ == '__main__':
+    main()
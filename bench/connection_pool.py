@@ -0,0 +1,104 @@
+'''Сравнение подключения на каждый запрос с пулом соединений.
+
+Затем две проверки пула: BENCH_BURST одновременных вызовов на DB_POOL_MAX соединений
+должны дождаться свободного соединения, а не получить PoolError, и после разрыва всех
+простаивающих соединений сервером get_db_connection должен вернуть живое соединение.
+При нарушении скрипт завершается с кодом 1.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/connection_pool.py
+'''
+import os
+import sys
+import threading
+import time
+
+import psycopg2
+
+from _common import load_function, measure, report
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '200'))
+BURST = int(os.environ.get('BENCH_BURST', '16'))
+
+def per_request_connect():
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+    finally:
+        conn.close()
+
+def burst(query) -> list:
+    '''BURST одновременных вызовов query; возвращает исключения'''
+    errors = []
+    barrier = threading.Barrier(BURST)
+
+    def worker():
+        barrier.wait()
+        try:
+            query()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(BURST)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+def stale_connections(products) -> bool:
+    '''Все соединения пула разорваны сервером и давно простаивают: нужно живое соединение с первой попытки'''
+    conns = [products.get_db_connection() for _ in range(products.DB_POOL_MAX)]
+    pids = [conn.get_backend_pid() for conn in conns]
+    for conn in conns:
+        products.release_db_connection(conn)
+    killer = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        with killer.cursor() as cur:
+            cur.execute('SELECT pg_terminate_backend(pid) FROM unnest(%s::int[]) AS pid', (pids,))
+        killer.commit()
+    finally:
+        killer.close()
+    for key in products._last_used:
+        products._last_used[key] = time.monotonic() - products.DB_HEALTHCHECK_AFTER - 1
+
+    conn = products.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        return True
+    except psycopg2.Error:
+        return False
+    finally:
+        products.release_db_connection(conn, broken=bool(conn.closed))
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    products = load_function('products')
+
+    def pooled():
+        conn = products.get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+        finally:
+            products.release_db_connection(conn)
+
+    pooled()
+    report('connect per request vs pooled', {
+        'psycopg2.connect': measure(per_request_connect, ITERATIONS),
+        'pool': measure(pooled, ITERATIONS),
+        'products GET (pool)': measure(lambda: products.handler({'httpMethod': 'GET'}, None), ITERATIONS),
+    })
+
+    errors = burst(pooled)
+    print(f"{'ok  ' if not errors else 'FAIL'} {BURST} concurrent calls on {products.DB_POOL_MAX} connections: errors={len(errors)}")
+    for error in errors[:3]:
+        print(f'  {type(error).__name__}: {error}')
+    alive = stale_connections(products)
+    print(f"{'ok  ' if alive else 'FAIL'} all pooled connections terminated: got a live connection")
+    sys.exit(0 if alive and not errors else 1)
+
+if __name__ == '__main__':
+    main()
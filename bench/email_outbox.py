@@ -0,0 +1,147 @@
+'''Проверка отправителя email-outbox на локальном SMTP-сервере aiosmtpd.
+
+В email_outbox кладутся письма на обычный адрес и на адрес, который сервер отклоняет (550).
+Проверяется, что handler доставил каждое обычное письмо ровно один раз с нужной темой и
+пометил его sent с одной попыткой, а отклонённые перенёс с экспоненциальной задержкой
+(OUTBOX_RETRY_BASE_DELAY, затем вдвое больше) и после OUTBOX_MAX_ATTEMPTS пометил failed.
+Затем сервер останавливается: письмо при недоступном SMTP тоже переносится. При нарушении
+скрипт завершается с кодом 1. Тестовые письма удаляются; другие ожидающие письма очереди
+тоже уйдут на локальный сервер, поэтому запускать только на локальной базе.
+
+Нужен пакет aiosmtpd: pip install aiosmtpd
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/email_outbox.py
+'''
+import email
+import os
+import socket
+import sys
+
+from _common import load_function
+
+MESSAGES = int(os.environ.get('BENCH_MESSAGES', '20'))
+SUBJECT = 'bench-email-outbox'
+RECIPIENT = 'bench@localhost'
+BOUNCE = 'bounce@localhost'
+
+class RecordingHandler:
+    '''Принимает письма в память; адрес BOUNCE отклоняется, как несуществующий ящик'''
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == BOUNCE:
+            return '550 5.1.1 Mailbox unavailable'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, email.message_from_bytes(envelope.content)))
+        return '250 Message accepted'
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def execute(outbox, sql: str, params=()):
+    conn = outbox.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else None
+        conn.commit()
+        return rows
+    finally:
+        outbox.release_db_connection(conn)
+
+def outbox_rows(outbox, recipient: str, subject: str = SUBJECT + '%') -> list:
+    '''Статус, попытки и задержка до следующей попытки в секундах для тестовых писем'''
+    return execute(
+        outbox,
+        '''
+        SELECT status, attempts, EXTRACT(EPOCH FROM next_attempt_at - CURRENT_TIMESTAMP)::float8, last_error
+        FROM email_outbox WHERE subject LIKE %s AND recipient = %s
+        ''',
+        (subject, recipient)
+    )
+
+def retry_now(outbox, attempts: int = None):
+    '''Отклонённые письма снова готовы к отправке; attempts — подставить число уже сделанных попыток'''
+    execute(
+        outbox,
+        'UPDATE email_outbox SET next_attempt_at = CURRENT_TIMESTAMP, attempts = COALESCE(%s, attempts) WHERE subject LIKE %s AND recipient = %s',
+        (attempts, SUBJECT + '%', BOUNCE)
+    )
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        sys.exit('aiosmtpd is required: pip install aiosmtpd')
+
+    port = free_port()
+    os.environ.update(SMTP_HOST='127.0.0.1', SMTP_PORT=str(port), SMTP_STARTTLS='false', SMTP_USER='')
+    outbox = load_function('email-outbox')
+    smtp = RecordingHandler()
+    controller = Controller(smtp, hostname='127.0.0.1', port=port)
+    controller.start()
+    running = True
+
+    checks = {}
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        execute(outbox, 'DELETE FROM email_outbox WHERE subject LIKE %s', (SUBJECT + '%',))
+        execute(
+            outbox,
+            '''
+            INSERT INTO email_outbox (recipient, subject, body)
+            SELECT %s, %s || ' #' || n, 'Тестовое письмо ' || n FROM generate_series(1, %s) AS n
+            UNION ALL
+            SELECT %s, %s || ' bounce', 'Отклоняется сервером'
+            ''',
+            (RECIPIENT, SUBJECT, MESSAGES, BOUNCE, SUBJECT)
+        )
+
+        outbox.handler({'httpMethod': 'POST'}, None)
+        delivered = [(rcpt_tos, message) for rcpt_tos, message in smtp.messages if message['Subject'].startswith(SUBJECT)]
+        subjects = sorted(message['Subject'] for rcpt_tos, message in delivered)
+        checks['every message delivered once'] = subjects == sorted(f'{SUBJECT} #{n}' for n in range(1, MESSAGES + 1))
+        checks['delivered to the right mailbox'] = all(rcpt_tos == [RECIPIENT] for rcpt_tos, message in delivered)
+        checks['sent with one attempt'] = all(row[:2] == ('sent', 1) for row in outbox_rows(outbox, RECIPIENT))
+
+        base = outbox.RETRY_BASE_DELAY
+        status, attempts, delay, error = outbox_rows(outbox, BOUNCE)[0]
+        checks[f'bounce retried in {base}s'] = (status, attempts) == ('pending', 1) and base - 5 <= delay <= base and bool(error)
+        retry_now(outbox)
+        outbox.handler({'httpMethod': 'POST'}, None)
+        status, attempts, delay, _ = outbox_rows(outbox, BOUNCE)[0]
+        checks[f'second retry in {base * 2}s'] = (status, attempts) == ('pending', 2) and base * 2 - 5 <= delay <= base * 2
+        retry_now(outbox, outbox.MAX_ATTEMPTS - 1)
+        outbox.handler({'httpMethod': 'POST'}, None)
+        checks[f'failed after {outbox.MAX_ATTEMPTS} attempts'] = outbox_rows(outbox, BOUNCE)[0][:2] == ('failed', outbox.MAX_ATTEMPTS)
+
+        controller.stop()
+        running = False
+        execute(
+            outbox,
+            "UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP WHERE subject = %s",
+            (f'{SUBJECT} #1',)
+        )
+        outbox.handler({'httpMethod': 'POST'}, None)
+        status, attempts, delay, error = outbox_rows(outbox, RECIPIENT, f'{SUBJECT} #1')[0]
+        checks['smtp down: retried'] = (status, attempts) == ('pending', 1) and base - 5 <= delay <= base and bool(error)
+        execute(outbox, 'DELETE FROM email_outbox WHERE subject LIKE %s', (SUBJECT + '%',))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        if running:
+            controller.stop()
+
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == '__main__':
+    main()
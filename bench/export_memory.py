@@ -0,0 +1,95 @@
+'''Пиковая память Python при выгрузке заказов через handler get-orders.
+
+Генерирует синтетические заказы с телефоном bench-export и выгружает их целиком, как
+клиент: запрос export=ndjson|csv, затем запросы с cursor из X-Next-Cursor, пока он есть.
+Для каждого ответа замеряется пик tracemalloc; печатается наибольший пик и объём выгрузки.
+Пик не должен расти вместе с числом строк: если наибольший пик на самом большом объёме
+больше чем в BENCH_MAX_GROWTH раз превышает пик на самом маленьком или выгружены не все
+строки, скрипт завершается с кодом 1. Объёмы должны быть не меньше EXPORT_CHUNK_ROWS.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/export_memory.py
+'''
+import os
+import sys
+import tracemalloc
+
+from _common import load_function
+
+SIZES = [int(size) for size in os.environ.get('BENCH_SIZES', '10000,100000,1000000').split(',')]
+MAX_GROWTH = float(os.environ.get('BENCH_MAX_GROWTH', '1.5'))
+PHONE = 'bench-export'
+
+def seed(orders, count: int):
+    conn = orders.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM orders WHERE phone = %s', (PHONE,))
+            cur.execute(
+                '''
+                INSERT INTO orders (last_name, first_name, middle_name, phone, city, address, items, total, status)
+                SELECT 'Иванов', 'Иван', 'Иванович', %s, 'Москва', 'ул. Пушкина, д. ' || n,
+                    jsonb_build_array(jsonb_build_object('id', 1, 'name', 'Кухня Модерн', 'price', 45000, 'quantity', 1)),
+                    45000, 'delivered'
+                FROM generate_series(1, %s) AS n
+                ''',
+                (PHONE, count)
+            )
+        conn.commit()
+    finally:
+        orders.release_db_connection(conn)
+
+def export_peak(orders, export_format: str) -> tuple:
+    '''Полная выгрузка по курсорам: наибольший пик памяти одного ответа, число строк и байт'''
+    params = {'export': export_format, 'phone': PHONE}
+    peak = rows = written = 0
+    while True:
+        tracemalloc.start()
+        response = orders.handler({'httpMethod': 'GET', 'queryStringParameters': dict(params)}, None)
+        _, response_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"export failed: {response['statusCode']} {response['body']}")
+        peak = max(peak, response_peak)
+        rows += response['body'].count('\n') - (export_format == 'csv' and 'cursor' not in params)
+        written += len(response['body'])
+        next_cursor = response['headers'].get('X-Next-Cursor')
+        if not next_cursor:
+            return peak, rows, written
+        params['cursor'] = next_cursor
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    orders = load_function('get-orders')
+    peaks = {}
+    failed = 0
+    stdout = sys.stdout
+    try:
+        for size in SIZES:
+            seed(orders, size)
+            for export_format in ('ndjson', 'csv'):
+                # Строки структурного лога handler не должны попасть в отчёт
+                sys.stdout = open(os.devnull, 'w')
+                try:
+                    peak, rows, written = export_peak(orders, export_format)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                peaks.setdefault(export_format, []).append(peak)
+                complete = rows == size
+                failed += not complete
+                print(
+                    f"{'ok  ' if complete else 'FAIL'} {size:>9} rows {export_format:<7} peak={peak / 2**20:8.2f} MiB  "
+                    f'exported={rows:>9} rows  output={written / 2**20:10.2f} MiB'
+                )
+    finally:
+        seed(orders, 0)
+
+    for export_format, format_peaks in peaks.items():
+        flat = format_peaks[-1] <= format_peaks[0] * MAX_GROWTH
+        failed += not flat
+        print(f"{'ok  ' if flat else 'FAIL'} {export_format} peak growth x{format_peaks[-1] / format_peaks[0]:.2f} (max x{MAX_GROWTH:g})")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
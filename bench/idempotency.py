@@ -0,0 +1,111 @@
+'''Idempotency-Key в submit-order: стоимость повтора и одновременные дубли.
+
+Замеряются заказ без ключа, заказ с новым ключом и повтор с уже использованным ключом,
+который отвечается из idempotency_keys без записи в customers и orders. Затем
+BENCH_DUPLICATES потоков одновременно шлют один и тот же заказ с одним ключом: все должны
+получить один номер заказа, а в orders должна появиться ровно одна строка, иначе скрипт
+завершается с кодом 1. Синтетические заказы, клиенты, письма и ключи удаляются.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/idempotency.py
+'''
+import json
+import os
+import sys
+import threading
+import uuid
+
+from _common import load_function, measure, report
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '50'))
+DUPLICATES = int(os.environ.get('BENCH_DUPLICATES', '16'))
+PHONE = 'bench-idempotency'
+KEY_PREFIX = 'bench-idempotency-'
+
+def execute(submit, sql: str, params=()):
+    conn = submit.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else None
+        conn.commit()
+        return rows
+    finally:
+        submit.release_db_connection(conn)
+
+def cleanup(submit):
+    execute(submit, "DELETE FROM email_outbox WHERE subject IN (SELECT 'Новый заказ #' || id FROM orders WHERE phone = %s)", (PHONE,))
+    execute(submit, 'DELETE FROM orders WHERE phone = %s', (PHONE,))
+    execute(submit, 'DELETE FROM customers WHERE phone = %s', (PHONE,))
+    execute(submit, 'DELETE FROM idempotency_keys WHERE key LIKE %s', (KEY_PREFIX + '%',))
+
+def order_event(body: str, key: str = None) -> dict:
+    event = {'httpMethod': 'POST', 'body': body}
+    if key:
+        event['headers'] = {'Idempotency-Key': key}
+    return event
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    # Все дубли должны одновременно дойти до базы, а не ждать соединения в пуле
+    os.environ['DB_POOL_MAX'] = str(max(int(os.environ.get('DB_POOL_MAX', '4')), DUPLICATES))
+    submit = load_function('submit-order')
+    submit.INGEST_MODE = 'direct'
+    products = execute(submit, 'SELECT id FROM products ORDER BY id LIMIT 3')
+    if not products:
+        sys.exit('products is empty: run bench/seed_data.py first')
+    body = json.dumps({
+        'customer': {
+            'lastName': 'Нагрузочный', 'firstName': 'Тест', 'phone': PHONE,
+            'city': 'Москва', 'address': 'ул. Синтетическая, д. 1'
+        },
+        'items': [{'id': product_id, 'quantity': 1} for (product_id,) in products]
+    })
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    results = {}
+    responses = []
+    try:
+        cleanup(submit)
+        replay_key = KEY_PREFIX + uuid.uuid4().hex
+        submit.handler(order_event(body, replay_key), None)
+        results['no key'] = measure(lambda: submit.handler(order_event(body), None), ITERATIONS)
+        results['new key'] = measure(lambda: submit.handler(order_event(body, KEY_PREFIX + uuid.uuid4().hex), None), ITERATIONS)
+        results['replay'] = measure(lambda: submit.handler(order_event(body, replay_key), None), ITERATIONS)
+
+        # Одновременные дубли: потоки стартуют по барьеру с одним ключом
+        duplicate_key = KEY_PREFIX + uuid.uuid4().hex
+        barrier = threading.Barrier(DUPLICATES)
+        lock = threading.Lock()
+
+        def duplicate():
+            barrier.wait()
+            response = submit.handler(order_event(body, duplicate_key), None)
+            with lock:
+                responses.append(response)
+
+        orders_before = execute(submit, 'SELECT count(*) FROM orders WHERE phone = %s', (PHONE,))[0][0]
+        threads = [threading.Thread(target=duplicate) for _ in range(DUPLICATES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        orders_created = execute(submit, 'SELECT count(*) FROM orders WHERE phone = %s', (PHONE,))[0][0] - orders_before
+        cleanup(submit)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    report('submit-order idempotency', results)
+    statuses = sorted({response['statusCode'] for response in responses})
+    order_ids = {json.loads(response['body']).get('orderId') for response in responses}
+    replayed = sum(1 for response in responses if response['headers'].get('Idempotent-Replayed'))
+    ok = statuses == [200] and len(order_ids) == 1 and orders_created == 1
+    print(
+        f"{'ok  ' if ok else 'FAIL'} {DUPLICATES} concurrent duplicates: statuses={statuses} "
+        f'order ids={len(order_ids)} replayed={replayed} orders created={orders_created}'
+    )
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''Сериализация полного списка заказов: json.dumps в Python против json_agg в Postgres.
+
+Каждый замер идёт в свежем процессе, чтобы пиковый RSS не наследовался от предыдущего:
+процессорное время и время ответа, прирост пикового RSS после загрузки функции и размер тела.
+Строк в orders должно быть не меньше самого большого размера, например
+SEED_ORDERS=1000000 python bench/seed_data.py.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/json_serialization.py
+'''
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from _common import load_function
+
+ROW_COUNTS = [int(size) for size in os.environ.get('BENCH_ROWS', '10000,100000,1000000').split(',')]
+MODES = ('python', 'postgres')
+
+def child(mode: str, rows: int):
+    '''Один замер внутри свежего процесса; результат — последней строкой stdout'''
+    from psycopg2.extras import RealDictCursor
+
+    orders = load_function('get-orders')
+    conn = orders.get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu, wall = time.process_time(), time.perf_counter()
+
+    if mode == 'python':
+        cur.execute(orders.ORDERS_SELECT + ' ORDER BY created_at DESC LIMIT %s', (rows,))
+        body = json.dumps([orders.serialize_order(order) for order in cur.fetchall()])
+    else:
+        cur.execute(
+            f'''
+            SELECT COALESCE(json_agg(o ORDER BY "createdAt" DESC), '[]')::text AS body
+            FROM ({orders.ORDERS_JSON_SELECT} ORDER BY created_at DESC LIMIT %s) o
+            ''',
+            (rows,)
+        )
+        body = cur.fetchone()['body']
+
+    result = {
+        'cpu': (time.process_time() - cpu) * 1000,
+        'wall': (time.perf_counter() - wall) * 1000,
+        # ru_maxrss в Linux — килобайты
+        'rss': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024,
+        'size': len(body.encode()) / 1024 / 1024
+    }
+    cur.close()
+    orders.release_db_connection(conn)
+    print(json.dumps(result))
+
+def run(mode: str, rows: int) -> dict:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, str(rows)],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+        return
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+
+    print('full orders list: Python vs Postgres serialization')
+    for rows in ROW_COUNTS:
+        for mode in MODES:
+            stats = run(mode, rows)
+            print(
+                f"  {rows:>8} rows  {mode:<8}  cpu={stats['cpu']:>9.1f}ms  wall={stats['wall']:>9.1f}ms  "
+                f"peak rss +{stats['rss']:>7.1f}MiB  body={stats['size']:>7.1f}MiB"
+            )
+
+if __name__ == '__main__':
+    main()
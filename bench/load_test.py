@@ -0,0 +1,236 @@
+'''Нагрузочный тест всех функций через локальный HTTP-сервер.
+
+Для каждого сценария BENCH_CONCURRENCY потоков в течение BENCH_DURATION секунд шлют
+запросы по keep-alive соединениям; в отчёте пропускная способность, ошибки и p50/p95/p99.
+Результат сохраняется в JSON (BENCH_OUTPUT); если задан BENCH_BASELINE, печатается
+сравнение с сохранённым ранее прогоном.
+
+По умолчанию сервер поднимается в этом же процессе; чтобы клиент не делил с ним GIL,
+запустите bench/local_server.py отдельно с DB_POOL_MAX не меньше BENCH_CONCURRENCY и
+передайте BENCH_BASE_URL. BENCH_SERVER=async поднимает asyncio-вариант сервера
+(handler_async на asyncpg); сравнение с потоковым — два прогона с BENCH_BASELINE и
+повышенным BENCH_CONCURRENCY.
+Перед замером база заполняется bench/seed_data.py с нужным SEED_SCALE.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/load_test.py [сценарий ...]
+'''
+import datetime
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from _common import summarize
+
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', '8'))
+DURATION = float(os.environ.get('BENCH_DURATION', '10'))
+WARMUP = int(os.environ.get('BENCH_WARMUP', '20'))
+OUTPUT = os.environ.get('BENCH_OUTPUT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'load_test.json'))
+BASELINE = os.environ.get('BENCH_BASELINE')
+ORDER_IDS = int(os.environ.get('BENCH_ORDER_IDS', '20000'))
+SERVER = os.environ.get('BENCH_SERVER', 'sync')
+POOL_HEADROOM = 2
+
+def submit_order_body(rng: random.Random) -> dict:
+    phone = f'+7 (900) {rng.randint(0, 999):03d}-{rng.randint(0, 99):02d}-{rng.randint(0, 99):02d}'
+    items = [{'id': rng.randint(1, 500), 'name': 'Синтетический товар', 'price': 50000, 'quantity': 1}]
+    return {
+        'customer': {
+            'lastName': 'Нагрузочный', 'firstName': 'Тест', 'phone': phone,
+            'city': 'Москва', 'address': 'ул. Синтетическая, д. 1'
+        },
+        'items': items,
+        'total': 50000
+    }
+
+# Сценарий: (функция, метод, фабрика параметров запроса, фабрика тела)
+SCENARIOS = {
+    'products:all': ('products', 'GET', None, None),
+    'products:catalog': ('products', 'GET', lambda rng: {
+        'category': rng.choice(['Кухни прямые', 'Кухни угловые', 'Кухни модульные']),
+        'priceMax': str(rng.randrange(100000, 300000, 10000)),
+        'sort': rng.choice(['price_asc', 'price_desc', 'name']),
+        'limit': '24'
+    }, None),
+    'products:search': ('products', 'GET', lambda rng: {'q': rng.choice(['Модель 1', 'угловая', 'Кухни']), 'limit': '24'}, None),
+    'get-orders:page': ('get-orders', 'GET', lambda rng: {'limit': '50'}, None),
+    'get-orders:status': ('get-orders', 'GET', lambda rng: {
+        'limit': '50', 'status': rng.choice(['pending', 'delivered', 'cancelled'])
+    }, None),
+    'get-customers:search': ('get-customers', 'GET', lambda rng: {
+        'q': rng.choice(['Иван', 'Петров', 'Казань', '999']), 'limit': '50'
+    }, None),
+    'analytics:month': ('analytics', 'GET', lambda rng: {'bucket': 'month'}, None),
+    'submit-order': ('submit-order', 'POST', None, submit_order_body),
+    'update-order-status': ('update-order-status', 'PUT', None, lambda rng: {
+        'orderId': rng.randint(1, ORDER_IDS),
+        'status': rng.choice(['confirmed', 'processing', 'shipped'])
+    }),
+}
+
+def request(conn: http.client.HTTPConnection, prefix: str, scenario: tuple, rng: random.Random) -> int:
+    '''Один запрос сценария; возвращает HTTP-статус'''
+    name, method, make_query, make_body = scenario
+    path = f'{prefix}/{name}'
+    if make_query:
+        path += '?' + urlencode(make_query(rng))
+    body = json.dumps(make_body(rng)) if make_body else None
+    headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+def run_scenario(base_url: str, scenario: tuple) -> dict:
+    '''Прогон сценария: прогрев, затем CONCURRENCY потоков в течение DURATION секунд'''
+    url = urlsplit(base_url)
+    prefix = url.path.rstrip('/')
+
+    def connect():
+        return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+
+    warm = connect()
+    warm_rng = random.Random(0)
+    for _ in range(WARMUP):
+        request(warm, prefix, scenario, warm_rng)
+    warm.close()
+
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + DURATION
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        conn = connect()
+        local_samples = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status = request(conn, prefix, scenario, rng)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = connect()
+                status = 599
+            local_samples.append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                local_errors += 1
+        conn.close()
+        with lock:
+            samples.extend(local_samples)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(CONCURRENCY)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize(samples)
+    result['errors'] = errors[0]
+    result['rps'] = round(len(samples) / elapsed, 1)
+    return result
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(results: dict, baseline: dict):
+    '''Изменение пропускной способности и хвостовых задержек относительно сохранённого прогона'''
+    print(f"vs {BASELINE} ({baseline['meta']['revision']})")
+    baseline = baseline['results']
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ('rps', 'p50', 'p95', 'p99'):
+            change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            deltas.append(f'{key} {change:+6.1f}%')
+        print(f"  {name:<24} {'  '.join(deltas)}")
+
+def main():
+    names = sys.argv[1:] or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}")
+    # Базовый прогон читается заранее: BENCH_OUTPUT может указывать на тот же файл
+    baseline = None
+    if BASELINE:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    server = None
+    in_process = False
+    base_url = os.environ.get('BENCH_BASE_URL')
+    if not base_url:
+        if not os.environ.get('DATABASE_URL'):
+            sys.exit('DATABASE_URL or BENCH_BASE_URL is required')
+        if SERVER not in ('sync', 'async'):
+            sys.exit(f'Unknown BENCH_SERVER: {SERVER}. Available: sync, async')
+        in_process = True
+        # Пул каждой функции вмещает все потоки нагрузки с запасом на прогрев: иначе в замер попадают
+        # ожидания свободного соединения; модули читают DB_POOL_MAX при загрузке
+        for name, default in (('DB_POOL_MAX', '4'), ('ASYNC_POOL_MAX', '10')):
+            os.environ[name] = str(max(int(os.environ.get(name, default)), CONCURRENCY + POOL_HEADROOM))
+        if SERVER == 'async':
+            from local_server import start_async_server
+            base_url = f'http://127.0.0.1:{start_async_server(port=0)}'
+        else:
+            from local_server import make_server
+            server = make_server(port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    # Структурные логи функций не должны смешиваться с отчётом
+    stdout = sys.stdout
+    if in_process:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        results = {}
+        for name in names:
+            results[name] = run_scenario(base_url, SCENARIOS[name])
+            print(
+                f"  {name:<24} {results[name]['rps']:>8.1f} rps  p50={results[name]['p50']:>8.2f}ms  "
+                f"p95={results[name]['p95']:>8.2f}ms  p99={results[name]['p99']:>8.2f}ms  errors={results[name]['errors']}",
+                file=stdout
+            )
+    finally:
+        if in_process:
+            sys.stdout.close()
+            sys.stdout = stdout
+        if server:
+            server.shutdown()
+
+    os.makedirs(os.path.dirname(os.path.abspath(OUTPUT)), exist_ok=True)
+    with open(OUTPUT, 'w') as f:
+        json.dump({
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'concurrency': CONCURRENCY,
+                'dbPoolMax': os.environ.get('DB_POOL_MAX', '4') if in_process else None,
+                'duration': DURATION,
+                'server': SERVER if in_process else base_url,
+                'seed': os.environ.get('SEED', '42'),
+                'seedScale': os.environ.get('SEED_SCALE', '1'),
+            },
+            'results': results
+        }, f, indent=2, sort_keys=True)
+    print(f'saved {OUTPUT}')
+
+    if baseline:
+        compare(results, baseline)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+'''Локальный HTTP-сервер для облачных функций из backend/.
+
+Каждая функция из backend/func2url.json (и ещё не выложенные каталоги с index.py)
+доступна по пути /<имя функции>, например http://localhost:8000/products?limit=12.
+HTTP-запрос переводится в event того же вида, что передаёт платформа.
+
+С флагом --async сервер работает на asyncio: функции с handler_async (products, get-orders)
+выполняются в общем цикле событий и держат много запросов одновременно, остальные —
+синхронным handler в пуле потоков.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/local_server.py [--async] [порт]
+'''
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from _common import BACKEND_DIR, load_function
+
+DEFAULT_PORT = 8000
+
+class LocalContext:
+    '''Минимальный context вызова: идентификатор запроса и имя функции'''
+    def __init__(self, function_name: str):
+        self.request_id = uuid.uuid4().hex
+        self.function_name = function_name
+
+def function_names() -> list:
+    '''Функции из func2url.json и каталоги backend/ с index.py, которые ещё не выложены'''
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        names = set(json.load(f))
+    for name in os.listdir(BACKEND_DIR):
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py')):
+            names.add(name)
+    return sorted(names)
+
+def build_event(method: str, path: str, headers: dict, raw_body: bytes) -> dict:
+    '''event в формате платформы из разобранного HTTP-запроса'''
+    url = urlsplit(path)
+    try:
+        body, is_base64 = raw_body.decode(), False
+    except UnicodeDecodeError:
+        body, is_base64 = base64.b64encode(raw_body).decode(), True
+    return {
+        'httpMethod': method,
+        'path': url.path,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(url.query, keep_blank_values=True)) or None,
+        'body': body,
+        'isBase64Encoded': is_base64
+    }
+
+class FunctionRequestHandler(BaseHTTPRequestHandler):
+    functions = {}
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными пакетами: без TCP_NODELAY keep-alive упирается в задержанный ACK
+    disable_nagle_algorithm = True
+
+    def dispatch(self):
+        name = urlsplit(self.path).path.strip('/').split('/')[0]
+        module = self.functions.get(name)
+        if module is None:
+            self.send_json(404, {'error': f'Unknown function: {name}'})
+            return
+
+        raw_body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        event = build_event(self.command, self.path, dict(self.headers.items()), raw_body)
+        try:
+            response = module.handler(event, LocalContext(name))
+        except Exception as e:
+            # Платформа отвечает 502 на необработанное исключение функции
+            self.send_json(502, {'error': f'{type(e).__name__}: {e}'})
+            return
+
+        body = response.get('body') or ''
+        body = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode()
+        self.send_response(response['statusCode'])
+        for key, value in (response.get('headers') or {}).items():
+            self.send_header(key, str(value))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = dispatch
+
+    def log_message(self, format, *args):
+        # Функции сами печатают структурный лог на каждый вызов
+        pass
+
+def make_server(port: int = DEFAULT_PORT, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    '''Сервер со всеми функциями; модули загружаются один раз, как в тёплом контейнере'''
+    FunctionRequestHandler.functions = {name: load_function(name) for name in function_names()}
+    server = ThreadingHTTPServer((host, port), FunctionRequestHandler)
+    server.daemon_threads = True
+    return server
+
+def encode_response(status: int, headers: dict, body: bytes) -> bytes:
+    '''HTTP/1.1-ответ целиком, одним буфером'''
+    lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}']
+    lines.extend(f'{key}: {value}' for key, value in headers.items())
+    lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+async def dispatch_async(functions: dict, method: str, path: str, headers: dict, raw_body: bytes) -> bytes:
+    '''Вызов функции из цикла событий: handler_async, если он есть, иначе handler в пуле потоков'''
+    name = urlsplit(path).path.strip('/').split('/')[0]
+    module = functions.get(name)
+    if module is None:
+        return encode_response(404, {'Content-Type': 'application/json'}, json.dumps({'error': f'Unknown function: {name}'}).encode())
+    
+    event = build_event(method, path, headers, raw_body)
+    try:
+        if hasattr(module, 'handler_async'):
+            response = await module.handler_async(event, LocalContext(name))
+        else:
+            response = await asyncio.to_thread(module.handler, event, LocalContext(name))
+    except Exception as e:
+        # Платформа отвечает 502 на необработанное исключение функции
+        return encode_response(502, {'Content-Type': 'application/json'}, json.dumps({'error': f'{type(e).__name__}: {e}'}).encode())
+    
+    body = response.get('body') or ''
+    body = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode()
+    return encode_response(response['statusCode'], response.get('headers') or {}, body)
+
+async def handle_connection(functions: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    '''Keep-alive соединение: запросы в нём идут по очереди, разные соединения — параллельно'''
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip()] = value.strip()
+            lowered = {key.lower(): value for key, value in headers.items()}
+            raw_body = await reader.readexactly(int(lowered.get('content-length') or 0))
+            
+            writer.write(await dispatch_async(functions, method, path, headers, raw_body))
+            await writer.drain()
+            if lowered.get('connection', '').lower() == 'close':
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+def start_async_server(port: int = DEFAULT_PORT, host: str = '127.0.0.1') -> int:
+    '''Async-сервер в фоновом потоке со своим циклом событий; возвращает занятый порт'''
+    functions = {name: load_function(name) for name in function_names()}
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(lambda reader, writer: handle_connection(functions, reader, writer), host, port)
+    )
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server.sockets[0].getsockname()[1]
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != '--async']
+    port = int(args[0]) if args else int(os.environ.get('PORT', DEFAULT_PORT))
+    if '--async' in sys.argv:
+        port = start_async_server(port)
+        names = function_names()
+        server = None
+    else:
+        server = make_server(port)
+        names = list(FunctionRequestHandler.functions)
+    for name in names:
+        print(f'  http://127.0.0.1:{port}/{name}')
+    try:
+        if server:
+            server.serve_forever()
+        else:
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.server_close()
+
+if __name__ == '__main__':
+    main()
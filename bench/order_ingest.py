@@ -0,0 +1,131 @@
+'''Всплеск заказов: прямой режим submit-order против пакетного (order_intake + drain_intake).
+
+BENCH_WRITERS потоков отправляют по BENCH_ORDERS заказов; доля BENCH_HOT_SHARE приходится
+на BENCH_HOT_PHONES «горячих» телефонов, которые в прямом режиме упираются в блокировку
+строки customers. После прогона пакетного режима очередь дренируется до конца и
+проверяется, что счётчики клиентов совпали с прямым режимом. Синтетические заказы,
+клиенты и письма удаляются.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/order_ingest.py
+'''
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from _common import load_function, summarize
+
+WRITERS = int(os.environ.get('BENCH_WRITERS', '32'))
+ORDERS = int(os.environ.get('BENCH_ORDERS', '200'))
+HOT_PHONES = int(os.environ.get('BENCH_HOT_PHONES', '5'))
+HOT_SHARE = float(os.environ.get('BENCH_HOT_SHARE', '0.5'))
+PHONE_PREFIX = 'bench-ingest-'
+
+def order_event(rng: random.Random) -> dict:
+    if rng.random() < HOT_SHARE:
+        phone = f'{PHONE_PREFIX}hot-{rng.randrange(HOT_PHONES)}'
+    else:
+        phone = f'{PHONE_PREFIX}{rng.randrange(10 ** 9)}'
+    price = rng.randrange(1000, 100000, 100)
+    return {
+        'httpMethod': 'POST',
+        'body': json.dumps({
+            'customer': {
+                'lastName': 'Нагрузочный', 'firstName': 'Тест', 'phone': phone,
+                'city': 'Москва', 'address': 'ул. Синтетическая, д. 1'
+            },
+            'items': [{'id': 1, 'name': 'Синтетический товар', 'price': price, 'quantity': 1}],
+            'total': price
+        })
+    }
+
+def execute(submit, sql: str, params=()):
+    conn = submit.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else None
+        conn.commit()
+        return rows
+    finally:
+        submit.release_db_connection(conn)
+
+def cleanup(submit):
+    execute(submit, "DELETE FROM email_outbox WHERE subject IN (SELECT 'Новый заказ #' || id FROM orders WHERE phone LIKE %s)", (PHONE_PREFIX + '%',))
+    execute(submit, 'DELETE FROM orders WHERE phone LIKE %s', (PHONE_PREFIX + '%',))
+    execute(submit, 'DELETE FROM customers WHERE phone LIKE %s', (PHONE_PREFIX + '%',))
+
+def hot_totals(submit) -> list:
+    return execute(
+        submit,
+        'SELECT phone, total_orders, total_spent FROM customers WHERE phone LIKE %s ORDER BY phone',
+        (PHONE_PREFIX + 'hot-%',)
+    )
+
+def burst(submit, mode: str) -> dict:
+    submit.INGEST_MODE = mode
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def writer(seed: int):
+        rng = random.Random(seed)
+        local = []
+        failed = 0
+        for _ in range(ORDERS):
+            started = time.perf_counter()
+            response = submit.handler(order_event(rng), None)
+            local.append((time.perf_counter() - started) * 1000)
+            if response['statusCode'] != 200:
+                failed += 1
+        with lock:
+            samples.extend(local)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=writer, args=(seed,)) for seed in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize(samples)
+    result['errors'] = errors[0]
+    result['rps'] = round(len(samples) / elapsed, 1)
+    return result
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    # Пул функции должен вмещать всех писателей сразу
+    os.environ.setdefault('DB_POOL_MAX', str(WRITERS + 1))
+    submit = load_function('submit-order')
+    # Логи каждого вызова не нужны в отчёте
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    results = {}
+    totals = {}
+    try:
+        for mode in ('direct', 'batched'):
+            cleanup(submit)
+            results[mode] = burst(submit, mode)
+            drained = json.loads(submit.handler({'httpMethod': 'POST', 'body': json.dumps({'type': 'drain'})}, None)['body'])
+            results[mode]['drainedAfter'] = drained.get('drained', 0)
+            totals[mode] = hot_totals(submit)
+        cleanup(submit)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(f'{WRITERS} writers x {ORDERS} orders, {HOT_SHARE:.0%} on {HOT_PHONES} hot phones')
+    for mode, stats in results.items():
+        print(
+            f"  {mode:<8} {stats['rps']:>8.1f} orders/s  p50={stats['p50']:>8.2f}ms  p95={stats['p95']:>8.2f}ms  "
+            f"p99={stats['p99']:>8.2f}ms  errors={stats['errors']}  drained after burst={stats['drainedAfter']}"
+        )
+    print(f"  hot phone totals match: {totals['direct'] == totals['batched']}")
+
+if __name__ == '__main__':
+    main()
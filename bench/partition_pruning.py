@@ -0,0 +1,78 @@
+'''Проверка отсечения секций orders в запросах get-orders по EXPLAIN.
+
+Запросы строятся теми же функциями, что в handler, и для каждого по плану
+(EXPLAIN (FORMAT JSON)) собираются секции orders, которые он читает. Фильтр по датам
+внутри месяца должен читать одну секцию, страница по курсору — ни одной секции новее
+курсора. При нарушении скрипт завершается с кодом 1.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/partition_pruning.py
+'''
+import datetime
+import os
+import sys
+
+from _common import load_function
+
+def month_partition(day: datetime.date) -> str:
+    return f'orders_p{day.year:04d}_{day.month:02d}'
+
+def scanned_partitions(cur, sql: str, sql_params: list) -> set:
+    '''Секции orders, которые читает план запроса'''
+    cur.execute('EXPLAIN (FORMAT JSON) ' + sql, sql_params)
+    plan = cur.fetchone()[0]
+    relations = set()
+    stack = [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        if node.get('Relation Name', '').startswith('orders_'):
+            relations.add(node['Relation Name'])
+        stack.extend(node.get('Plans', []))
+    return relations
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    orders = load_function('get-orders')
+    month_start = datetime.date.today().replace(day=1)
+    next_month = (month_start + datetime.timedelta(days=32)).replace(day=1)
+    current = month_partition(month_start)
+    cursor = orders.encode_cursor({'created_at': datetime.datetime.combine(month_start, datetime.time(12)), 'id': 1})
+
+    # Запрос get-orders и проверка множества прочитанных секций
+    checks = {
+        'dateFrom/dateTo within a month': (
+            orders.build_orders_query({'dateFrom': month_start.isoformat(), 'dateTo': next_month.isoformat()}),
+            lambda scanned: scanned == {current}
+        ),
+        'status + month range': (
+            orders.build_orders_query({'status': 'delivered', 'dateFrom': month_start.isoformat(), 'dateTo': next_month.isoformat()}),
+            lambda scanned: scanned == {current}
+        ),
+        'cursor page skips newer months': (
+            orders.build_orders_query({'cursor': cursor}),
+            lambda scanned: bool(scanned) and max(scanned) <= current
+        ),
+        'export with month range': (
+            orders.build_export_query({'export': 'csv', 'dateFrom': month_start.isoformat(), 'dateTo': next_month.isoformat()}),
+            lambda scanned: scanned == {current}
+        ),
+    }
+
+    conn = orders.get_db_connection()
+    failed = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT count(*) FROM pg_inherits WHERE inhparent = %s::regclass', ('public.orders',))
+            print(f'orders partitions: {cur.fetchone()[0]}')
+            for name, ((sql, sql_params, _), check) in checks.items():
+                scanned = scanned_partitions(cur, sql, sql_params)
+                ok = check(scanned)
+                failed += not ok
+                print(f"  {'ok  ' if ok else 'FAIL'} {name:<34} {', '.join(sorted(scanned))}")
+        conn.rollback()
+    finally:
+        orders.release_db_connection(conn)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
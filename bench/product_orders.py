@@ -0,0 +1,79 @@
+'''Поиск заказов с товаром в get-orders: GIN-индекс по items против полного разбора items.
+
+Для популярного и редкого товара замеряются первая страница get-orders?product=
+(с итогами productSales), следующая страница по курсору и те же запросы с выключенным
+bitmap-сканированием, то есть без idx_orders_items_path. Нужна база побольше, например
+SEED_SCALE=50 python bench/seed_data.py (1 000 000 заказов).
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/product_orders.py
+'''
+import json
+import os
+import sys
+
+from _common import load_function, measure, report
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '20'))
+
+def execute(orders, sql: str, sql_params, bitmap: bool = True):
+    conn = orders.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            if not bitmap:
+                cur.execute('SET LOCAL enable_bitmapscan = off')
+            cur.execute(sql, sql_params)
+            rows = cur.fetchall()
+        conn.rollback()
+        return rows
+    finally:
+        orders.release_db_connection(conn)
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    orders = load_function('get-orders')
+    # Частота товаров по выборке заказов: самый популярный и самый редкий из встреченных
+    counts = execute(
+        orders,
+        '''
+        SELECT (item->>'id')::integer, count(*)
+        FROM (SELECT items FROM orders TABLESAMPLE SYSTEM (1)) o, jsonb_array_elements(o.items) AS item
+        GROUP BY 1 ORDER BY 2 DESC
+        ''',
+        ()
+    )
+    if not counts:
+        sys.exit('orders is empty: run bench/seed_data.py first')
+    products = {'popular': counts[0][0], 'rare': counts[-1][0]}
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    results = {}
+    try:
+        for label, product_id in products.items():
+            params = {'product': str(product_id), 'limit': '50'}
+            first = orders.handler({'httpMethod': 'GET', 'queryStringParameters': dict(params)}, None)
+            cursor = json.loads(first['body'])['nextCursor']
+            page_sql, page_params, _ = orders.build_orders_query(params, orders.COMPACT_ORDER_FIELDS)
+            sales_sql, sales_params = orders.build_product_sales_query(params)
+
+            results[f'{label}: first page + sales'] = measure(
+                lambda: orders.handler({'httpMethod': 'GET', 'queryStringParameters': dict(params)}, None), ITERATIONS
+            )
+            if cursor:
+                results[f'{label}: next page'] = measure(
+                    lambda: orders.handler({'httpMethod': 'GET', 'queryStringParameters': {**params, 'cursor': cursor}}, None),
+                    ITERATIONS
+                )
+            results[f'{label}: page, GIN'] = measure(lambda: execute(orders, page_sql, page_params), ITERATIONS)
+            results[f'{label}: page, no GIN'] = measure(lambda: execute(orders, page_sql, page_params, bitmap=False), ITERATIONS)
+            results[f'{label}: sales, GIN'] = measure(lambda: execute(orders, sales_sql, sales_params), ITERATIONS)
+            results[f'{label}: sales, no GIN'] = measure(lambda: execute(orders, sales_sql, sales_params, bitmap=False), ITERATIONS)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(f"products: popular #{products['popular']}, rare #{products['rare']}")
+    report('orders with product', results)
+
+if __name__ == '__main__':
+    main()
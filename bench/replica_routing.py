@@ -0,0 +1,59 @@
+'''Проверка маршрутизации чтений на реплику для products, get-orders и get-customers.
+
+Нужны два экземпляра Postgres (реплика может быть и обычной отдельной базой):
+определяется, куда ушло соединение, для живой реплики, для реплики с токеном X-Min-Lsn
+из будущего (read-your-writes) и для недоступной реплики. Затем сравнивается задержка
+чтения каталога через реплику и через основную базу.
+
+Запуск: DATABASE_URL=postgresql://localhost:5432/furniture \
+        DATABASE_REPLICA_URL=postgresql://localhost:5433/furniture python bench/replica_routing.py
+'''
+import os
+import sys
+
+from _common import load_function, measure, report
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '200'))
+UNREACHABLE_URL = 'postgresql://127.0.0.1:1/unreachable?connect_timeout=1'
+
+def served_by(module, event: dict) -> str:
+    conn = module.get_read_connection(event)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_is_in_recovery(), inet_server_port()')
+            in_recovery, port = cur.fetchone()
+        conn.rollback()
+        return f"port {port}{' (standby)' if in_recovery else ''}"
+    finally:
+        module.release_db_connection(conn)
+
+def main():
+    if not os.environ.get('DATABASE_URL') or not os.environ.get('DATABASE_REPLICA_URL'):
+        sys.exit('DATABASE_URL and DATABASE_REPLICA_URL are required')
+    for name in ('products', 'get-orders', 'get-customers'):
+        module = load_function(name)
+        print(name)
+        print(f"  plain read:           {served_by(module, {})}")
+        print(f"  X-Min-Lsn from future: {served_by(module, {'headers': {'X-Min-Lsn': 'FFFFFFFF/FFFFFFFF'}})}")
+        module.DATABASE_REPLICA_URL = UNREACHABLE_URL
+        module._pools.pop('replica', None)
+        module._replica.update(checked_at=0.0, healthy=True)
+        print(f"  replica unreachable:  {served_by(module, {})}")
+
+    replica = load_function('products')
+    primary = load_function('products')
+    primary.DATABASE_REPLICA_URL = None
+    event = {'httpMethod': 'GET', 'queryStringParameters': {'limit': '24'}}
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        results = {
+            'products GET via replica': measure(lambda: replica.handler(dict(event), None), ITERATIONS),
+            'products GET via primary': measure(lambda: primary.handler(dict(event), None), ITERATIONS),
+        }
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    report('catalog read latency', results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+'''Заполнение локальной базы синтетическими товарами, клиентами и заказами.
+
+Данные детерминированы зерном SEED: одинаковые SEED и SEED_SCALE дают одну и ту же базу,
+поэтому результаты нагрузочных тестов сравнимы между запусками.
+ВНИМАНИЕ: products, orders, customers, email_outbox и агрегаты analytics очищаются.
+
+SEED_SCALE=1 — 500 товаров, 5 000 клиентов, 20 000 заказов; остальные объёмы пропорциональны.
+Запуск: DATABASE_URL=postgresql://localhost/furniture SEED_SCALE=10 python bench/seed_data.py
+'''
+import datetime
+import json
+import os
+import random
+import sys
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+SEED = int(os.environ.get('SEED', '42'))
+SCALE = float(os.environ.get('SEED_SCALE', '1'))
+PRODUCTS = int(os.environ.get('SEED_PRODUCTS', int(500 * SCALE)))
+CUSTOMERS = int(os.environ.get('SEED_CUSTOMERS', int(5000 * SCALE)))
+ORDERS = int(os.environ.get('SEED_ORDERS', int(20000 * SCALE)))
+HISTORY_DAYS = int(os.environ.get('SEED_HISTORY_DAYS', '730'))
+PAGE_SIZE = 5000
+
+CATEGORIES = ['Кухни прямые', 'Кухни угловые', 'Кухни модульные', 'Аксессуары']
+MATERIALS = ['МДФ', 'ЛДСП', 'Массив дерева', 'Металл', 'Нержавеющая сталь']
+STYLES = ['Модерн', 'Классический', 'Лофт', 'Скандинавский', 'Минимализм']
+COLORS = ['Белый', 'Серый', 'Бежевый', 'Коричневый', 'Черный', 'Хром']
+MANUFACTURERS = ['КухниМастер', 'Элит Кухни', 'Urban Kitchen', 'Nordic Kitchen', 'Модуль Групп', 'Blanco', 'Bosch']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев']
+FIRST_NAMES = ['Иван', 'Пётр', 'Алексей', 'Сергей', 'Андрей', 'Дмитрий', 'Михаил', 'Николай']
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Екатеринбург', 'Новосибирск', 'Самара']
+STATUSES = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'delivered', 'delivered', 'cancelled']
+IMAGE = 'https://cdn.poehali.dev/projects/3790fdb2-666f-4121-a356-41465cdfc362/files/{}.jpg'
+IMAGES = ['ff25111a-480b-4143-83e4-7b4b74da9603', '2a9d48d0-c499-4d71-97dd-3ab13e39ecd5', 'b4adc89b-ce92-4c67-83ac-e7798964eced']
+
+def generate_products(rng: random.Random) -> list:
+    products = []
+    for i in range(1, PRODUCTS + 1):
+        category = rng.choice(CATEGORIES)
+        accessory = category == 'Аксессуары'
+        products.append((
+            i,
+            f'{category.split()[-1].capitalize()} "Модель {i}"',
+            rng.randrange(1000, 30000, 100) if accessory else rng.randrange(50000, 300000, 1000),
+            [IMAGE.format(image) for image in rng.sample(IMAGES, rng.randint(1, 3))],
+            category,
+            rng.choice(MATERIALS),
+            rng.choice(STYLES),
+            rng.choice(COLORS),
+            rng.choice(MANUFACTURERS),
+            f'Синтетический товар {i} для нагрузочных тестов',
+            rng.randint(20, 400),
+            rng.randint(20, 70),
+            rng.randint(20, 250)
+        ))
+    return products
+
+def generate_customers(rng: random.Random) -> list:
+    return [{
+        'last_name': rng.choice(LAST_NAMES),
+        'first_name': rng.choice(FIRST_NAMES),
+        'middle_name': rng.choice(FIRST_NAMES) + 'ович',
+        'phone': f'+7 (9{i // 10000000 % 100:02d}) {i // 10000 % 1000:03d}-{i // 100 % 100:02d}-{i % 100:02d}',
+        'city': rng.choice(CITIES),
+        'address': f'ул. Синтетическая, д. {rng.randint(1, 200)}, кв. {rng.randint(1, 300)}',
+        'total_orders': 0,
+        'total_spent': 0
+    } for i in range(1, CUSTOMERS + 1)]
+
+def generate_orders(rng: random.Random, products: list, customers: list) -> list:
+    now = datetime.datetime.now().replace(microsecond=0)
+    orders = []
+    for _ in range(ORDERS):
+        # Несколько постоянных клиентов делают заметную долю заказов, как в реальной базе
+        customer = customers[min(int(rng.paretovariate(1.2)) - 1, len(customers) - 1)] if rng.random() < 0.2 else rng.choice(customers)
+        items = []
+        for product in rng.sample(products, rng.randint(1, min(5, len(products)))):
+            items.append({'id': product[0], 'name': product[1], 'price': product[2], 'quantity': rng.randint(1, 3)})
+        total = sum(item['price'] * item['quantity'] for item in items)
+        created_at = now - datetime.timedelta(seconds=rng.randint(0, HISTORY_DAYS * 86400))
+        status = rng.choice(STATUSES)
+        customer['total_orders'] += 1
+        customer['total_spent'] += total
+        orders.append((
+            customer['last_name'], customer['first_name'], customer['middle_name'], customer['phone'],
+            customer['city'], customer['address'], json.dumps(items, ensure_ascii=False), total,
+            status, created_at, created_at
+        ))
+    orders.sort(key=lambda order: order[9])
+    return orders
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    rng = random.Random(SEED)
+    products = generate_products(rng)
+    customers = generate_customers(rng)
+    orders = generate_orders(rng, products, customers)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                'TRUNCATE products, orders, customers, email_outbox, sales_daily, product_sales_daily RESTART IDENTITY'
+            )
+            cur.execute("UPDATE rollup_state SET refreshed_until = '1970-01-01'")
+            execute_values(
+                cur,
+                '''
+                INSERT INTO products (
+                    id, name, price, images, category, material, style, color, manufacturer,
+                    description, dimension_length, dimension_width, dimension_height
+                ) VALUES %s
+                ''',
+                products,
+                page_size=PAGE_SIZE
+            )
+            cur.execute("SELECT setval(pg_get_serial_sequence('products', 'id'), %s)", (max(len(products), 1),))
+            execute_values(
+                cur,
+                '''
+                INSERT INTO customers (last_name, first_name, middle_name, phone, city, address, total_orders, total_spent)
+                VALUES %s
+                ''',
+                [(c['last_name'], c['first_name'], c['middle_name'], c['phone'], c['city'], c['address'], c['total_orders'], c['total_spent'])
+                 for c in customers],
+                page_size=PAGE_SIZE
+            )
+            # Месячные секции orders на всю историю: секции DEFAULT нет, заказ вне созданных месяцев не вставится
+            cur.execute(
+                '''
+                SELECT create_orders_partition(month::date)
+                FROM generate_series(date_trunc('month', %s::timestamp), date_trunc('month', CURRENT_TIMESTAMP), INTERVAL '1 month') AS month
+                ''',
+                (orders[0][9] if orders else datetime.datetime.now(),)
+            )
+            execute_values(
+                cur,
+                '''
+                INSERT INTO orders (last_name, first_name, middle_name, phone, city, address, items, total, status, created_at, updated_at)
+                VALUES %s
+                ''',
+                orders,
+                template='(%s, %s, %s, %s, %s, %s, %s::jsonb, %s, %s, %s, %s)',
+                page_size=PAGE_SIZE
+            )
+        conn.commit()
+        # Свежая статистика планировщика, иначе первые замеры идут по планам для пустых таблиц
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute('VACUUM ANALYZE products, customers, orders')
+    finally:
+        conn.close()
+
+    print(f'seed={SEED}: {len(products)} products, {len(customers)} customers, {len(orders)} orders')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+'''Компактный вид списков против полных записей в products и get-orders.
+
+Для каждой страницы печатается размер тела ответа и задержка вызова функции.
+База заполняется заранее через bench/seed_data.py.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/sparse_fields.py
+'''
+import os
+import sys
+
+from _common import load_function, measure, report
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '100'))
+FULL_PRODUCT = 'id,name,price,images,category,material,style,color,manufacturer,description,dimensions'
+FULL_ORDER = 'id,lastName,firstName,middleName,phone,city,address,items,total,status,notes,createdAt,updatedAt'
+
+CASES = {
+    'products compact': ('products', {'limit': '100', 'sort': 'price_asc'}),
+    'products full': ('products', {'limit': '100', 'sort': 'price_asc', 'fields': FULL_PRODUCT}),
+    'get-orders compact': ('get-orders', {'limit': '200'}),
+    'get-orders full': ('get-orders', {'limit': '200', 'fields': FULL_ORDER}),
+}
+
+def main():
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+    modules = {name: load_function(name) for name in ('products', 'get-orders')}
+    # Кэш каталога выключен, чтобы каждый вызов ходил в базу
+    modules['products'].CATALOG_CACHE_SIZE = 0
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    results = {}
+    sizes = {}
+    try:
+        for case, (name, params) in CASES.items():
+            def call():
+                return modules[name].handler({'httpMethod': 'GET', 'queryStringParameters': dict(params)}, None)
+            sizes[case] = len(call()['body'].encode())
+            results[case] = measure(call, ITERATIONS)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    report('list views', results)
+    for case, size in sizes.items():
+        print(f'  {case:<28} {size / 1024:>9.1f} KiB')
+
+if __name__ == '__main__':
+    main()
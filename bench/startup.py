@@ -0,0 +1,102 @@
+'''Холодный старт функций: время импорта модуля и первого вызова в свежем процессе.
+
+Каждая функция загружается в отдельном процессе под python -X importtime, как в
+новом контейнере. Печатается медиана по BENCH_ITERATIONS процессам: время загрузки
+index.py, сумма importtime его импортов, первый вызов OPTIONS (без базы) и, если задан
+DATABASE_URL, первый и второй вызов с запросом к базе; плюс самые тяжёлые импорты.
+
+Запуск: DATABASE_URL=postgresql://localhost/furniture python bench/startup.py [функция ...]
+'''
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from _common import load_function
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', '5'))
+MARKER = '--- load function'
+
+# Чтение, которое проходит через пул и базу, но ничего не меняет
+FIRST_EVENTS = {
+    'products': {'httpMethod': 'GET', 'queryStringParameters': {'limit': '24'}},
+    'get-orders': {'httpMethod': 'GET', 'queryStringParameters': {'limit': '50'}},
+    'get-customers': {'httpMethod': 'GET', 'queryStringParameters': {'limit': '50'}},
+    'analytics': {'httpMethod': 'GET', 'queryStringParameters': {'bucket': 'month'}},
+    'update-order-status': {'httpMethod': 'PUT', 'body': json.dumps({'orderId': 0, 'status': 'pending'})},
+}
+
+def timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+def child(name: str):
+    '''Замеры внутри свежего процесса; результат — последней строкой stdout'''
+    sys.stderr.write(MARKER + '\n')
+    sys.stderr.flush()
+    result = {}
+    module = None
+
+    def load():
+        nonlocal module
+        module = load_function(name)
+
+    result['load'] = timed(load)
+    result['options'] = timed(lambda: module.handler({'httpMethod': 'OPTIONS'}, None))
+    if os.environ.get('DATABASE_URL') and name in FIRST_EVENTS:
+        result['first'] = timed(lambda: module.handler(dict(FIRST_EVENTS[name]), None))
+        result['warm'] = timed(lambda: module.handler(dict(FIRST_EVENTS[name]), None))
+    print(json.dumps(result))
+
+def parse_importtime(stderr: str) -> dict:
+    '''Импорты верхнего уровня после загрузки index.py: имя → накопленное время, мс'''
+    lines = stderr.split(MARKER + '\n', 1)[-1].splitlines()
+    imports = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        if module.startswith('  ', 1):
+            continue
+        imports[module.strip()] = int(cumulative) / 1000
+    return imports
+
+def run(name: str) -> dict:
+    samples = {}
+    imports = {}
+    for _ in range(ITERATIONS):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child', name],
+            capture_output=True, text=True, check=True
+        )
+        for key, value in json.loads(proc.stdout.strip().splitlines()[-1]).items():
+            samples.setdefault(key, []).append(value)
+        for module, value in parse_importtime(proc.stderr).items():
+            imports.setdefault(module, []).append(value)
+    result = {key: round(statistics.median(values), 2) for key, values in samples.items()}
+    medians = {module: statistics.median(values) for module, values in imports.items()}
+    result['importtime'] = round(sum(medians.values()), 2)
+    result['heaviest'] = sorted(medians, key=medians.get, reverse=True)[:4]
+    return result
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        child(sys.argv[2])
+        return
+
+    from local_server import function_names
+    names = sys.argv[1:] or function_names()
+    print(f'cold start, median of {ITERATIONS} fresh processes')
+    for name in names:
+        stats = run(name)
+        line = f"  {name:<22} load={stats['load']:>7.2f}ms  importtime={stats['importtime']:>7.2f}ms  options={stats['options']:>6.2f}ms"
+        if 'first' in stats:
+            line += f"  first={stats['first']:>7.2f}ms  warm={stats['warm']:>6.2f}ms"
+        print(line)
+        print(f"  {'':<22} heaviest: {', '.join(stats['heaviest'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+-- Индексы для фильтрации и сортировки каталога на стороне сервера
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_products_price ON products(price);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
+CREATE INDEX IF NOT EXISTS idx_products_material ON products(material);
+CREATE INDEX IF NOT EXISTS idx_products_color ON products(color);
+
+-- Триграммные индексы для поиска ILIKE '%...%' по названию и описанию
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_description_trgm ON products USING GIN (description gin_trgm_ops);
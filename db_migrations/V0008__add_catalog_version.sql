@@ -0,0 +1,18 @@
+-- Версия каталога: меняется при любом изменении товаров, по ней тёплые экземпляры функции проверяют свой кэш
+CREATE TABLE IF NOT EXISTS catalog_version (
+  id INTEGER PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_products_catalog_version
+AFTER INSERT OR UPDATE OR DELETE ON products
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
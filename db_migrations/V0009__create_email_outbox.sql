@@ -0,0 +1,16 @@
+-- Очередь исходящих писем: пишется в одной транзакции с заказом, отправляется функцией email-outbox
+CREATE TABLE IF NOT EXISTS email_outbox (
+  id SERIAL PRIMARY KEY,
+  recipient VARCHAR(255) NOT NULL,
+  subject TEXT NOT NULL,
+  body TEXT NOT NULL,
+  status VARCHAR(20) NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  last_error TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  sent_at TIMESTAMP
+);
+
+-- Частичный индекс только по ожидающим письмам, чтобы выборка очереди не росла с историей
+CREATE INDEX IF NOT EXISTS idx_email_outbox_pending ON email_outbox(next_attempt_at) WHERE status = 'pending';
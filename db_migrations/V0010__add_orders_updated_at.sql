@@ -0,0 +1,17 @@
+-- Время последнего изменения заказа для ленты изменений (since) в get-orders
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+UPDATE orders SET updated_at = created_at WHERE updated_at IS NULL OR updated_at <> created_at;
+
+CREATE INDEX IF NOT EXISTS idx_orders_updated_at ON orders(updated_at, id);
+
+CREATE OR REPLACE FUNCTION set_orders_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = CURRENT_TIMESTAMP;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_orders_updated_at
+BEFORE UPDATE ON orders
+FOR EACH ROW EXECUTE FUNCTION set_orders_updated_at();
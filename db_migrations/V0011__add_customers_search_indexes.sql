@@ -0,0 +1,11 @@
+-- Индексы для поиска и постраничной выдачи клиентов в get-customers
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_customers_updated_at ON customers(updated_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_customers_last_name_trgm ON customers USING GIN (last_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_first_name_trgm ON customers USING GIN (first_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_city_trgm ON customers USING GIN (city gin_trgm_ops);
+
+-- Телефон хранится в свободном формате, поэтому ищем по одним цифрам
+CREATE INDEX IF NOT EXISTS idx_customers_phone_digits_trgm ON customers USING GIN (regexp_replace(phone, '\D', '', 'g') gin_trgm_ops);
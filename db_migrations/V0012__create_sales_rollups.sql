@@ -0,0 +1,26 @@
+-- Агрегаты продаж по дням для функции analytics; пересчитываются инкрементально по orders.updated_at
+CREATE TABLE IF NOT EXISTS sales_daily (
+  day DATE NOT NULL,
+  status VARCHAR(50) NOT NULL,
+  orders_count INTEGER NOT NULL DEFAULT 0,
+  revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, status)
+);
+
+CREATE TABLE IF NOT EXISTS product_sales_daily (
+  day DATE NOT NULL,
+  status VARCHAR(50) NOT NULL,
+  product_id INTEGER NOT NULL,
+  product_name VARCHAR(255) NOT NULL,
+  quantity INTEGER NOT NULL DEFAULT 0,
+  revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, status, product_id)
+);
+
+-- Отметка, до которой изменения заказов уже учтены в агрегатах
+CREATE TABLE IF NOT EXISTS rollup_state (
+  name VARCHAR(50) PRIMARY KEY,
+  refreshed_until TIMESTAMP NOT NULL
+);
+
+INSERT INTO rollup_state (name, refreshed_until) VALUES ('sales', '1970-01-01') ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Приёмная очередь заказов для пакетного режима submit-order (ORDER_INGEST_MODE=batched).
+-- Номер заказа берётся из последовательности orders сразу, строку в orders и счётчики
+-- клиента пачкой переносит дренирующий вызов.
+CREATE TABLE IF NOT EXISTS order_intake (
+  id BIGSERIAL PRIMARY KEY,
+  order_id INTEGER NOT NULL UNIQUE,
+  last_name VARCHAR(255) NOT NULL,
+  first_name VARCHAR(255) NOT NULL,
+  middle_name VARCHAR(255),
+  phone VARCHAR(50) NOT NULL,
+  city VARCHAR(255) NOT NULL,
+  address TEXT NOT NULL,
+  items JSONB NOT NULL,
+  total NUMERIC(10, 2) NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,2 @@
+-- Число позиций заказа хранится рядом со строкой: компактный список get-orders не читает items из TOAST
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS items_count INTEGER GENERATED ALWAYS AS (jsonb_array_length(items)) STORED;
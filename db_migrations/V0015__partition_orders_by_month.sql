@@ -0,0 +1,102 @@
+-- orders разбивается на месячные секции по created_at: списки get-orders с датами и курсором
+-- читают только нужные месяцы, а старые месяцы завершённых заказов функция orders-archive
+-- отсоединяет в схему orders_archive. Секции на будущее создаёт create_orders_partitions,
+-- строки вне созданных месяцев попадают в orders_default.
+ALTER TABLE orders RENAME TO orders_unpartitioned;
+ALTER INDEX orders_pkey RENAME TO orders_unpartitioned_pkey;
+ALTER INDEX idx_orders_created_at RENAME TO idx_orders_unpartitioned_created_at;
+ALTER INDEX idx_orders_phone RENAME TO idx_orders_unpartitioned_phone;
+ALTER INDEX idx_orders_status RENAME TO idx_orders_unpartitioned_status;
+ALTER INDEX idx_orders_updated_at RENAME TO idx_orders_unpartitioned_updated_at;
+
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования;
+-- номера заказов по-прежнему выдаёт одна последовательность orders_id_seq
+CREATE TABLE orders (
+  id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'),
+  last_name VARCHAR(255) NOT NULL,
+  first_name VARCHAR(255) NOT NULL,
+  middle_name VARCHAR(255),
+  phone VARCHAR(50) NOT NULL,
+  city VARCHAR(255) NOT NULL,
+  address TEXT NOT NULL,
+  items JSONB NOT NULL,
+  total NUMERIC(10, 2) NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  status VARCHAR(50) DEFAULT 'pending',
+  notes TEXT DEFAULT '',
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  items_count INTEGER GENERATED ALWAYS AS (jsonb_array_length(items)) STORED,
+  PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE orders_default PARTITION OF orders DEFAULT;
+
+CREATE INDEX idx_orders_created_at ON orders(created_at DESC);
+CREATE INDEX idx_orders_phone ON orders(phone);
+CREATE INDEX idx_orders_status ON orders(status);
+CREATE INDEX idx_orders_updated_at ON orders(updated_at, id);
+
+CREATE TRIGGER trg_orders_updated_at
+BEFORE UPDATE ON orders
+FOR EACH ROW EXECUTE FUNCTION set_orders_updated_at();
+
+CREATE SCHEMA IF NOT EXISTS orders_archive;
+
+-- Секция orders_pYYYY_MM на месяц month_start; строки этого месяца из orders_default переносятся в неё
+CREATE OR REPLACE FUNCTION create_orders_partition(month_start DATE) RETURNS BOOLEAN AS $$
+DECLARE
+  part_name TEXT := 'orders_p' || to_char(month_start, 'YYYY_MM');
+  month_end DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+BEGIN
+  month_start := date_trunc('month', month_start)::date;
+  IF to_regclass('public.' || part_name) IS NOT NULL OR to_regclass('orders_archive.' || part_name) IS NOT NULL THEN
+    RETURN FALSE;
+  END IF;
+
+  IF EXISTS (SELECT 1 FROM orders_default WHERE created_at >= month_start AND created_at < month_end) THEN
+    ALTER TABLE orders DETACH PARTITION orders_default;
+    EXECUTE format('CREATE TABLE public.%I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)', part_name, month_start, month_end);
+    INSERT INTO orders (id, last_name, first_name, middle_name, phone, city, address, items, total, created_at, status, notes, updated_at)
+    SELECT id, last_name, first_name, middle_name, phone, city, address, items, total, created_at, status, notes, updated_at
+    FROM orders_default
+    WHERE created_at >= month_start AND created_at < month_end;
+    DELETE FROM orders_default WHERE created_at >= month_start AND created_at < month_end;
+    ALTER TABLE orders ATTACH PARTITION orders_default DEFAULT;
+  ELSE
+    EXECUTE format('CREATE TABLE public.%I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)', part_name, month_start, month_end);
+  END IF;
+  RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции с текущего месяца на months_ahead месяцев вперёд; возвращает число созданных
+CREATE OR REPLACE FUNCTION create_orders_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+  created INTEGER := 0;
+BEGIN
+  FOR i IN 0..months_ahead LOOP
+    IF create_orders_partition((date_trunc('month', CURRENT_DATE) + make_interval(months => i))::date) THEN
+      created := created + 1;
+    END IF;
+  END LOOP;
+  RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_orders_partition(month::date)
+FROM generate_series(
+  date_trunc('month', (SELECT COALESCE(MIN(created_at), CURRENT_TIMESTAMP) FROM orders_unpartitioned)),
+  date_trunc('month', CURRENT_TIMESTAMP),
+  INTERVAL '1 month'
+) AS month;
+SELECT create_orders_partitions(3);
+
+INSERT INTO orders (id, last_name, first_name, middle_name, phone, city, address, items, total, created_at, status, notes, updated_at)
+SELECT id, last_name, first_name, middle_name, phone, city, address, items, total,
+       COALESCE(created_at, updated_at, CURRENT_TIMESTAMP), status, notes, updated_at
+FROM orders_unpartitioned;
+
+ALTER SEQUENCE orders_id_seq OWNED BY orders.id;
+DROP TABLE orders_unpartitioned;
+
+ANALYZE orders;
@@ -0,0 +1,3 @@
+-- Поиск заказов с товаром: items @> '[{"id": 42}]' идёт по индексу, а не разбором items каждого заказа.
+-- jsonb_path_ops меньше и быстрее стандартного jsonb_ops и поддерживает только @>, которого достаточно
+CREATE INDEX IF NOT EXISTS idx_orders_items_path ON orders USING GIN (items jsonb_path_ops);
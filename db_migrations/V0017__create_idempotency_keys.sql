@@ -0,0 +1,13 @@
+-- Ключи Idempotency-Key для submit-order: повтор запроса с тем же ключом получает сохранённый ответ,
+-- не трогая customers и orders. Ключ занимается в транзакции заказа, поэтому одновременный дубль
+-- ждёт на уникальном индексе, пока первый запрос не завершится. response пуст, пока заказ не записан.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  key VARCHAR(255) PRIMARY KEY,
+  request_hash CHAR(64) NOT NULL,
+  status_code INTEGER,
+  response TEXT,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
@@ -0,0 +1,36 @@
+-- orders-archive отсоединяет старые секции через DETACH PARTITION ... CONCURRENTLY, а PostgreSQL
+-- не разрешает CONCURRENTLY, пока у таблицы есть секция DEFAULT. Строки из orders_default
+-- переносятся в месячные секции, orders_default удаляется. Секции на будущие месяцы по-прежнему
+-- создаёт create_orders_partitions по расписанию orders-archive; если расписание не отработало,
+-- submit-order при ошибке «no partition of relation» создаёт секцию месяца заказа и повторяет вставку.
+SELECT create_orders_partition(month::date)
+FROM (SELECT DISTINCT date_trunc('month', created_at) AS month FROM orders_default) AS months;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM orders_default) THEN
+    RAISE EXCEPTION 'orders_default has rows for months already moved to orders_archive';
+  END IF;
+END;
+$$;
+
+ALTER TABLE orders DETACH PARTITION orders_default;
+DROP TABLE orders_default;
+
+-- Секция orders_pYYYY_MM на месяц month_start, если её ещё нет ни в public, ни в архиве
+CREATE OR REPLACE FUNCTION create_orders_partition(month_start DATE) RETURNS BOOLEAN AS $$
+DECLARE
+  part_name TEXT := 'orders_p' || to_char(month_start, 'YYYY_MM');
+  month_end DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+BEGIN
+  month_start := date_trunc('month', month_start)::date;
+  IF to_regclass('public.' || part_name) IS NOT NULL OR to_regclass('orders_archive.' || part_name) IS NOT NULL THEN
+    RETURN FALSE;
+  END IF;
+
+  EXECUTE format('CREATE TABLE public.%I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)', part_name, month_start, month_end);
+  RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_orders_partitions(3);
@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useRef, useState } from 'react';
 import { Sheet, SheetContent, SheetHeader, SheetTitle } from '@/components/ui/sheet';
 import { Button } from '@/components/ui/button';
 import { Separator } from '@/components/ui/separator';
@@ -20,6 +20,7 @@ export default function Cart({ isOpen, onClose, items, onUpdateQuantity, onRemov
   const total = items.reduce((sum, item) => sum + item.price * item.quantity, 0);
   const { toast } = useToast();
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const checkout = useRef<{ key: string; body: string } | null>(null);
   const [formData, setFormData] = useState({
     lastName: '',
     firstName: '',
@@ -39,24 +40,29 @@ export default function Cart({ isOpen, onClose, items, onUpdateQuantity, onRemov
       return;
     }
 
+    const body = JSON.stringify({
+      customer: formData,
+      // Цены и итог сервер берёт из каталога
+      items: items.map(item => ({
+        id: item.id,
+        quantity: item.quantity,
+      })),
+    });
+    // Повтор той же отправки идёт с тем же ключом: сервер вернёт уже созданный заказ, а не создаст второй
+    if (checkout.current?.body !== body) {
+      checkout.current = { key: crypto.randomUUID(), body };
+    }
+
     setIsSubmitting(true);
     try {
       const response = await fetch('https://functions.poehali.dev/f2f3ed06-47b3-4ab8-8e9e-f5c502b1b06b', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          customer: formData,
-          items: items.map(item => ({
-            id: item.id,
-            name: item.name,
-            price: item.price,
-            quantity: item.quantity,
-          })),
-          total,
-        }),
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': checkout.current.key },
+        body,
       });
 
       if (response.ok) {
+        checkout.current = null;
         toast({
           title: 'Заказ оформлен',
           description: 'Мы свяжемся с вами в ближайшее время',
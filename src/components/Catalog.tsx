@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react';
 import ProductCard from './ProductCard';
 import Filters from './Filters';
 import { Input } from '@/components/ui/input';
+import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
 import { Product, Filters as FiltersType } from '@/types/product';
 
@@ -11,9 +12,15 @@ interface CatalogProps {
   onAddToCart: (product: Product) => void;
 }
 
+const PAGE_SIZE = 24;
+// Карточка показывает описание, размеры и все фото, поэтому компактного вида списка ей мало
+const CARD_FIELDS = 'id,name,price,images,category,material,style,color,manufacturer,description,dimensions';
+
 export default function Catalog({ onAddToCart }: CatalogProps) {
   const [products, setProducts] = useState<Product[]>([]);
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchQuery, setSearchQuery] = useState('');
   const [filters, setFilters] = useState<FiltersType>({
     priceRange: [0, 200000],
@@ -22,30 +29,51 @@ export default function Catalog({ onAddToCart }: CatalogProps) {
     colors: [],
   });
 
+  const buildQuery = (offset: number) => {
+    const params = new URLSearchParams({
+      priceMin: String(filters.priceRange[0]),
+      priceMax: String(filters.priceRange[1]),
+      limit: String(PAGE_SIZE),
+      offset: String(offset),
+      fields: CARD_FIELDS,
+    });
+    if (searchQuery) params.set('q', searchQuery);
+    if (filters.categories.length > 0) params.set('category', filters.categories.join(','));
+    if (filters.materials.length > 0) params.set('material', filters.materials.join(','));
+    if (filters.colors.length > 0) params.set('color', filters.colors.join(','));
+    return `${API_URL}?${params.toString()}`;
+  };
+
   useEffect(() => {
-    const loadProducts = async () => {
+    const timeout = setTimeout(async () => {
+      setLoading(true);
       try {
-        const response = await fetch(API_URL);
+        const response = await fetch(buildQuery(0));
         const data = await response.json();
-        setProducts(data);
+        setProducts(data.products);
+        setTotal(data.total);
       } catch (error) {
         console.error('Ошибка загрузки товаров:', error);
       } finally {
         setLoading(false);
       }
-    };
-    loadProducts();
-  }, []);
+    }, 300);
+    return () => clearTimeout(timeout);
+  }, [searchQuery, filters]);
 
-  const filteredProducts = products.filter((product) => {
-    const searchMatch = searchQuery === '' || product.name.toLowerCase().includes(searchQuery.toLowerCase());
-    const priceMatch = product.price >= filters.priceRange[0] && product.price <= filters.priceRange[1];
-    const categoryMatch = filters.categories.length === 0 || filters.categories.includes(product.category);
-    const materialMatch = filters.materials.length === 0 || filters.materials.includes(product.material);
-    const colorMatch = filters.colors.length === 0 || filters.colors.includes(product.color);
-
-    return searchMatch && priceMatch && categoryMatch && materialMatch && colorMatch;
-  });
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await fetch(buildQuery(products.length));
+      const data = await response.json();
+      setProducts([...products, ...data.products]);
+      setTotal(data.total);
+    } catch (error) {
+      console.error('Ошибка загрузки товаров:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   return (
     <section id="catalog" className="py-16">
@@ -74,15 +102,24 @@ export default function Catalog({ onAddToCart }: CatalogProps) {
               <div className="text-center py-16">
                 <p className="text-xl text-muted-foreground">Загрузка товаров...</p>
               </div>
-            ) : filteredProducts.length > 0 ? (
-              <div className="grid grid-cols-1 md:grid-cols-2 xl:grid-cols-3 gap-6">
-                {filteredProducts.map((product) => (
-                  <ProductCard
-                    key={product.id}
-                    product={product}
-                    onAddToCart={onAddToCart}
-                  />
-                ))}
+            ) : products.length > 0 ? (
+              <div className="space-y-8">
+                <div className="grid grid-cols-1 md:grid-cols-2 xl:grid-cols-3 gap-6">
+                  {products.map((product) => (
+                    <ProductCard
+                      key={product.id}
+                      product={product}
+                      onAddToCart={onAddToCart}
+                    />
+                  ))}
+                </div>
+                {products.length < total && (
+                  <div className="text-center">
+                    <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+                      {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+                    </Button>
+                  </div>
+                )}
               </div>
             ) : (
               <div className="text-center py-16">
@@ -11,6 +11,7 @@ import {
 import { Card, CardContent } from '@/components/ui/card';
 import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
+import { readAfterWriteHeaders } from '@/lib/readAfterWrite';
 
 const API_URL = 'https://functions.poehali.dev/57f804f2-8be4-4503-879a-db04a47a23ee';
 
@@ -37,7 +38,7 @@ export default function CustomersManager() {
   useEffect(() => {
     const loadCustomers = async () => {
       try {
-        const response = await fetch(API_URL);
+        const response = await fetch(API_URL, { headers: readAfterWriteHeaders() });
         const data = await response.json();
         setCustomers(data);
       } catch (error) {
@@ -25,6 +25,7 @@ import {
 import Icon from '@/components/ui/icon';
 import { Textarea } from '@/components/ui/textarea';
 import { useToast } from '@/hooks/use-toast';
+import { readAfterWriteHeaders, rememberWrite } from '@/lib/readAfterWrite';
 
 const API_URL = 'https://functions.poehali.dev/eadf3b13-4a58-4dfe-8483-18438ce40377';
 const UPDATE_STATUS_URL = 'https://functions.poehali.dev/b1d96e8c-2de9-4ac3-8e5f-7bcd6ca114ed';
@@ -84,7 +85,7 @@ export default function OrdersManager() {
   useEffect(() => {
     const loadOrders = async () => {
       try {
-        const response = await fetch(API_URL);
+        const response = await fetch(API_URL, { headers: readAfterWriteHeaders() });
         const data = await response.json();
         setOrders(data);
       } catch (error) {
@@ -110,11 +111,11 @@ export default function OrdersManager() {
 
   const handleStatusChange = async (orderId: number, newStatus: OrderStatus) => {
     try {
-      const response = await fetch(UPDATE_STATUS_URL, {
+      const response = rememberWrite(await fetch(UPDATE_STATUS_URL, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ orderId, status: newStatus }),
-      });
+      }));
 
       if (response.ok) {
         setOrders(orders.map((o) => (o.id === orderId ? { ...o, status: newStatus } : o)));
@@ -151,11 +152,11 @@ export default function OrdersManager() {
     
     setIsSavingNotes(true);
     try {
-      const response = await fetch(UPDATE_STATUS_URL, {
+      const response = rememberWrite(await fetch(UPDATE_STATUS_URL, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ orderId: selectedOrder.id, notes }),
-      });
+      }));
 
       if (response.ok) {
         setOrders(orders.map((o) => 
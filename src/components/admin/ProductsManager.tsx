@@ -29,6 +29,7 @@ import Icon from '@/components/ui/icon';
 import { Product } from '@/types/product';
 import { materials, styles, colors } from '@/data/products';
 import { useToast } from '@/hooks/use-toast';
+import { readAfterWriteHeaders, rememberWrite } from '@/lib/readAfterWrite';
 
 const API_URL = 'https://functions.poehali.dev/02e5b34b-f4fa-4f7e-b01f-a36dd4e2c6af';
 
@@ -54,7 +55,7 @@ export default function ProductsManager() {
 
   const loadProducts = async () => {
     try {
-      const response = await fetch(API_URL);
+      const response = await fetch(API_URL, { cache: 'no-cache', headers: readAfterWriteHeaders() });
       const data = await response.json();
       setProducts(data);
     } catch (error) {
@@ -98,19 +99,19 @@ export default function ProductsManager() {
     try {
       if (editingProduct) {
         // Обновление
-        await fetch(API_URL, {
+        rememberWrite(await fetch(API_URL, {
           method: 'PUT',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ ...formData, id: editingProduct.id }),
-        });
+        }));
         toast({ title: 'Успешно', description: 'Товар обновлён' });
       } else {
         // Создание
-        await fetch(API_URL, {
+        rememberWrite(await fetch(API_URL, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify(formData),
-        });
+        }));
         toast({ title: 'Успешно', description: 'Товар добавлен' });
       }
       setIsDialogOpen(false);
@@ -126,7 +127,7 @@ export default function ProductsManager() {
 
   const handleDelete = async (id: number) => {
     try {
-      await fetch(`${API_URL}?id=${id}`, { method: 'DELETE' });
+      rememberWrite(await fetch(`${API_URL}?id=${id}`, { method: 'DELETE' }));
       toast({ title: 'Удалено', description: 'Товар удалён', variant: 'destructive' });
       loadProducts();
     } catch (error) {
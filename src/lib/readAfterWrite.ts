@@ -0,0 +1,15 @@
+const STORAGE_KEY = 'admin-min-lsn';
+
+// Запоминает позицию WAL из ответа на запись, чтобы следующие чтения админки не ушли на отстающую реплику
+export function rememberWrite(response: Response) {
+  const lsn = response.headers.get('X-Write-Lsn');
+  if (lsn) {
+    sessionStorage.setItem(STORAGE_KEY, lsn);
+  }
+  return response;
+}
+
+export function readAfterWriteHeaders(): Record<string, string> {
+  const lsn = sessionStorage.getItem(STORAGE_KEY);
+  return lsn ? { 'X-Min-Lsn': lsn } : {};
+}